@@ -1,12 +1,49 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort
-import json, os, uuid, re
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort, send_from_directory, g, has_app_context, has_request_context, stream_with_context
+from flask import before_render_template, template_rendered
+import json, os, uuid, re, threading, atexit
+import urllib.request
+from urllib.parse import quote, urlsplit
+import mimetypes
 from werkzeug.utils import secure_filename
-from datetime import datetime
-import markdown
+from werkzeug.middleware.proxy_fix import ProxyFix
+from datetime import datetime, timezone
 from markupsafe import Markup, escape
+from content_index import ContentIndex
+from storage import make_storage, SqliteStorage, ConflictError, entity_version, file_lock
+from render_cache import PageCache, LRUCache, render_markdown, markdown_stats
+from images import ImagePipeline, srcset_map, srcset_attr, web_path
+from export import SiteExporter
+from jobs import JobQueue
+from assets import AssetBuilder
+from uploads import UploadStore, UploadError, OffsetMismatch, file_extension
+from media import MediaIndex, MediaCollector, upload_refs
+from history import RevisionLog
+from snapshot import SnapshotStore
+from feeds import SiteFeeds
+from compression import ResponseCompressor
+from auth import EditorAuth, index_editors, migrate_editors, hash_password, normalize_email
+from leads import LeadJournal, LeadError, KINDS as LEAD_KINDS
+import metrics
+from search import SearchIndex
+from page_patch import apply_patch, PatchError
+from public_api import parse_query, select, order_key, QueryError, project as select_fields
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import hmac
+import click
 
 app = Flask(__name__)
 app.secret_key = "supersecret"
+# FLASK_STORAGE_BACKEND=sqlite etc. override the defaults below
+app.config.from_prefixed_env()
+
+# Behind nginx etc. set PROXY_HOPS to the number of proxies in front of the
+# app, so request.remote_addr (login throttling) is the client's address
+# from X-Forwarded-For rather than the proxy's. Left at 0 the headers are
+# ignored, since clients could forge them.
+app.config.setdefault('PROXY_HOPS', 0)
+if app.config['PROXY_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_HOPS'], x_proto=app.config['PROXY_HOPS'])
 
 # Upload config
 UPLOAD_FOLDER = os.path.join('static', 'uploads')
@@ -16,10 +53,268 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Media library uploads: stored once per content hash as <sha256>.<ext>.
+# Large files go through the chunked /settings/uploads protocol, so only
+# one chunk at a time has to fit under MAX_CONTENT_LENGTH.
+MEDIA_EXT = ALLOWED_EXT | {'mp4', 'webm', 'mov', 'pdf'}
+app.config.setdefault('MEDIA_MAX_BYTES', 2 * 1024 * 1024 * 1024)
+app.config.setdefault('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+upload_store = UploadStore(UPLOAD_FOLDER, os.path.join(app.instance_path, 'uploads-tmp'), MEDIA_EXT,
+                           app.config['MEDIA_MAX_BYTES'])
+
+# Media GC: uploads no entry references are deleted once older than the
+# grace period, at most MEDIA_GC_LIMIT per sweep in batches of MEDIA_GC_BATCH
+app.config.setdefault('MEDIA_GC_GRACE', 24 * 3600)
+app.config.setdefault('MEDIA_GC_INTERVAL', 6 * 3600)   # 0 disables the periodic sweep
+app.config.setdefault('MEDIA_GC_BATCH', 50)
+app.config.setdefault('MEDIA_GC_PAUSE', 1.0)
+app.config.setdefault('MEDIA_GC_LIMIT', 1000)
+# files an edit stops using are deleted once they are at least this old
+app.config.setdefault('MEDIA_RELEASE_GRACE', 3600)
+
 DATA_POSTS = os.path.join('static', 'data', 'posts.json')
 DATA_VERIFIER = os.path.join('static', 'data', 'verifier.json')
 DATA_PAGES = os.path.join('static', 'data', 'project_pages.json')
 
+# Editor logins (see auth.py): verifier.json indexed by email, scrypt hashes
+# checked on AUTH_WORKERS threads, attempts throttled per client address and
+# per (account, client address)
+app.config.setdefault('AUTH_WORKERS', 2)
+app.config.setdefault('AUTH_MAX_PENDING', 8)      # checks queued beyond this are turned away
+app.config.setdefault('LOGIN_IP_BURST', 10)
+app.config.setdefault('LOGIN_IP_PER_MINUTE', 10)
+app.config.setdefault('LOGIN_ACCOUNT_BURST', 5)
+app.config.setdefault('LOGIN_ACCOUNT_PER_MINUTE', 5)
+editor_auth = EditorAuth(lambda: content.derived('editors', [DATA_VERIFIER], index_editors),
+                         workers=app.config['AUTH_WORKERS'], max_pending=app.config['AUTH_MAX_PENDING'],
+                         ip_burst=app.config['LOGIN_IP_BURST'], ip_per_minute=app.config['LOGIN_IP_PER_MINUTE'],
+                         account_burst=app.config['LOGIN_ACCOUNT_BURST'],
+                         account_per_minute=app.config['LOGIN_ACCOUNT_PER_MINUTE'])
+
+# Responsive image derivatives (resized webp/jpeg + blur placeholder)
+DERIVED_FOLDER = os.path.join('static', 'derived')
+IMAGE_MANIFEST = os.path.join(DERIVED_FOLDER, 'manifest.json')
+image_pipeline = ImagePipeline(os.curdir, DERIVED_FOLDER, IMAGE_MANIFEST,
+                               lock_path=os.path.join(app.instance_path, 'images.lock'))
+
+# Static export of the public pages (flask --app app export); needs SITE_URL
+app.config.setdefault('EXPORT_DIR', 'dist')
+app.config.setdefault('EXPORT_ON_SAVE', False)
+
+# sitemap.xml / feed.xml / feed.atom (see feeds.py), rebuilt after saves.
+# They need SITE_URL (https://example.com) for their absolute links, as do the
+# home page's og: tags; without it they are not served. The Host header is
+# never used: anyone can send any value.
+app.config.setdefault('SITE_URL', None)
+app.config.setdefault('SITEMAP_MAX_URLS', 50000)
+app.config.setdefault('FEED_ITEMS', 50)
+app.config.setdefault('FEED_MAX_AGE', 300)
+site_feeds = SiteFeeds(os.path.join(app.instance_path, 'feeds'), max_urls=app.config['SITEMAP_MAX_URLS'],
+                       feed_items=app.config['FEED_ITEMS'], title='Paradise Light Homes LTD',
+                       description='Projects and news from Paradise Light Homes LTD')
+
+# Content storage: 'json' (posts.json / project_pages.json) or 'sqlite'
+# (one row per entry, WAL mode). Either way `content` serves the parsed,
+# read-only documents, re-read only when they change.
+app.config.setdefault('STORAGE_BACKEND', 'json')
+app.config.setdefault('SQLITE_PATH', os.path.join(app.instance_path, 'content.db'))
+storage = make_storage(app.config['STORAGE_BACKEND'], DATA_POSTS, DATA_PAGES,
+                       app.config['SQLITE_PATH'], state_dir=app.instance_path)
+content = storage.content
+
+# Shared content snapshot (see snapshot.py): rebuilt after saves, mapped by
+# every worker to answer the public lookups without parsing the documents.
+app.config.setdefault('CONTENT_SNAPSHOT', True)
+app.config.setdefault('CONTENT_SNAPSHOT_PATH', os.path.join(app.instance_path, 'content.snap'))
+snapshots = SnapshotStore(app.config['CONTENT_SNAPSHOT_PATH'])
+
+# Revision history of every project/blog post/page: compressed diffs with a
+# snapshot every HISTORY_SNAPSHOT_EVERY revisions (see history.py). The
+# newest HISTORY_KEEP revisions of an entry are always kept; older ones go
+# once they are HISTORY_KEEP_DAYS old.
+app.config.setdefault('HISTORY_PATH', os.path.join(app.instance_path, 'history.db'))
+app.config.setdefault('HISTORY_SNAPSHOT_EVERY', 20)
+app.config.setdefault('HISTORY_KEEP', 50)
+app.config.setdefault('HISTORY_KEEP_DAYS', 90)
+app.config.setdefault('HISTORY_COMPACT_INTERVAL', 24 * 3600)   # 0 disables periodic compaction
+os.makedirs(os.path.dirname(app.config['HISTORY_PATH']) or '.', exist_ok=True)
+history = RevisionLog(app.config['HISTORY_PATH'], snapshot_every=app.config['HISTORY_SNAPSHOT_EVERY'],
+                      keep=app.config['HISTORY_KEEP'], keep_days=app.config['HISTORY_KEEP_DAYS'])
+
+# rendered /projects/<slug>.html output, LRU under a byte budget
+app.config.setdefault('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+PROJECT_TEMPLATE = os.path.join(app.root_path, 'templates', 'project_page.html')
+HOME_TEMPLATE = os.path.join(app.root_path, 'templates', 'index.html')
+MACROS_TEMPLATE = os.path.join(app.root_path, 'templates', '_macros.html')
+
+def template_version(path):
+    # a page's markup depends on its template, the shared macros, image derivatives
+    # and the fingerprinted asset names
+    return (os.path.getmtime(path), os.path.getmtime(MACROS_TEMPLATE), content.signature(IMAGE_MANIFEST),
+            content.signature(ASSET_MANIFEST))
+page_cache = PageCache(app.config['PAGE_CACHE_MAX_BYTES'])
+
+# serialized /api/* responses, per content version and query
+app.config.setdefault('API_CACHE_MAX_BYTES', 8 * 1024 * 1024)
+api_cache = LRUCache(max_bytes=app.config['API_CACHE_MAX_BYTES'])
+
+# brotli/gzip for HTML, JSON and text responses, one compression per content
+# version (see compression.py); fingerprinted assets are precompressed instead
+app.config.setdefault('COMPRESS_RESPONSES', True)
+app.config.setdefault('COMPRESS_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+app.config.setdefault('COMPRESS_LEVEL', 6)
+app.config.setdefault('COMPRESS_BROTLI_QUALITY', 5)
+compressor = ResponseCompressor(app.config['COMPRESS_CACHE_MAX_BYTES'], min_size=app.config['COMPRESS_MIN_SIZE'],
+                                level=app.config['COMPRESS_LEVEL'],
+                                brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'])
+
+# slow side effects (file cleanup, derivatives, leads) run on a journalled queue
+app.config.setdefault('JOB_WORKERS', 2)
+app.config.setdefault('LEADS_FILE', os.path.join(app.instance_path, 'leads.jsonl'))
+app.config.setdefault('LEADS_FLUSH_INTERVAL', 0.05)   # seconds a batch of leads gathers before its fsync
+app.config.setdefault('LEAD_WEBHOOK_URL', None)
+job_queue = JobQueue(os.path.join(app.instance_path, 'jobs'), max_workers=app.config['JOB_WORKERS'])
+
+# Fingerprinted css/js (flask --app app assets build). app.css is the Tailwind
+# subset the templates use, generated offline; the rest are copied as-is.
+app.config.setdefault('ASSET_AUTO_BUILD', True)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+asset_builder = AssetBuilder('static', {
+    'styles.css': 'styles.css',
+    'ppstyle.css': 'ppstyle.css',
+    'data/script.js': 'data/script.js',
+    'data/jsonhandler.js': 'data/jsonhandler.js',
+    'vendor/aos-lite.css': 'vendor/aos-lite.css',
+    'vendor/aos-lite.js': 'vendor/aos-lite.js',
+}, scan_globs=[os.path.join(app.root_path, 'templates', '*.html'), os.path.join('static', 'data', '*.js')])
+asset_builder.bundles['app.css'] = asset_builder.tailwind_css
+ASSET_MANIFEST = asset_builder.manifest_path
+
+def build_assets(force=False):
+    # one worker builds, the others wait and then find it up to date
+    with file_lock(os.path.join(app.instance_path, 'assets.lock')):
+        if force or asset_builder.is_stale():
+            return asset_builder.build()
+
+if app.config['ASSET_AUTO_BUILD']:
+    build_assets()
+
+# Instrumentation (metrics.py), served on /metrics: per-route latency,
+# per-request phase timers and file I/O, upload sizes, in-flight requests.
+# PROFILE_SLOW_REQUESTS > 0 cProfiles requests and keeps the ones slower
+# than that many seconds in PROFILE_DIR.
+app.config.setdefault('METRICS_TOKEN', None)   # bearer token for scrapers
+# let requests from 127.0.0.1/::1 scrape without the token; only safe when no
+# proxy on the same host forwards public traffic to the app
+app.config.setdefault('METRICS_ALLOW_LOCAL', False)
+app.config.setdefault('PROFILE_SLOW_REQUESTS', 0)
+app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+app.config.setdefault('PROFILE_KEEP', 50)
+profiler = metrics.SlowRequestProfiler(app.config['PROFILE_DIR'], app.config['PROFILE_SLOW_REQUESTS'],
+                                       keep=app.config['PROFILE_KEEP'])
+
+REQUEST_SECONDS = metrics.REGISTRY.histogram('plh_request_duration_seconds', 'Request latency by route.',
+                                             ['route', 'method'])
+REQUESTS = metrics.REGISTRY.counter('plh_requests_total', 'Requests by route and status.', ['route', 'method', 'status'])
+REQUEST_PHASE_SECONDS = metrics.REGISTRY.histogram('plh_request_phase_seconds',
+                                                   'Time a request spent in each phase.', ['route', 'phase'])
+REQUEST_IO_BYTES = metrics.REGISTRY.histogram('plh_request_io_bytes', 'File bytes read/written per request.',
+                                              ['route', 'direction'], buckets=metrics.BYTES_BUCKETS)
+REQUESTS_IN_FLIGHT = metrics.REGISTRY.gauge('plh_requests_in_flight', 'Requests being served.')
+LOGINS = metrics.REGISTRY.counter('plh_logins_total', 'Editor login attempts by result.', ['result'])
+UPLOAD_BYTES = metrics.REGISTRY.histogram('plh_upload_bytes', 'Size of stored uploads.', buckets=metrics.BYTES_BUCKETS)
+
+def route_label():
+    # the rule, not the path, so /projects/<slug>.html is one series
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.request_stats = metrics.begin_request()
+    g.profile = profiler.start()
+    REQUESTS_IN_FLIGHT.inc()
+
+@app.after_request
+def record_status(resp):
+    g.status = resp.status_code
+    return resp
+
+@app.after_request
+def compress_response(resp):
+    if app.config['COMPRESS_RESPONSES']:
+        resp = compressor.compress(request, resp)
+    return resp
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    # a streamed response tears down after its body is sent, possibly after
+    # this thread's per-request stats moved on, so use the ones kept on g
+    metrics.end_request()
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return
+    REQUESTS_IN_FLIGHT.dec()
+    seconds = stats.elapsed()
+    route, method = route_label(), request.method
+    REQUEST_SECONDS.observe(seconds, (route, method))
+    REQUESTS.inc(1, (route, method, 500 if exc is not None else g.get('status', 500)))
+    for name, spent in stats.phases.items():
+        REQUEST_PHASE_SECONDS.observe(spent, (route, name))
+    for direction, n in stats.bytes.items():
+        REQUEST_IO_BYTES.observe(n, (route, direction))
+    if g.get('profile') is not None:
+        path = profiler.stop(g.profile, seconds, '%s %s' % (method, route))
+        if path:
+            app.logger.info('slow request %s %s (%.0f ms), profile: %s', method, request.full_path, seconds * 1000, path)
+
+def template_started(sender, template, context, **extra):
+    metrics.start_phase('template')
+
+def template_finished(sender, template, context, **extra):
+    metrics.stop_phase('template')
+
+before_render_template.connect(template_started, app)
+template_rendered.connect(template_finished, app)
+
+@app.before_request
+def rebuild_assets_in_debug():
+    # templates change while developing; production builds once at startup
+    if app.debug and app.config['ASSET_AUTO_BUILD'] and asset_builder.is_stale():
+        build_assets()
+
+@app.url_defaults
+def fingerprinted_static(endpoint, values):
+    # url_for('static', filename='styles.css') -> /static/dist/styles.<hash>.css
+    if endpoint == 'static' and 'filename' in values:
+        hashed = content.get(ASSET_MANIFEST).get(values['filename'])
+        if hashed:
+            values['filename'] = hashed
+
+def static_files(filename):
+    # editor credentials (and their temp file while rewritten) live next to the public data files
+    if os.path.normpath(os.path.join(app.static_folder, filename)).startswith(os.path.join(app.root_path, DATA_VERIFIER)):
+        abort(404)
+    if not filename.startswith(asset_builder.out + '/'):
+        return app.send_static_file(filename)
+    # fingerprinted: serve the precompressed copy and let clients keep it forever
+    for encoding, ext in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + ext)):
+            resp = send_from_directory(app.static_folder, filename + ext,
+                                       mimetype=mimetypes.guess_type(filename)[0])
+            resp.headers['Content-Encoding'] = encoding
+            break
+    else:
+        resp = app.send_static_file(filename)
+    resp.vary.add('Accept-Encoding')
+    resp.cache_control.no_cache = None
+    resp.cache_control.public = True
+    resp.cache_control.max_age = IMMUTABLE_MAX_AGE
+    resp.cache_control.immutable = True
+    return resp
+
+app.view_functions['static'] = static_files
+
 # --------------------
 # Helpers
 # --------------------
@@ -34,24 +329,70 @@ def save_uploaded_file(file):
         return None
     if not allowed_file(filename):
         return None
-    filename = secure_filename(filename)
-    unique = f"{uuid.uuid4().hex}_{filename}"
-    path = os.path.join(app.config['UPLOAD_FOLDER'], unique)
-    file.save(path)
+    name, _, deduplicated = upload_store.store_stream(secure_filename(filename), file.stream)
+    return stored_upload(name, deduplicated)
+
+def stored_upload(name, deduplicated=False):
+    web = os.path.join('static', 'uploads', name).replace('\\', '/')
+    UPLOAD_BYTES.observe(os.path.getsize(os.path.join(UPLOAD_FOLDER, name)))
+    # derivatives are built in the background; the upload returns now.
+    # A deduplicated file already has them.
+    if image_pipeline.enabled and not deduplicated and file_extension(name) in ALLOWED_EXT:
+        job_queue.enqueue('image_derivatives', src=web)
     # return web path
-    return os.path.join('static', 'uploads', unique).replace('\\', '/')
+    return web
 
 def load_json(path):
     if not os.path.exists(path):
         return {}
-    with open(path, 'r', encoding='utf-8') as f:
+    with metrics.phase('content_load'), open(path, 'r', encoding='utf-8') as f:
+        metrics.count_io('read', os.fstat(f.fileno()).st_size, 'content_load')
         return json.load(f)
 
-def write_json(path, data):
-    tmp = path + '.tmp'
-    with open(tmp, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
-    os.replace(tmp, path)
+# Read-only views of the content. Changes go through storage.insert/update/...
+def get_posts():
+    return content.get(DATA_POSTS)
+
+def get_pages():
+    return content.get(DATA_PAGES)
+
+def content_snapshot():
+    # the shared snapshot when it matches the stored content, else None
+    if not app.config['CONTENT_SNAPSHOT']:
+        return None
+    return snapshots.current(content.source_signature)
+
+def content_signature(path):
+    # content.signature(path), without loading the document when the snapshot is current
+    snap = content_snapshot()
+    if snap is not None and path in snap.sources:
+        return snap.sources[path]
+    return content.signature(path)
+
+def published_projects():
+    # pre-filtered views, rebuilt once per content version
+    snap = content_snapshot()
+    if snap is not None:
+        return snap.published('projects')
+    return content.derived('published_projects', [DATA_POSTS],
+                           lambda posts: tuple(p for p in posts.get('projects', []) if p.get('published')))
+
+def published_blog():
+    snap = content_snapshot()
+    if snap is not None:
+        return snap.published('blog')
+    return content.derived('published_blog', [DATA_POSTS],
+                           lambda posts: tuple(b for b in posts.get('blog', []) if b.get('published')))
+
+def get_index():
+    # refresh both files; the index is updated by the store as they change
+    content.get(DATA_POSTS)
+    content.get(DATA_PAGES)
+    return lookups
+
+def read_index():
+    # lookups for the public pages: the snapshot if current, else the live index
+    return content_snapshot() or get_index()
 
 def slugify(value):
     if not value:
@@ -65,75 +406,524 @@ def slugify(value):
     s = s.strip('-')
     return s or uuid.uuid4().hex[:8]
 
-def ensure_project_slugs_and_save():
-    posts = load_json(DATA_POSTS)
-    changed = False
-    projects = posts.get('projects', [])
-    for p in projects:
-        if not p.get('slug'):
-            # try to derive from link then header/title
-            link = p.get('link','')
-            candidate = slugify(link) if link else ''
-            if not candidate:
-                candidate = slugify(p.get('title') or p.get('header') or '')
-            p['slug'] = candidate
-            changed = True
-    if changed:
-        posts['projects'] = projects
-        write_json(DATA_POSTS, posts)
+def attach_srcset(src, info):
+    # record a finished derivative set on every entry that uses the image
+    srcset = srcset_map(info)
+
+    def update_cover(item):
+        if web_path(item.get('cover')) == src and item.get('cover_srcset') != srcset:
+            item['cover_srcset'] = srcset
+            return True
+        return False
+
+    def update_sections(entry):
+        changed = False
+        for sec in entry.get('sections', []):
+            if web_path(sec.get('cover')) == src and sec.get('cover_srcset') != srcset:
+                sec['cover_srcset'] = srcset
+                changed = True
+            imgs = sec.get('images') or []
+            for i, im in enumerate(imgs):
+                im_src = im.get('src') if isinstance(im, dict) else im
+                if web_path(im_src) != src:
+                    continue
+                if not isinstance(im, dict):
+                    im = imgs[i] = {'src': im_src, 'caption': ''}
+                if im.get('srcset') != srcset:
+                    im['srcset'] = srcset
+                    changed = True
+        return changed
+
+    with storage.batch() as b:
+        b.update_all('projects', update_cover)
+        b.update_all('blog', update_cover)
+        b.update_all('project_pages', update_sections)
+
+@app.template_global()
+def image_variants(src):
+    # derivative info for a stored image path, or None if not (yet) built
+    info = content.get(IMAGE_MANIFEST).get(web_path(src))
+    if not info:
+        return None
+    return {
+        'width': info['width'],
+        'height': info['height'],
+        'placeholder': info['placeholder'],
+        'webp_srcset': srcset_attr(info['webp']),
+        'fallback_srcset': srcset_attr(info['fallback']),
+        'fallback_type': info['fallback_type'],
+    }
+
+# slug/id lookups, kept in step with the content store
+lookups = ContentIndex(DATA_POSTS, DATA_PAGES, slugify)
+content.subscribe(lookups.on_content_change)
+
+# upload path -> entries referencing it, for the media GC
+media_index = MediaIndex(DATA_POSTS, DATA_PAGES)
+content.subscribe(media_index.on_content_change)
+# full-text search over projects (with their pages) and blog posts
+search_index = SearchIndex(DATA_POSTS, DATA_PAGES)
+content.subscribe(search_index.on_content_change)
+
+media_gc = MediaCollector(media_index, content, UPLOAD_FOLDER, DERIVED_FOLDER,
+                          grace=app.config['MEDIA_GC_GRACE'], batch_size=app.config['MEDIA_GC_BATCH'],
+                          pause=app.config['MEDIA_GC_PAUSE'], limit=app.config['MEDIA_GC_LIMIT'],
+                          retained=history.referenced_uploads, release_grace=app.config['MEDIA_RELEASE_GRACE'],
+                          lock=storage.batch)
+
+def position_hint(kind, key):
+    # where the index last saw an entry; JSON writes use it to skip the scan
+    positions = {'projects': lookups.project_pos, 'blog': lookups.blog_pos, 'project_pages': lookups.page_pos}
+    return positions[kind].get(key)
+
+storage.position_hint = position_hint
+storage.on_write(lambda kind: schedule_export())
+
+_snapshot_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot')
+_snapshot_pending = threading.Event()
+
+def rebuild_snapshot():
+    def read():
+        # signatures first: if a save lands in between, the snapshot claims the
+        # older version and is rebuilt, rather than passing old data off as new
+        sources = {path: content.signature(path) for path in (DATA_POSTS, DATA_PAGES)}
+        return content.get(DATA_POSTS), content.get(DATA_PAGES), sources
+    return snapshots.rebuild(content.source_signature, read, slugify)
+
+def _snapshot_job():
+    _snapshot_pending.clear()
+    try:
+        rebuild_snapshot()
+    except Exception:
+        app.logger.exception('content snapshot rebuild failed')
+
+def schedule_snapshot():
+    # after saves and at startup; a burst of writes collapses into one rebuild
+    if not app.config['CONTENT_SNAPSHOT'] or _snapshot_pending.is_set():
+        return
+    _snapshot_pending.set()
+    _snapshot_pool.submit(_snapshot_job)
+
+storage.on_write(lambda kind: schedule_snapshot())
+
+@app.template_global()
+def site_url():
+    # scheme://host of the public site, without a trailing slash; '' if not configured
+    return (app.config.get('SITE_URL') or '').rstrip('/')
+
+def feed_sources():
+    return [list(sig) if isinstance(sig, tuple) else sig
+            for sig in (content_signature(DATA_POSTS), content_signature(DATA_PAGES))]
+
+def feed_entries():
+    # (sitemap-only pages, entries in sitemap and feeds); one entry per URL, newest wins
+    idx = get_index()
+    by_loc = {}
+    for p in published_projects():
+        slug = p.get('slug')
+        owner = idx.project_by_slug(slug) if slug else None
+        if not owner or owner.get('id') != p.get('id'):
+            slug = slugify(p.get('link')) if p.get('link') else ''
+        if not slug:
+            continue
+        page = idx.page_for_project(p.get('id'))
+        by_loc.setdefault('/projects/%s.html' % slug, []).append({
+            'loc': '/projects/%s.html' % slug, 'lastmod': project_last_modified(p, page),
+            'title': (page or {}).get('title') or p.get('title') or '', 'guid': p.get('id') or slug,
+            'summary': (page or {}).get('excerpt') or p.get('excerpt') or ''})
+    for b in published_blog():
+        link = b.get('link') or ''
+        if not link.startswith('/') or link.startswith('//'):
+            continue    # posts hosted elsewhere
+        by_loc.setdefault(link, []).append({
+            'loc': link, 'lastmod': parse_timestamp(b.get('updated_at') or b.get('created_at')),
+            'title': b.get('title') or b.get('header') or '', 'guid': b.get('id') or link,
+            'summary': b.get('excerpt') or ''})
+    oldest = datetime.min.replace(tzinfo=timezone.utc)
+    entries = [max(group, key=lambda e: e['lastmod'] or oldest) for _, group in sorted(by_loc.items())]
+    newest = max((e['lastmod'] for e in entries if e['lastmod']), default=None)
+    home = {'loc': '/', 'lastmod': newest, 'title': site_feeds.title, 'guid': 'home', 'summary': ''}
+    return [home], entries
+
+def build_feeds():
+    if not site_url():
+        return None
+    return site_feeds.build(site_url(), feed_sources(), feed_entries)
+
+_feeds_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='feeds')
+_feeds_pending = threading.Event()
+
+def _feeds_job():
+    _feeds_pending.clear()
+    try:
+        build_feeds()
+    except Exception:
+        app.logger.exception('rebuilding sitemap/feeds failed')
+
+def schedule_feeds():
+    # after saves and at startup; a burst of writes collapses into one rebuild
+    if _feeds_pending.is_set():
+        return
+    _feeds_pending.set()
+    _feeds_pool.submit(_feeds_job)
+
+storage.on_write(lambda kind: schedule_feeds())
+
+def record_history(changes):
+    # the editor who saved, if any; restores note which revision they restored
+    user = session.get('user') if has_request_context() else None
+    note = g.get('history_note') if has_app_context() else None
+    try:
+        with metrics.phase('history'):
+            history.record(changes, user=user, note=note)
+    except Exception:
+        app.logger.exception('recording revision history failed')
+
+storage.on_commit(record_history)
+
+def project_slug(p):
+    # derive from link, then header/title
+    link = p.get('link', '')
+    candidate = slugify(link) if link else ''
+    return candidate or slugify(p.get('title') or p.get('header') or '')
 
 def get_project_by_slug(slug):
-    posts = load_json(DATA_POSTS)
-    for p in posts.get('projects', []):
-        if p.get('slug') == slug:
-            return p
-        # fallback: if their link endswith slug.html
-        link = p.get('link','')
-        if link and slugify(link) == slug:
-            return p
-    return None
+    # exact slug first, then projects whose link slugifies to it
+    return read_index().project_by_slug(slug)
 
 def get_page_by_project_id(project_id):
-    pages = load_json(DATA_PAGES)
-    for entry in pages.get('project_pages', []):
-        if entry.get('project_id') == project_id:
-            return entry
-    return None
-
-def save_or_update_page(entry):
-    pages = load_json(DATA_PAGES)
-    arr = pages.get('project_pages', [])
-    for i, e in enumerate(arr):
-        if e.get('project_id') == entry.get('project_id'):
-            arr[i] = entry
-            pages['project_pages'] = arr
-            write_json(DATA_PAGES, pages)
-            return
-    arr.append(entry)
-    pages['project_pages'] = arr
-    write_json(DATA_PAGES, pages)
+    return read_index().page_for_project(project_id)
+
+# Entry versions double as ETags: editors send back the version they loaded
+# (If-Match: "v3" or a hidden form field) and get a 409 if it moved on.
+# Compressed responses carry the tag as W/"v3", which clients send back as is.
+def version_etag(item):
+    return 'v%d' % entity_version(item)
+
+def expected_version(fallback=None):
+    if request.if_match:
+        for tag in request.if_match.as_set(include_weak=True):
+            if tag.startswith('v') and tag[1:].isdigit():
+                return int(tag[1:])
+        return None  # If-Match: *
+    if fallback in (None, ''):
+        return None
+    try:
+        return int(fallback)
+    except (TypeError, ValueError):
+        return None
+
+def version_conflict(e):
+    # API clients get a 409; the editor's plain forms get a flash message
+    if request.is_json or request.headers.get('If-Match'):
+        return jsonify({'ok': False, 'error': str(e), 'version': e.current}), 409
+    flash(str(e), 'danger')
+    return redirect(url_for('settings'))
 
 # --------------------
 # Basic site routes
 # --------------------
+BLOG_PAGE_SIZE = 6
+BLOG_CARD_FIELDS = ('id', 'title', 'header', 'excerpt', 'cover', 'cover_srcset', 'slug', 'link')
+
+def listed(kind, drafts=False):
+    # published (or, for editors, all) entries in cursor order: (created_at, id)
+    if not drafts:
+        snap = content_snapshot()
+        if snap is not None:
+            return snap.listed(kind)
+
+    def build(posts):
+        items = (e for e in posts.get(kind, ()) if drafts or e.get('published'))
+        return tuple(sorted(items, key=order_key))
+    return content.derived('listed:%s:%d' % (kind, drafts), [DATA_POSTS], build)
+
+def blog_page(cursor=None, limit=BLOG_PAGE_SIZE):
+    # first (or next) page of published blog cards: (cards, next cursor)
+    return select(listed('blog'), (BLOG_CARD_FIELDS, (), cursor, limit))
+
+# the hero slideshow, under static/; the first one is preloaded
+HERO_IMAGES = ('img/heroimage.jpeg',)
+
+def home_context():
+    blog, next_cursor = blog_page()
+    return dict(projects=published_projects(), blog=blog, blog_next=next_cursor, hero_images=HERO_IMAGES)
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    key = ('/', content_signature(DATA_POSTS), template_version(HOME_TEMPLATE), site_url())
+    resp = app.response_class(mimetype='text/html')
+    # the hero slideshow's first image is set from script, so the parser never sees it
+    resp.headers['Link'] = page_preloads('index.html', url_for('static', filename=HERO_IMAGES[0]))
+    resp.set_etag(page_cache.etag_for(key))
+    resp.make_conditional(request)
+    if resp.status_code == 304:
+        return resp
+
+    body = page_cache.get(key)
+    if body is None:
+        body = render_template('index.html', **home_context())
+        page_cache.set(key, body)
+    resp.set_data(body)
+    return resp
 
 @app.route('/contact', methods=['POST'])
 def contact():
     name = request.form.get('name')
     email = request.form.get('email')
     message = request.form.get('message')
+    try:
+        save_lead('contact', email, name=name, message=message)
+    except LeadError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('index') + '#contact')
     flash("Thanks for reaching out! We'll get back to you soon.", "success")
     return redirect(url_for('index') + '#contact')
 
 @app.route('/subscribe', methods=['POST'])
 def subscribe():
     email = request.form.get('email')
+    try:
+        save_lead('subscribe', email)
+    except LeadError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('index') + '#footer')
     flash("You're now subscribed to our newsletter!", "success")
     return redirect(url_for('index') + '#footer')
 
+# --------------------
+# Sitemaps, feeds and robots.txt for crawlers
+# --------------------
+FEED_TYPES = {'sitemap': 'application/xml', 'feed.xml': 'application/rss+xml', 'feed.atom': 'application/atom+xml'}
+
+def send_feed(name, mimetype):
+    # built on editor saves; here only on the first request or if they vanished
+    if not site_url():
+        abort(404)
+    built = site_feeds.manifest()
+    if built is None or built.get('base') != site_url():
+        build_feeds()
+        built = site_feeds.manifest()
+    elif built.get('sources') != feed_sources():
+        schedule_feeds()    # a save the files don't reflect yet; serve the previous ones meanwhile
+    if name not in built.get('files', ()):
+        abort(404)
+    resp = send_from_directory(site_feeds.out_dir, name, mimetype=mimetype, conditional=True,
+                               max_age=app.config['FEED_MAX_AGE'])
+    resp.cache_control.public = True
+    return resp
+
+@app.route('/sitemap.xml')
+@app.route('/sitemap-<int:part>.xml')
+def sitemap(part=None):
+    return send_feed('sitemap.xml' if part is None else 'sitemap-%d.xml' % part, FEED_TYPES['sitemap'])
+
+@app.route('/feed.xml')
+def rss_feed():
+    return send_feed('feed.xml', FEED_TYPES['feed.xml'])
+
+@app.route('/feed.atom')
+def atom_feed():
+    return send_feed('feed.atom', FEED_TYPES['feed.atom'])
+
+@app.route('/robots.txt')
+def robots_txt():
+    body = 'User-agent: *\nDisallow: /settings\nDisallow: /verifier\nDisallow: /status/\n'
+    if site_url():
+        body += '\nSitemap: %s/sitemap.xml\n' % site_url()
+    resp = app.response_class(body, mimetype='text/plain')
+    resp.cache_control.public = True
+    resp.cache_control.max_age = app.config['FEED_MAX_AGE']
+    return resp
+
+@app.route('/status/content-cache')
+def content_cache_stats():
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    stats = content.stats()
+    stats['storage'] = storage.name
+    stats['index'] = get_index().stats()
+    stats['page_cache'] = page_cache.stats()
+    stats['markdown'] = markdown_stats()
+    stats['api_cache'] = api_cache.stats()
+    stats['search'] = search_index.stats()
+    stats['media'] = dict(media_index.stats(), gc=media_gc.stats())
+    stats['history'] = history.stats()
+    stats['snapshot'] = snapshots.stats()
+    stats['feeds'] = site_feeds.stats()
+    stats['compression'] = compressor.stats()
+    stats['auth'] = editor_auth.stats()
+    stats['leads'] = lead_journal.stats()
+    return jsonify(stats)
+
+@metrics.REGISTRY.collect
+def component_metrics():
+    # the caches' and job queue's own counters, read at scrape time
+    caches = {'page': page_cache.stats(), 'api': api_cache.stats(), 'markdown': markdown_stats(),
+              'compressed': compressor.stats()}
+    docs = content.stats()
+    jobs = job_queue.stats()
+    leads = lead_journal.stats()
+    snap = snapshots.stats()
+
+    def per_cache(field):
+        return [({'cache': name}, s[field]) for name, s in sorted(caches.items())]
+    return [
+        ('plh_cache_hits_total', 'counter', 'Cache hits.', per_cache('hits') + [({'cache': 'content'}, docs['hits'])]),
+        ('plh_cache_misses_total', 'counter', 'Cache misses.',
+         per_cache('misses') + [({'cache': 'content'}, docs['misses'])]),
+        ('plh_cache_evictions_total', 'counter', 'Cache evictions.', per_cache('evictions')),
+        ('plh_cache_bytes', 'gauge', 'Bytes held per cache.', per_cache('bytes')),
+        ('plh_cache_items', 'gauge', 'Entries held per cache.', per_cache('items')),
+        ('plh_compression_bytes_total', 'counter', 'Response bytes before and after compression (cache misses).',
+         [({'stage': 'in'}, caches['compressed']['bytes_in']), ({'stage': 'out'}, caches['compressed']['bytes_out'])]),
+        ('plh_content_reloads_total', 'counter', 'Content documents re-read after a change.', [({}, docs['reloads'])]),
+        ('plh_jobs', 'gauge', 'Jobs in the queue journal by state.',
+         [({'state': state}, jobs[state]) for state in ('pending', 'running', 'failed')]),
+        ('plh_jobs_done_total', 'counter', 'Jobs completed by this process.', [({}, jobs['done'])]),
+        ('plh_slow_profiles_total', 'counter', 'Slow-request profiles written.', [({}, profiler.dumped)]),
+        ('plh_content_snapshot_version', 'gauge', 'Version of the mapped content snapshot.',
+         [({}, snap.get('version', 0))]),
+        ('plh_content_snapshot_stale_total', 'counter', 'Lookups that found the snapshot behind the content.',
+         [({}, snap['stale'])]),
+        ('plh_leads', 'gauge', 'Leads in the journal by type.',
+         [({'type': kind}, leads[kind]) for kind in LEAD_KINDS]),
+        ('plh_leads_queued', 'gauge', 'Leads waiting for the next batch write.', [({}, leads['queued'])]),
+        ('plh_leads_duplicates_total', 'counter', 'Duplicate leads dropped.', [({}, leads['duplicates'])]),
+        ('plh_leads_batches_total', 'counter', 'Lead batches written (one fsync each).', [({}, leads['batches'])]),
+    ]
+
+@app.route('/metrics')
+def metrics_text():
+    # editors, anyone with METRICS_TOKEN, or local scrapers if METRICS_ALLOW_LOCAL
+    token = app.config.get('METRICS_TOKEN')
+    auth = request.headers.get('Authorization', '')
+    allowed = session.get('user') or \
+        (app.config['METRICS_ALLOW_LOCAL'] and request.remote_addr in ('127.0.0.1', '::1')) or \
+        (token and hmac.compare_digest(auth.encode('utf-8'), ('Bearer ' + token).encode('utf-8')))
+    if not allowed:
+        abort(403)
+    resp = app.response_class(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    resp.cache_control.no_store = True
+    return resp
+
+@app.route('/status/jobs')
+def job_stats():
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    return jsonify(job_queue.stats())
+
+@app.route('/status/jobs/<job_id>')
+def job_status(job_id):
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({'ok': False, 'error': 'Unknown job'}), 404
+    return jsonify({'ok': True, 'job': status})
+
+# --------------------
+# Public read API: /api/projects, /api/projects/<slug>, /api/blog
+# --------------------
+PROJECT_API_FIELDS = ('id', 'slug', 'title', 'header', 'subheader', 'excerpt', 'cover', 'cover_srcset',
+                      'link', 'published', 'is_sold', 'is_coming', 'created_at', 'updated_at')
+
+def api_collection(key):
+    # editors also see drafts; everyone else only published entries
+    return listed(key, drafts=bool(session.get('user')))
+
+def cached_json(key, build):
+    # serialized once per (content version, query); ETag from the body
+    key = (key, content_signature(DATA_POSTS), content_signature(DATA_PAGES), bool(session.get('user')))
+    hit = api_cache.get(key)
+    if hit is None:
+        body = json.dumps(build(), separators=(',', ':')).encode('utf-8')
+        hit = (body, hashlib.sha256(body).hexdigest()[:32])
+        api_cache.set(key, hit, len(body))
+    resp = app.response_class(hit[0], mimetype='application/json')
+    resp.set_etag(hit[1])
+    if session.get('user'):
+        resp.cache_control.private = True
+    else:
+        resp.cache_control.public = True
+        resp.cache_control.max_age = 60
+    return resp.make_conditional(request)
+
+def api_list(collection, default_fields, default_limit):
+    try:
+        query = parse_query(request.args, default_fields, default_limit)
+    except QueryError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+
+    def build():
+        items, next_cursor = select(api_collection(collection), query)
+        return {'ok': True, 'items': items, 'next_cursor': next_cursor}
+    try:
+        return cached_json((collection, query), build)
+    except QueryError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+
+@app.route('/api/projects')
+def api_projects():
+    return api_list('projects', PROJECT_API_FIELDS, 20)
+
+@app.route('/api/projects/<slug>')
+def api_project(slug):
+    project = get_project_by_slug(slug)
+    if not project or not (project.get('published') or session.get('user')):
+        return jsonify({'ok': False, 'error': 'Project not found'}), 404
+    fields = request.args.get('fields')
+    fields = tuple(f.strip() for f in fields.split(',') if f.strip()) if fields else PROJECT_API_FIELDS + ('page',)
+
+    def build():
+        item = select_fields(project, fields)
+        if 'page' in fields:
+            page = get_page_by_project_id(project.get('id'))
+            item['page'] = select_fields(page, ('slug', 'title', 'excerpt', 'sections', 'updated_at')) if page else None
+        return {'ok': True, 'item': item}
+    return cached_json(('project', project.get('id'), fields), build)
+
+@app.route('/api/blog')
+def api_blog():
+    return api_list('blog', BLOG_CARD_FIELDS, BLOG_PAGE_SIZE)
+
+SEARCH_TYPES = ('project', 'blog')
+
+def search_hit(hit):
+    e = hit['entry']
+    if hit['type'] == 'project':
+        url = '/projects/%s.html' % e['slug'] if e.get('slug') else e.get('link') or ''
+    else:
+        url = e.get('link') or '/projects/%s.html' % (e.get('slug') or '')
+    return {
+        'type': hit['type'],
+        'id': hit['id'],
+        'title': e.get('title') or e.get('header') or '',
+        'excerpt': e.get('excerpt') or '',
+        'cover': e.get('cover') or '',
+        'url': url,
+        'published': bool(e.get('published')),
+        'snippet': hit['snippet'],
+        'score': hit['score'],
+    }
+
+@app.route('/search')
+def site_search():
+    # ?q=garden vil&type=project,blog&limit=10; the last word is a prefix
+    q = ' '.join((request.args.get('q') or '').split()[:12])[:200]
+    if request.args.get('q', '')[-1:].isspace():
+        q += ' '
+    types = tuple(t for t in (request.args.get('type') or '').split(',') if t in SEARCH_TYPES) or SEARCH_TYPES
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 200 if session.get('user') else 50)
+    except ValueError:
+        return jsonify({'ok': False, 'error': 'limit must be a number'}), 400
+
+    def build():
+        hits = search_index.search(q, limit, types, include_unpublished=bool(session.get('user')))
+        return {'ok': True, 'query': q.strip(), 'items': [search_hit(h) for h in hits]}
+    return cached_json(('search', q, types, limit), build)
+
 # --------------------
 # Verifier/login (editors)
 # --------------------
@@ -143,12 +933,15 @@ def verifier():
         email = request.form.get('email')
         password = request.form.get('password')
 
-        data = load_json(DATA_VERIFIER)
-        for user in data.get('editors', []):
-            if user.get('email') == email and user.get('password') == password:
-                session['user'] = user.get('user')
-                flash('Welcome, ' + user.get('user'), 'success')
-                return redirect(url_for('settings'))
+        result, user, retry_after = editor_auth.login(email, password, request.remote_addr)
+        LOGINS.inc(1, (result,))
+        if result == 'ok':
+            session['user'] = user.get('user')
+            flash('Welcome, ' + user.get('user'), 'success')
+            return redirect(url_for('settings'))
+        if result in ('throttled', 'busy'):
+            flash('Too many login attempts. Try again in %d seconds.' % retry_after, 'danger')
+            return render_template('verifier.html'), 429, {'Retry-After': str(retry_after)}
 
         flash('Invalid email or password', 'danger')
         return redirect(url_for('verifier'))
@@ -164,13 +957,72 @@ def settings():
         flash('You must log in first.', 'warning')
         return redirect(url_for('verifier'))
 
-    # ensure slugs
-    ensure_project_slugs_and_save()
-
-    posts = load_json(DATA_POSTS)
-    projects = posts.get('projects', [])
-    blog = posts.get('blog', [])
-    return render_template('settings.html', user=session.get('user'), projects=projects, blog=blog)
+    # the tables load themselves from /settings/api/<kind>, a page at a time
+    return render_template('settings.html', user=session.get('user'))
+
+# Editor panel data: a compact, sorted index per kind plus full entities on demand
+EDITOR_FIELDS = ('id', 'title', 'header', 'slug', 'link', 'published', 'is_sold', 'is_coming',
+                 'updated_at', 'version')
+EDITOR_SORTS = ('updated_at', 'created_at', 'title')
+EDITOR_KINDS = {'projects': 'project', 'blog': 'blog'}   # kind -> search type
+
+def editor_sort_key(sort):
+    if sort == 'title':
+        return lambda e: (e.get('title') or e.get('header') or '').lower()
+    return lambda e: e.get(sort)
+
+def editor_view(kind, sort, desc):
+    # sorted once per content version and order; ties broken by id for the cursors
+    def build(posts):
+        key = editor_sort_key(sort)
+        return tuple(sorted(posts.get(kind, ()), key=lambda e: order_key(e, key), reverse=desc))
+    return content.derived('editor:%s:%s:%d' % (kind, sort, desc), [DATA_POSTS], build)
+
+@app.route('/settings/api/<kind>')
+def editor_list(kind):
+    # ?sort=updated_at|created_at|title&order=asc|desc&published=&is_sold=&is_coming=&q=&cursor=&limit=
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    if kind not in EDITOR_KINDS:
+        return jsonify({'ok': False, 'error': 'Unknown collection'}), 404
+    sort = request.args.get('sort', 'updated_at')
+    if sort not in EDITOR_SORTS:
+        return jsonify({'ok': False, 'error': 'sort must be one of ' + ', '.join(EDITOR_SORTS)}), 400
+    desc = request.args.get('order', 'asc' if sort == 'title' else 'desc') == 'desc'
+    q = ' '.join((request.args.get('q') or '').split())[:200]
+    try:
+        query = parse_query(request.args, EDITOR_FIELDS, 50, 200)
+    except QueryError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+
+    def build():
+        items = editor_view(kind, sort, desc)
+        if q:
+            hits = search_index.search(q, 1000, (EDITOR_KINDS[kind],), include_unpublished=True)
+            ids = {h['id'] for h in hits}
+            items = [i for i in items if i.get('id') in ids]
+        page, next_cursor = select(items, query, editor_sort_key(sort), desc)
+        return {'ok': True, 'items': page, 'next_cursor': next_cursor}
+    try:
+        return cached_json(('editor', kind, sort, desc, q, query), build)
+    except QueryError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+
+@app.route('/settings/api/<kind>/<item_id>')
+def editor_entity(kind, item_id):
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    if kind not in EDITOR_KINDS:
+        return jsonify({'ok': False, 'error': 'Unknown collection'}), 404
+    idx = get_index()
+    item = idx.project_by_id(item_id) if kind == 'projects' else idx.blog_post(item_id)
+    if not item:
+        return jsonify({'ok': False, 'error': 'Not found'}), 404
+    resp = jsonify({'ok': True, 'item': item})
+    resp.set_etag(version_etag(item))
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
 
 # --------------------
 # Existing project/blog routes (add/update/delete) - unchanged
@@ -195,30 +1047,37 @@ def update_project():
         flash('Missing project id', 'danger')
         return redirect(url_for('settings'))
 
-    posts = load_json(DATA_POSTS)
-    for p in posts.get('projects', []):
-        if p.get('id') == proj_id:
-            p['title'] = request.form.get('title', p.get('title'))
-            p['header'] = request.form.get('header', p.get('header'))
-            p['subheader'] = request.form.get('subheader', p.get('subheader'))
-            p['excerpt'] = request.form.get('excerpt', p.get('excerpt'))
-            p['link'] = request.form.get('link', p.get('link'))
-
-            p['published'] = True if request.form.get('published') == 'on' else False
-            p['is_sold'] = True if request.form.get('is_sold') == 'on' else False
-            p['is_coming'] = True if request.form.get('is_coming') == 'on' else False
-
-            # cover upload
-            file = request.files.get('cover')
-            if file and file.filename:
-                saved = save_uploaded_file(file)
-                if saved:
-                    p['cover'] = saved
-
-            p['updated_at'] = datetime.utcnow().isoformat() + 'Z'
-            break
+    # cover upload
+    file = request.files.get('cover')
+    cover = save_uploaded_file(file) if file and file.filename else None
+
+    before = {}
+
+    def apply(p):
+        before.update(p)
+        p['title'] = request.form.get('title', p.get('title'))
+        p['header'] = request.form.get('header', p.get('header'))
+        p['subheader'] = request.form.get('subheader', p.get('subheader'))
+        p['excerpt'] = request.form.get('excerpt', p.get('excerpt'))
+        p['link'] = request.form.get('link', p.get('link'))
+
+        p['published'] = True if request.form.get('published') == 'on' else False
+        p['is_sold'] = True if request.form.get('is_sold') == 'on' else False
+        p['is_coming'] = True if request.form.get('is_coming') == 'on' else False
+        if cover:
+            p['cover'] = cover
+        if not p.get('slug'):
+            p['slug'] = project_slug(p)
 
-    write_json(DATA_POSTS, posts)
+        p['updated_at'] = datetime.utcnow().isoformat() + 'Z'
+
+    try:
+        p = storage.update('projects', proj_id, apply, expected_version(request.form.get('version')))
+    except ConflictError as e:
+        return version_conflict(e)
+    if p:
+        invalidate_project_page(before, p)
+        release_media(before, p)
     flash('Project updated successfully', 'success')
     return redirect(url_for('settings'))
 
@@ -229,9 +1088,6 @@ def add_project():
         flash('Not authorized', 'danger')
         return redirect(url_for('verifier'))
 
-    posts = load_json(DATA_POSTS)
-    projects = posts.get('projects', [])
-
     title = request.form.get('title', 'Untitled Project')
     header = request.form.get('header', title)
     subheader = request.form.get('subheader', '')
@@ -257,10 +1113,9 @@ def add_project():
         'created_at': datetime.utcnow().isoformat() + 'Z',
         'updated_at': datetime.utcnow().isoformat() + 'Z'
     }
+    new_proj['slug'] = project_slug(new_proj)
 
-    projects.append(new_proj)
-    posts['projects'] = projects
-    write_json(DATA_POSTS, posts)
+    storage.insert('projects', new_proj)
 
     flash('Project added', 'success')
     return redirect(url_for('settings'))
@@ -277,29 +1132,33 @@ def update_blog():
         flash('Missing blog id', 'danger')
         return redirect(url_for('settings'))
 
-    posts = load_json(DATA_POSTS)
-    for b in posts.get('blog', []):
-        if b.get('id') == blog_id:
-            b['title'] = request.form.get('title', b.get('title'))
-            b['header'] = request.form.get('header', b.get('header'))
-            b['subheader'] = request.form.get('subheader', b.get('subheader'))
-            b['excerpt'] = request.form.get('excerpt', b.get('excerpt'))
-            b['slug'] = request.form.get('slug', b.get('slug'))
-            b['published'] = True if request.form.get('published') == 'on' else False
-
-            # save manual link if provided
-            b['link'] = request.form.get('link', b.get('link'))
-
-            file = request.files.get('cover')
-            if file and file.filename:
-                saved = save_uploaded_file(file)
-                if saved:
-                    b['cover'] = saved
-
-            b['updated_at'] = datetime.utcnow().isoformat() + 'Z'
-            break
-
-    write_json(DATA_POSTS, posts)
+    file = request.files.get('cover')
+    cover = save_uploaded_file(file) if file and file.filename else None
+
+    before = {}
+
+    def apply(b):
+        before.update(b)
+        b['title'] = request.form.get('title', b.get('title'))
+        b['header'] = request.form.get('header', b.get('header'))
+        b['subheader'] = request.form.get('subheader', b.get('subheader'))
+        b['excerpt'] = request.form.get('excerpt', b.get('excerpt'))
+        b['slug'] = request.form.get('slug', b.get('slug'))
+        b['published'] = True if request.form.get('published') == 'on' else False
+
+        # save manual link if provided
+        b['link'] = request.form.get('link', b.get('link'))
+        if cover:
+            b['cover'] = cover
+
+        b['updated_at'] = datetime.utcnow().isoformat() + 'Z'
+
+    try:
+        b = storage.update('blog', blog_id, apply, expected_version(request.form.get('version')))
+    except ConflictError as e:
+        return version_conflict(e)
+    if b:
+        release_media(before, b)
     flash('Blog post updated', 'success')
     return redirect(url_for('settings'))
 
@@ -311,9 +1170,6 @@ def add_blog():
         flash('Not authorized', 'danger')
         return redirect(url_for('verifier'))
 
-    posts = load_json(DATA_POSTS)
-    blog = posts.get('blog', [])
-
     title = request.form.get('title', 'Untitled')
     header = request.form.get('header', title)
     subheader = request.form.get('subheader', '')
@@ -345,9 +1201,7 @@ def add_blog():
         'updated_at': datetime.utcnow().isoformat() + 'Z'
     }
 
-    blog.append(new_blog)
-    posts['blog'] = blog
-    write_json(DATA_POSTS, posts)
+    storage.insert('blog', new_blog)
 
     flash('Blog post added', 'success')
     return redirect(url_for('settings'))
@@ -364,24 +1218,16 @@ def delete_project():
         flash('Missing project id', 'danger')
         return redirect(url_for('settings'))
 
-    posts = load_json(DATA_POSTS)
-    projects = posts.get('projects', [])
-    for i, p in enumerate(projects):
-        if p.get('id') == proj_id:
-            cover = p.get('cover', '')
-            # delete uploaded cover only if it's in uploads
-            if cover and cover.startswith('static/uploads/'):
-                try:
-                    fp = os.path.normpath(os.path.join(os.getcwd(), cover))
-                    if os.path.exists(fp):
-                        os.remove(fp)
-                except Exception:
-                    pass
-            projects.pop(i)
-            posts['projects'] = projects
-            write_json(DATA_POSTS, posts)
-            flash('Project deleted', 'success')
-            return redirect(url_for('settings'))
+    try:
+        p = storage.delete('projects', proj_id, expected_version(request.form.get('version')))
+    except ConflictError as e:
+        return version_conflict(e)
+    if p is not None:
+        # uploaded cover is removed in the background once nothing references it
+        release_media(p)
+        invalidate_project_page(p)
+        flash('Project deleted', 'success')
+        return redirect(url_for('settings'))
 
     flash('Project not found', 'danger')
     return redirect(url_for('settings'))
@@ -397,23 +1243,14 @@ def delete_blog():
         flash('Missing blog id', 'danger')
         return redirect(url_for('settings'))
 
-    posts = load_json(DATA_POSTS)
-    blog_list = posts.get('blog', [])
-    for i, b in enumerate(blog_list):
-        if b.get('id') == blog_id:
-            cover = b.get('cover', '')
-            if cover and cover.startswith('static/uploads/'):
-                try:
-                    fp = os.path.normpath(os.path.join(os.getcwd(), cover))
-                    if os.path.exists(fp):
-                        os.remove(fp)
-                except Exception:
-                    pass
-            blog_list.pop(i)
-            posts['blog'] = blog_list
-            write_json(DATA_POSTS, posts)
-            flash('Blog post deleted', 'success')
-            return redirect(url_for('settings'))
+    try:
+        b = storage.delete('blog', blog_id, expected_version(request.form.get('version')))
+    except ConflictError as e:
+        return version_conflict(e)
+    if b is not None:
+        release_media(b)
+        flash('Blog post deleted', 'success')
+        return redirect(url_for('settings'))
 
     flash('Blog post not found', 'danger')
     return redirect(url_for('settings'))
@@ -439,6 +1276,62 @@ def upload_media():
 
     return jsonify({'ok': True, 'url': saved})
 
+# ---- resumable chunked uploads (see uploads.py) ----
+@app.route('/settings/uploads', methods=['POST'])
+def upload_start():
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    body = request.get_json(silent=True) or {}
+    filename = secure_filename(body.get('filename') or '')
+    try:
+        size = int(body['size']) if body.get('size') is not None else None
+        upload_id = upload_store.start(filename, size)
+    except (TypeError, ValueError) as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    return jsonify({'ok': True, 'upload_id': upload_id, 'offset': 0,
+                    'chunk_size': app.config['UPLOAD_CHUNK_SIZE']}), 201
+
+@app.route('/settings/uploads/<upload_id>', methods=['GET', 'PUT'])
+def upload_chunk(upload_id):
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    try:
+        if request.method == 'GET':
+            return jsonify({'ok': True, 'offset': upload_store.offset(upload_id)})
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return jsonify({'ok': False, 'error': 'Upload-Offset header required'}), 400
+        # read straight from the socket; the chunk is never buffered whole
+        offset = upload_store.append(upload_id, offset, request.stream)
+    except OffsetMismatch as e:
+        return jsonify({'ok': False, 'error': str(e), 'offset': e.expected}), 409
+    except UploadError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    return jsonify({'ok': True, 'offset': offset})
+
+@app.route('/settings/uploads/<upload_id>/finish', methods=['POST'])
+def upload_finish(upload_id):
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    body = request.get_json(silent=True) or {}
+    try:
+        name, digest, deduplicated = upload_store.finish(upload_id, body.get('sha256'))
+    except UploadError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    return jsonify({'ok': True, 'url': stored_upload(name, deduplicated), 'sha256': digest,
+                    'deduplicated': deduplicated})
+
+@app.route('/settings/uploads/<upload_id>', methods=['DELETE'])
+def upload_abort(upload_id):
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    try:
+        upload_store.abort(upload_id)
+    except UploadError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 404
+    return jsonify({'ok': True})
+
 # --------------------
 # Page API: get/save/delete
 # --------------------
@@ -454,7 +1347,9 @@ def get_page():
     entry = get_page_by_project_id(project_id)
     if not entry:
         return jsonify({'ok': True, 'page': None})
-    return jsonify({'ok': True, 'page': entry})
+    resp = jsonify({'ok': True, 'page': entry})
+    resp.set_etag(version_etag(entry))
+    return resp
 
 @app.route('/settings/save_page', methods=['POST'])
 def save_page():
@@ -474,52 +1369,94 @@ def save_page():
     if not project_id:
         return jsonify({'ok': False, 'error': 'Missing project_id'}), 400
 
-    posts = load_json(DATA_POSTS)
-    project = None
-    for p in posts.get('projects', []):
-        if p.get('id') == project_id:
-            project = p
-            break
-    if not project:
-        return jsonify({'ok': False, 'error': 'Project not found'}), 404
-
-    # enforce/derive slug
-    if not slug:
-        slug = project.get('slug') or slugify(project.get('link') or project.get('title') or project.get('header'))
-
     # ensure sections have ids
     for s in sections:
         if not s.get('id'):
             s['id'] = 'sec-' + uuid.uuid4().hex[:8]
 
-    now = datetime.utcnow().isoformat() + 'Z'
-    entry = get_page_by_project_id(project_id)
-    if entry:
-        entry['slug'] = slug
-        entry['title'] = title or entry.get('title') or project.get('title')
-        entry['excerpt'] = excerpt or entry.get('excerpt') or project.get('excerpt')
-        entry['sections'] = sections
-        entry['updated_at'] = now
-    else:
-        entry = {
-            'project_id': project_id,
-            'slug': slug,
-            'title': title or project.get('title'),
-            'excerpt': excerpt or project.get('excerpt'),
-            'sections': sections,
-            'created_at': now,
-            'updated_at': now
-        }
-    save_or_update_page(entry)
-
-    # ensure the project's slug field is updated to this slug (so /projects/<slug>.html resolves)
-    if project.get('slug') != slug:
-        project['slug'] = slug
-        # write back posts
-        posts['projects'] = posts.get('projects', [])
-        write_json(DATA_POSTS, posts)
-
-    return jsonify({'ok': True, 'page_slug': slug})
+    # the page and the project's slug are committed together
+    try:
+        with storage.batch() as b:
+            project = b.get('projects', project_id)
+            if not project:
+                return jsonify({'ok': False, 'error': 'Project not found'}), 404
+
+            # enforce/derive slug
+            if not slug:
+                slug = project.get('slug') or slugify(project.get('link') or project.get('title') or project.get('header'))
+
+            now = datetime.utcnow().isoformat() + 'Z'
+            entry = b.get('project_pages', project_id)
+            previous = upload_refs(entry or {})
+            if entry:
+                entry['slug'] = slug
+                entry['title'] = title or entry.get('title') or project.get('title')
+                entry['excerpt'] = excerpt or entry.get('excerpt') or project.get('excerpt')
+                entry['sections'] = sections
+                entry['updated_at'] = now
+            else:
+                entry = {
+                    'project_id': project_id,
+                    'slug': slug,
+                    'title': title or project.get('title'),
+                    'excerpt': excerpt or project.get('excerpt'),
+                    'sections': sections,
+                    'created_at': now,
+                    'updated_at': now
+                }
+            entry = b.upsert('project_pages', entry, expected_version(data.get('version')))
+
+            # ensure the project's slug field is updated to this slug (so /projects/<slug>.html resolves)
+            before = dict(project)
+            if project.get('slug') != slug:
+                def set_slug(p):
+                    p['slug'] = slug
+                b.update('projects', project_id, set_slug)
+    except ConflictError as e:
+        return version_conflict(e)
+
+    invalidate_project_page(before)
+    page_cache.invalidate(slug)
+    # images dropped from the page's sections
+    release_media(previous, entry)
+
+    resp = jsonify({'ok': True, 'page_slug': slug, 'version': entity_version(entry)})
+    resp.set_etag(version_etag(entry))
+    return resp
+
+@app.route('/settings/pages/<project_id>', methods=['PATCH'])
+def patch_page(project_id):
+    # section-level edits; the body carries only the changed sections
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'ok': False, 'error': 'Invalid JSON body'}), 400
+
+    result = {}
+    def apply(entry):
+        result['added'], result['replaced'] = apply_patch(entry, data.get('ops'))
+        entry['updated_at'] = datetime.utcnow().isoformat() + 'Z'
+
+    try:
+        entry = storage.update('project_pages', project_id, apply, expected_version(data.get('version')))
+    except ConflictError as e:
+        return version_conflict(e)
+    except PatchError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    if entry is None:
+        return jsonify({'ok': False, 'error': 'Page not found'}), 404
+
+    page_cache.invalidate(entry.get('slug'))
+    invalidate_project_page(get_index().project_by_id(project_id))
+    # images that were in the updated/deleted sections and aren't any more
+    release_media(result['replaced'], entry)
+
+    resp = jsonify({'ok': True, 'version': entity_version(entry),
+                    'ids': {str(n): sid for n, sid in result['added'].items()}})
+    resp.set_etag(version_etag(entry))
+    return resp
 
 @app.route('/settings/delete_page', methods=['POST'])
 def delete_page():
@@ -531,55 +1468,142 @@ def delete_page():
     if not project_id:
         return jsonify({'ok': False, 'error': 'Missing project_id'}), 400
 
-    pages = load_json(DATA_PAGES)
-    arr = pages.get('project_pages', [])
-    for i, e in enumerate(arr):
-        if e.get('project_id') == project_id:
-            # optionally delete uploaded files that are only referenced here (best-effort)
-            secs = e.get('sections', [])
-            for s in secs:
-                # gather image urls
-                if s.get('cover') and s['cover'].startswith('static/uploads/'):
-                    try:
-                        fp = os.path.normpath(os.path.join(os.getcwd(), s['cover']))
-                        if os.path.exists(fp):
-                            os.remove(fp)
-                    except Exception:
-                        pass
-                if s.get('images'):
-                    for im in s['images']:
-                        src = im.get('src') if isinstance(im, dict) else im
-                        if src and isinstance(src, str) and src.startswith('static/uploads/'):
-                            try:
-                                fp = os.path.normpath(os.path.join(os.getcwd(), src))
-                                if os.path.exists(fp):
-                                    os.remove(fp)
-                            except Exception:
-                                pass
-            arr.pop(i)
-            pages['project_pages'] = arr
-            write_json(DATA_PAGES, pages)
-            return jsonify({'ok': True})
+    try:
+        e = storage.delete('project_pages', project_id, expected_version(data.get('version')))
+    except ConflictError as err:
+        return version_conflict(err)
+    if e is not None:
+        # delete uploaded files that are only referenced here, in the background
+        release_media(e)
+        invalidate_project_page(get_index().project_by_id(project_id))
+        return jsonify({'ok': True})
     return jsonify({'ok': False, 'error': 'Page not found'}), 404
 
 # --------------------
-# Render dynamic project page
+# Revision history (see history.py)
 # --------------------
-@app.route('/projects/<slug>.html')
-def project_page(slug):
-    project = get_project_by_slug(slug)
-    if not project:
+HISTORY_KINDS = ('projects', 'blog', 'project_pages')
+
+def restore_revision(kind, key, seq, expected=None):
+    """Write revision `seq` back as the current entry (deleting it if that
+    revision is a delete). Returns (before, after); raises LookupError."""
+    found = history.revision(kind, key, seq)
+    if found is None:
+        raise LookupError('No revision %d of %s %s' % (seq, kind, key))
+    item = found[1]
+    g.history_note = 'restored revision %d' % seq
+    try:
+        with storage.batch() as b:
+            before = b.get(kind, key)
+            if item is None:
+                b.delete(kind, key, expected)
+            else:
+                item.pop('version', None)
+                item = b.upsert(kind, item, expected)
+    finally:
+        g.pop('history_note', None)
+
+    if kind == 'projects':
+        invalidate_project_page(before, item)
+    elif kind == 'project_pages':
+        page_cache.invalidate((before or {}).get('slug'), (item or {}).get('slug'))
+        invalidate_project_page(get_index().project_by_id(key))
+    release_media(before, item)
+    return before, item
+
+@app.route('/settings/history/<kind>')
+def history_deleted(kind):
+    # recently deleted entries of a kind, restorable from their last revision
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    if kind not in HISTORY_KINDS:
         abort(404)
+    return jsonify({'ok': True, 'deleted': history.deleted(kind, limit=request.args.get('limit', 50, type=int))})
 
-    page = get_page_by_project_id(project.get('id'))
+@app.route('/settings/history/<kind>/<key>')
+def history_list(kind, key):
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    if kind not in HISTORY_KINDS:
+        abort(404)
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    revisions = history.revisions(kind, key, limit=limit, before=request.args.get('before', type=int))
+    next_before = revisions[-1]['seq'] if len(revisions) == limit else None
+    return jsonify({'ok': True, 'revisions': revisions, 'next_before': next_before})
+
+@app.route('/settings/history/<kind>/<key>/<int:seq>')
+def history_revision(kind, key, seq):
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    if kind not in HISTORY_KINDS:
+        abort(404)
+    found = history.revision(kind, key, seq)
+    if found is None:
+        return jsonify({'ok': False, 'error': 'Unknown revision'}), 404
+    meta, item, changes = found
+    return jsonify({'ok': True, 'revision': meta, 'item': item, 'changes': changes})
+
+@app.route('/settings/history/<kind>/<key>/<int:seq>/restore', methods=['POST'])
+def history_restore(kind, key, seq):
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    if kind not in HISTORY_KINDS:
+        abort(404)
+    try:
+        data = request.get_json(silent=True) or request.form
+        _, item = restore_revision(kind, key, seq, expected_version(data.get('version')))
+    except LookupError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 404
+    except ConflictError as e:
+        return jsonify({'ok': False, 'error': str(e), 'version': e.current}), 409
+    resp = jsonify({'ok': True, 'deleted': item is None, 'version': entity_version(item)})
+    if item is not None:
+        resp.set_etag(version_etag(item))
+    return resp
+
+# --------------------
+# Leads from /contact and /subscribe (see leads.py)
+# --------------------
+@app.route('/settings/leads')
+def leads_list():
+    # ?type=contact|subscribe&before=<next_before>&limit=
+    if not session.get('user'):
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 403
+    kind = request.args.get('type') or None
+    if kind is not None and kind not in LEAD_KINDS:
+        return jsonify({'ok': False, 'error': 'Unknown lead type'}), 400
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    items, next_before = lead_journal.page(kind, request.args.get('before', type=int), limit)
+    return jsonify({'ok': True, 'items': items, 'next_before': next_before, 'stats': lead_journal.stats()})
+
+@app.route('/settings/leads/export.<fmt>')
+def leads_export(fmt):
+    # ?type=contact|subscribe&since=2024-01-01; streamed, oldest first
+    if not session.get('user'):
+        return redirect(url_for('verifier'))
+    kind = request.args.get('type') or None
+    if fmt not in ('csv', 'jsonl') or (kind is not None and kind not in LEAD_KINDS):
+        abort(404)
+    lead_journal.flush(5)
+    body = lead_journal.export(fmt, kind, request.args.get('since') or None)
+    resp = app.response_class(stream_with_context(body), content_type='text/csv; charset=utf-8' if fmt == 'csv'
+                              else 'application/x-ndjson; charset=utf-8')
+    resp.headers['Content-Disposition'] = 'attachment; filename="leads-%s%s.%s"' % (
+        kind + '-' if kind else '', datetime.utcnow().strftime('%Y%m%d'), fmt)
+    resp.cache_control.no_store = True
+    return resp
+
+# --------------------
+# Render dynamic project page
+# --------------------
+def project_page_context(project, page):
     sections = []
     if page:
-        # convert markdown content to HTML for text sections
+        # convert markdown content to HTML for text sections (memoized per content)
         for s in page.get('sections', []):
             scopy = dict(s)
             if 'content' in s and s.get('content'):
-                html = markdown.markdown(s.get('content', ''), extensions=['extra'])
-                scopy['html'] = Markup(html)
+                scopy['html'] = Markup(render_markdown(s.get('content', '')))
             # for safety, ensure strings are escaped where necessary in template too
             sections.append(scopy)
         page_title = page.get('title') or project.get('title')
@@ -596,14 +1620,526 @@ def project_page(slug):
             'subheader': project.get('subheader') or '',
             'cover': project.get('cover', '')
         }]
+    return dict(project=project, sections=sections, page_title=page_title, page_excerpt=page_excerpt,
+                lead_image=lead_image(project, page)[0])
+
+HERO_SIZES = '(max-width: 768px) 100vw, 768px'
+GALLERY_SIZES = '(max-width: 768px) 100vw, 33vw'
+
+def lead_image(project, page):
+    # (src, sizes) of the first image project_page.html shows, or (None, None)
+    sections = page.get('sections', []) if page else [{'type': 'hero', 'cover': project.get('cover', '')}]
+    for s in sections:
+        if s.get('type') == 'hero':
+            return s.get('cover') or project.get('cover') or url_for('static', filename='img/placeholder.png'), HERO_SIZES
+        if s.get('type') == 'image' and s.get('cover'):
+            return s['cover'], HERO_SIZES
+        if s.get('type') == 'gallery' and s.get('images'):
+            im = s['images'][0]
+            return (im.get('src') if isinstance(im, dict) else im), GALLERY_SIZES
+    return None, None
+
+# Link: rel=preload for what the first paint needs, so the browser (or a CDN
+# turning these into 103 Early Hints) starts fetching before the HTML is parsed
+PAGE_STYLES = {
+    'index.html': ('vendor/aos-lite.css', 'styles.css', 'app.css'),
+    'project_page.html': ('vendor/aos-lite.css', 'styles.css', 'ppstyle.css', 'app.css'),
+}
+
+def preload_link(url, kind, **params):
+    return '; '.join(['<%s>' % quote(url, safe="/:?&=%#@+,;~'"), 'rel=preload', 'as=' + kind] +
+                     ['%s="%s"' % (name, value) for name, value in params.items()])
+
+def root_relative(src):
+    # stored image paths ("static/img/x.png") resolve against the page in a
+    # Link header, so /projects/<slug> would ask for /projects/static/...
+    if urlsplit(src).scheme or src.startswith('//'):
+        return src
+    return '/' + web_path(src)
+
+def page_preloads(template, image=None, sizes=None):
+    # sizes: the <img sizes> of a responsive_img, whose webp srcset is preloaded instead
+    links = [preload_link(url_for('static', filename=name), 'style') for name in PAGE_STYLES[template]]
+    if image:
+        v = image_variants(image) if sizes else None
+        if v:
+            links.append(preload_link(root_relative(image), 'image', imagesrcset=v['webp_srcset'],
+                                      imagesizes=sizes, type='image/webp', fetchpriority='high'))
+        else:
+            links.append(preload_link(root_relative(image), 'image', fetchpriority='high'))
+    return ', '.join(links)
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(microsecond=0)
+    except ValueError:
+        return None
 
-    return render_template('project_page.html', project=project, sections=sections, page_title=page_title, page_excerpt=page_excerpt)
+def project_last_modified(project, page):
+    stamps = [parse_timestamp(project.get('updated_at'))]
+    if page:
+        stamps.append(parse_timestamp(page.get('updated_at')))
+    stamps = [t for t in stamps if t is not None]
+    return max(stamps) if stamps else None
+
+def invalidate_project_page(*projects):
+    # drop cached renders for every slug a project can be reached by
+    slugs = []
+    for p in projects:
+        if p:
+            slugs.append(p.get('slug'))
+            if p.get('link'):
+                slugs.append(slugify(p.get('link')))
+    page_cache.invalidate(*slugs)
+
+@app.route('/projects/<slug>.html')
+def project_page(slug):
+    project = get_project_by_slug(slug)
+    if not project:
+        abort(404)
+
+    page = get_page_by_project_id(project.get('id'))
+
+    preloads = page_preloads('project_page.html', *lead_image(project, page))
+    # editors see an Edit link and their name, so only anonymous views are cached
+    if session.get('user'):
+        resp = app.make_response(render_template('project_page.html', **project_page_context(project, page)))
+        resp.headers['Link'] = preloads
+        return resp
+
+    key = page_cache.make_key(slug, page, project, template_version(PROJECT_TEMPLATE))
+    resp = app.response_class(mimetype='text/html')
+    resp.headers['Link'] = preloads
+    resp.set_etag(page_cache.etag_for(key))
+    resp.last_modified = project_last_modified(project, page)
+    resp.make_conditional(request)
+    if resp.status_code == 304:
+        return resp
+
+    body = page_cache.get(key)
+    if body is None:
+        body = render_template('project_page.html', **project_page_context(project, page))
+        page_cache.set(key, body)
+    resp.set_data(body)
+    return resp
+
+# --------------------
+# CLI: flask --app app images backfill
+# --------------------
+@app.cli.group()
+def images():
+    """Responsive image derivatives."""
+
+@images.command('backfill')
+@click.option('--force', is_flag=True, help='Rebuild even if derivatives are up to date.')
+def images_backfill(force):
+    """Build derivatives for static/img and static/uploads."""
+    if not image_pipeline.enabled:
+        raise click.ClickException('Pillow is not installed; pip install Pillow')
+    count = 0
+    for src in image_pipeline.sources('static/img', 'static/uploads'):
+        info = image_pipeline.process(src, force=force)
+        if info:
+            attach_srcset(src, info)
+            count += 1
+            click.echo('%s: %s' % (src, ', '.join(sorted(info['webp'], key=int))))
+    click.echo('%d images processed' % count)
+
+# --------------------
+# CLI: flask --app app assets build
+# --------------------
+@app.cli.group('assets')
+def assets_cli():
+    """Fingerprinted CSS/JS bundles."""
+
+@assets_cli.command('build')
+def assets_build():
+    """Rebuild static/dist (Tailwind subset, minified css, hashed names)."""
+    manifest = build_assets(force=True)
+    for name, hashed in sorted(manifest.items()):
+        size = os.path.getsize(os.path.join('static', hashed))
+        click.echo('%s -> %s (%d bytes)' % (name, hashed, size))
+
+# --------------------
+# CLI: flask --app app storage migrate-sqlite
+# --------------------
+@app.cli.group('storage')
+def storage_cli():
+    """Content storage backends."""
+
+@storage_cli.command('migrate-sqlite')
+@click.option('--db', default=None, help='SQLite file to create (default: SQLITE_PATH).')
+@click.option('--force', is_flag=True, help='Replace rows already in the database.')
+def storage_migrate_sqlite(db, force):
+    """Copy posts.json / project_pages.json into the SQLite backend."""
+    target = SqliteStorage(db or app.config['SQLITE_PATH'], DATA_POSTS, DATA_PAGES)
+    if not target.is_empty() and not force:
+        raise click.ClickException('%s already has content; use --force to replace it' % target.db_path)
+    counts = target.import_documents(load_json(DATA_POSTS), load_json(DATA_PAGES))
+    click.echo('%s: %d projects, %d blog posts, %d pages' % (
+        target.db_path, counts['projects'], counts['blog'], counts['project_pages']))
+    click.echo('Set STORAGE_BACKEND=sqlite (or FLASK_STORAGE_BACKEND=sqlite) to use it.')
+
+@storage_cli.command('snapshot')
+def storage_snapshot():
+    """Rebuild the shared content snapshot now (e.g. before starting workers)."""
+    snap = rebuild_snapshot() or snapshots.load()
+    click.echo('%s: version %d, %d bytes, %d projects, %d blog posts, %d pages' % (
+        snapshots.path, snap.version, snap.size, snap.count('projects'), snap.count('blog'),
+        snap.count('project_pages')))
+
+# --------------------
+# CLI: flask --app app media gc [--dry-run]
+# --------------------
+@app.cli.group('media')
+def media_cli():
+    """Uploaded media."""
+
+@media_cli.command('gc')
+@click.option('--dry-run', is_flag=True, help='Only report what would be deleted.')
+@click.option('--grace', type=float, default=None, help='Minimum age in hours (default: MEDIA_GC_GRACE).')
+def media_gc_cli(dry_run, grace):
+    """Delete uploads that no project, blog post or page references."""
+    if grace is not None:
+        media_gc.grace = grace * 3600
+    report = media_gc.sweep(dry_run=dry_run)
+    for c in report['candidates']:
+        if dry_run or c['path'] in report['deleted']:
+            click.echo('%s  %d bytes  %.1f days old' % (c['path'], c['size'], c['age'] / 86400.0))
+    if dry_run:
+        click.echo('%d unreferenced files (%d bytes) would be removed' % (len(report['candidates']), report['bytes']))
+    else:
+        click.echo('%d files removed (%d bytes)' % (len(report['deleted']), report['bytes']))
+
+# --------------------
+# CLI: flask --app app history log|show|restore|compact
+# --------------------
+@app.cli.group('history')
+def history_cli():
+    """Revision history of projects, blog posts and pages."""
+
+def _history_kind(kind):
+    if kind not in HISTORY_KINDS:
+        raise click.BadParameter('one of %s' % ', '.join(HISTORY_KINDS), param_hint='KIND')
+    return kind
+
+@history_cli.command('log')
+@click.argument('kind')
+@click.argument('key')
+@click.option('--limit', default=20, help='Number of revisions to list.')
+def history_log_cli(kind, key, limit):
+    """List the revisions of an entry, newest first."""
+    for r in history.revisions(_history_kind(kind), key, limit=limit):
+        click.echo('%4d  %s  v%-4s %-7s %-12s %s' % (
+            r['seq'], datetime.utcfromtimestamp(r['at']).strftime('%Y-%m-%d %H:%M'), r['version'] or '-',
+            r['action'], r['user'] or '-', r['note'] or ''))
+
+@history_cli.command('show')
+@click.argument('kind')
+@click.argument('key')
+@click.argument('seq', type=int)
+def history_show_cli(kind, key, seq):
+    """Show what revision SEQ changed."""
+    found = history.revision(_history_kind(kind), key, seq)
+    if found is None:
+        raise click.ClickException('No revision %d of %s %s' % (seq, kind, key))
+    for c in found[2]:
+        click.echo('%s:\n  - %s\n  + %s' % (c['path'], json.dumps(c['old']), json.dumps(c['new'])))
+
+@history_cli.command('restore')
+@click.argument('kind')
+@click.argument('key')
+@click.argument('seq', type=int)
+def history_restore_cli(kind, key, seq):
+    """Make revision SEQ the current version of the entry."""
+    try:
+        _, item = restore_revision(_history_kind(kind), key, seq)
+    except LookupError as e:
+        raise click.ClickException(str(e))
+    click.echo('%s %s %s' % (kind, key, 'deleted' if item is None else 'restored as version %d' % entity_version(item)))
+
+@history_cli.command('compact')
+def history_compact_cli():
+    """Apply the retention policy now."""
+    result = history.compact()
+    click.echo('%(dropped)d revisions dropped, %(rewritten)d rewritten as snapshots, '
+               '%(entries_removed)d deleted entries forgotten' % result)
+
+# --------------------
+# CLI: flask --app app auth migrate | set-password EMAIL
+# --------------------
+@app.cli.group('auth')
+def auth_cli():
+    """Editor accounts in verifier.json."""
+
+@auth_cli.command('migrate')
+def auth_migrate_cli():
+    """Replace plain-text passwords with salted hashes."""
+    click.echo('%d editors migrated' % hash_verifier_passwords())
+
+@auth_cli.command('set-password')
+@click.argument('email')
+@click.option('--user', default=None, help='Display name, when adding an editor.')
+@click.password_option()
+def auth_set_password_cli(email, user, password):
+    """Set an editor's password, adding the editor if EMAIL is new."""
+    def set_password(doc):
+        editors = doc.setdefault('editors', [])
+        found = [e for e in editors if normalize_email(e.get('email')) == normalize_email(email)]
+        if not found:
+            found = [{'user': user or email.split('@')[0], 'email': email}]
+            editors.append(found[0])
+        for e in found:
+            e.pop('password', None)
+            e['password_hash'] = hash_password(password)
+            if user:
+                e['user'] = user
+        return len(found)
+    update_verifier(set_password)
+    click.echo('password set for %s' % email)
+
+# --------------------
+# One-time data migrations, recorded in instance/migrations.json
+# --------------------
+def backfill_project_slugs():
+    # projects from before slugs were stored (previously redone on every /settings view)
+    def fill_slug(p):
+        if p.get('slug'):
+            return False
+        p['slug'] = project_slug(p)
+        return True
+    return storage.update_all('projects', fill_slug)
+
+def history_baseline():
+    # a first revision of everything that exists, so its first edit can be undone
+    posts, pages = get_posts(), get_pages()
+    changes = [('projects', p.get('id'), p) for p in posts.get('projects', ())]
+    changes += [('blog', b.get('id'), b) for b in posts.get('blog', ())]
+    changes += [('project_pages', pg.get('project_id'), pg) for pg in pages.get('project_pages', ())]
+    return history.record(changes, note='baseline')
+
+def update_verifier(fn):
+    # fn(doc) -> number of editors changed; the file is rewritten if any were
+    with file_lock(os.path.join(app.instance_path, 'verifier.lock')):
+        doc = load_json(DATA_VERIFIER)
+        changed = fn(doc)
+        if changed:
+            tmp = DATA_VERIFIER + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(doc, f, indent=2)
+            os.replace(tmp, DATA_VERIFIER)
+    return changed
+
+def hash_verifier_passwords():
+    # editors from before passwords were hashed
+    return update_verifier(migrate_editors)
+
+MIGRATIONS = [
+    ('project-slugs', backfill_project_slugs),
+    ('history-baseline', history_baseline),
+    ('verifier-hashes', hash_verifier_passwords),
+]
+
+def run_migrations():
+    path = os.path.join(app.instance_path, 'migrations.json')
+    os.makedirs(app.instance_path, exist_ok=True)
+    with file_lock(path + '.lock'):
+        done = load_json(path)
+        for name, fn in MIGRATIONS:
+            if name in done:
+                continue
+            result = fn()
+            done[name] = {'applied_at': datetime.utcnow().isoformat() + 'Z', 'result': result}
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(done, f, indent=2)
+            os.replace(tmp, path)
+            app.logger.info('migration %s applied (%r)', name, result)
+
+# --------------------
+# Background jobs
+# --------------------
+def release_media(before, after=None):
+    # uploads `before` referenced that `after` doesn't; deleted in the
+    # background after MEDIA_RELEASE_GRACE unless something uses them again
+    paths = upload_refs(before or {}) - upload_refs(after or {})
+    if paths:
+        job_queue.enqueue('delete_files', delay=app.config['MEDIA_RELEASE_GRACE'], paths=sorted(paths))
+
+@job_queue.register('delete_files')
+def delete_files_job(paths):
+    # only uploads, and only once no entry references them any more
+    media_gc.collect(paths)
+
+def schedule_media_gc():
+    if app.config['MEDIA_GC_INTERVAL']:
+        job_queue.enqueue('media_gc', delay=app.config['MEDIA_GC_INTERVAL'], job_id='media-gc')
+
+@job_queue.register('media_gc')
+def media_gc_job():
+    schedule_media_gc()
+    report = media_gc.sweep()
+    if report['deleted']:
+        app.logger.info('media gc: removed %d files (%d bytes)', len(report['deleted']), report['bytes'])
+
+def schedule_history_compaction():
+    if app.config['HISTORY_COMPACT_INTERVAL']:
+        job_queue.enqueue('history_compact', delay=app.config['HISTORY_COMPACT_INTERVAL'], job_id='history-compact')
+
+@job_queue.register('history_compact')
+def history_compact_job():
+    schedule_history_compaction()
+    result = history.compact()
+    if result['dropped']:
+        app.logger.info('history: dropped %d old revisions', result['dropped'])
+    pruned = storage.prune_tombstones()
+    if pruned:
+        app.logger.info('storage: pruned %d tombstones', pruned)
+
+@job_queue.register('image_derivatives')
+def image_derivatives_job(src):
+    info = image_pipeline.process(src)
+    if info:
+        attach_srcset(src, info)
+
+def lead_written(leads):
+    # runs on the lead writer thread once a batch is on disk
+    if app.config.get('LEAD_WEBHOOK_URL'):
+        for lead in leads:
+            job_queue.enqueue('lead_webhook', lead=lead)
+
+lead_journal = LeadJournal(app.config['LEADS_FILE'], flush_interval=app.config['LEADS_FLUSH_INTERVAL'],
+                           on_write=lead_written)
+atexit.register(lead_journal.flush, 5)
+
+def save_lead(kind, email, name=None, message=None):
+    # queued for the next batch; returns None for a duplicate, raises LeadError when invalid
+    return lead_journal.submit(kind, email, name=name, message=message)
+
+@job_queue.register('save_lead')
+def save_lead_job(lead):
+    # leads queued as jobs before the journal existed
+    try:
+        lead_journal.submit(lead.get('type', 'contact'), lead.get('email'), lead.get('name'), lead.get('message'),
+                            received_at=lead.get('received_at'))
+    except LeadError as e:
+        app.logger.warning('leads: dropping queued lead: %s', e)
+    lead_journal.flush()
+
+@job_queue.register('lead_webhook')
+def lead_webhook_job(lead):
+    req = urllib.request.Request(app.config['LEAD_WEBHOOK_URL'], data=json.dumps(lead).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'})
+    urllib.request.urlopen(req, timeout=10).close()
+
+run_migrations()
+job_queue.start()
+schedule_media_gc()
+schedule_history_compaction()
+schedule_snapshot()
+schedule_feeds()
+
+# --------------------
+# Static export: flask --app app export
+# --------------------
+exporter = SiteExporter('static', app.config['EXPORT_DIR'])
+_export_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export')
+_export_pending = threading.Event()
+
+def _assets_version():
+    # any change to the shared css/js re-renders every page (hashed names change)
+    return content.get(ASSET_MANIFEST)
+
+def _fingerprint(*parts):
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+def export_pages():
+    # (output path, fingerprint, render) for every public page
+    assets = _assets_version()
+    idx = get_index()
+
+    def render_home(projects, blog):
+        with app.test_request_context('/'):
+            return render_template('index.html', projects=projects, blog=blog, hero_images=HERO_IMAGES)
+
+    projects, blog = published_projects(), published_blog()
+    home_fp = _fingerprint([(p.get('id'), p.get('updated_at'), p.get('slug')) for p in projects],
+                           [(b.get('id'), b.get('updated_at')) for b in blog],
+                           template_version(HOME_TEMPLATE), assets, site_url(), HERO_IMAGES)
+    yield 'index.html', home_fp, lambda: render_home(projects, blog)
+
+    project_template = template_version(PROJECT_TEMPLATE)
+    for project in projects:
+        page = idx.page_for_project(project.get('id'))
+        slugs = [project.get('slug')]
+        link_slug = slugify(project.get('link')) if project.get('link') else ''
+        if link_slug and link_slug not in slugs:
+            slugs.append(link_slug)
+        for slug in slugs:
+            owner = idx.project_by_slug(slug)
+            if not slug or not owner or owner.get('id') != project.get('id'):
+                continue
+            # same key the live route uses for its ETag / render cache
+            key = page_cache.make_key(slug, page, project, project_template)
+
+            def render(project=project, page=page, slug=slug):
+                with app.test_request_context('/projects/%s.html' % slug):
+                    return render_template('project_page.html', **project_page_context(project, page))
+            yield 'projects/%s.html' % slug, _fingerprint(key, assets), render
+
+def export_site(full=False):
+    # canonicals, og: tags and feeds need an absolute base that isn't a guess
+    if not site_url():
+        raise ValueError('SITE_URL must be set for a static export')
+    posts = get_posts()
+    public_posts = {'projects': list(published_projects()), 'blog': list(published_blog())}
+    for k, v in posts.items():
+        if k not in public_posts:
+            public_posts[k] = v
+    data = json.dumps(public_posts, indent=2).encode('utf-8')
+    data_files = [('static/data/posts.json', data)]
+    build_feeds()
+    for name in (site_feeds.manifest() or {}).get('files', ()):
+        with open(site_feeds.path(name), 'rb') as f:
+            data_files.append((name, f.read()))
+    return exporter.build(export_pages(), full=full,
+                          raw_dirs=('img', 'uploads', 'derived', asset_builder.out),
+                          data_files=data_files)
+
+def _export_job():
+    _export_pending.clear()
+    try:
+        export_site()
+    except Exception:
+        app.logger.exception('static export failed')
+
+def schedule_export():
+    # on-save hook; bursts of writes collapse into a single rebuild
+    if not app.config.get('EXPORT_ON_SAVE') or _export_pending.is_set():
+        return
+    _export_pending.set()
+    _export_pool.submit(_export_job)
+
+@app.cli.command('export')
+@click.option('--full', is_flag=True, help='Re-render every page, ignoring the previous export state.')
+@click.option('--out', default=None, help='Output directory (default: EXPORT_DIR).')
+def export_command(full, out):
+    """Pre-render the public site into EXPORT_DIR for nginx."""
+    if out:
+        exporter.out_dir = out
+        exporter.assets.out_dir = out
+    try:
+        result = export_site(full=full)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo('rendered %(rendered)d, unchanged %(skipped)d, removed %(removed)d' % result)
 
 # --------------------
 # Run
 # --------------------
 if __name__ == '__main__':
     # ensure pages file exists
-    if not os.path.exists(DATA_PAGES):
-        write_json(DATA_PAGES, {'project_pages': []})
+    storage.ensure_initialized()
     app.run(debug=True)
@@ -0,0 +1,569 @@
+"""Offline build of the site's CSS/JS into fingerprinted files.
+
+The pages used to compile Tailwind in the browser via the Play CDN. Here
+the utility classes are extracted from the templates and scripts and only
+those are emitted, on top of Tailwind's preflight reset, as app.css. That
+covers the subset of Tailwind (v3 default theme) this site uses: spacing,
+sizing, layout, flex/grid, typography, colours incl. arbitrary [#hex]
+values, borders, shadows, rings and transitions, with sm/md/lg and
+hover/focus variants. Unknown tokens are simply not emitted.
+
+AssetBuilder writes every bundle as static/dist/<name>.<hash>.<ext> with
+.gz/.br siblings and a manifest mapping the original static filename to
+the hashed one, so url_for('static', filename='styles.css') can resolve to
+the fingerprinted copy.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+
+from export import write_compressed
+
+# ---------------------------------------------------------------------------
+# Tailwind theme (v3 defaults, trimmed to the scales that make sense here)
+# ---------------------------------------------------------------------------
+SPACING = {
+    '0': '0px', 'px': '1px', '0.5': '0.125rem', '1': '0.25rem', '1.5': '0.375rem', '2': '0.5rem',
+    '2.5': '0.625rem', '3': '0.75rem', '3.5': '0.875rem', '4': '1rem', '5': '1.25rem', '6': '1.5rem',
+    '7': '1.75rem', '8': '2rem', '9': '2.25rem', '10': '2.5rem', '11': '2.75rem', '12': '3rem',
+    '14': '3.5rem', '16': '4rem', '20': '5rem', '24': '6rem', '28': '7rem', '32': '8rem', '36': '9rem',
+    '40': '10rem', '44': '11rem', '48': '12rem', '52': '13rem', '56': '14rem', '60': '15rem',
+    '64': '16rem', '72': '18rem', '80': '20rem', '96': '24rem',
+}
+
+PALETTE = {
+    'gray': ['#f9fafb', '#f3f4f6', '#e5e7eb', '#d1d5db', '#9ca3af', '#6b7280', '#4b5563', '#374151', '#1f2937', '#111827'],
+    'red': ['#fef2f2', '#fee2e2', '#fecaca', '#fca5a5', '#f87171', '#ef4444', '#dc2626', '#b91c1c', '#991b1b', '#7f1d1d'],
+    'orange': ['#fff7ed', '#ffedd5', '#fed7aa', '#fdba74', '#fb923c', '#f97316', '#ea580c', '#c2410c', '#9a3412', '#7c2d12'],
+    'yellow': ['#fefce8', '#fef9c3', '#fef08a', '#fde047', '#facc15', '#eab308', '#ca8a04', '#a16207', '#854d0e', '#713f12'],
+    'green': ['#f0fdf4', '#dcfce7', '#bbf7d0', '#86efac', '#4ade80', '#22c55e', '#16a34a', '#15803d', '#166534', '#14532d'],
+    'blue': ['#eff6ff', '#dbeafe', '#bfdbfe', '#93c5fd', '#60a5fa', '#3b82f6', '#2563eb', '#1d4ed8', '#1e40af', '#1e3a8a'],
+}
+SHADES = ('50', '100', '200', '300', '400', '500', '600', '700', '800', '900')
+
+FONT_SIZE = {
+    'xs': ('0.75rem', '1rem'), 'sm': ('0.875rem', '1.25rem'), 'base': ('1rem', '1.5rem'),
+    'lg': ('1.125rem', '1.75rem'), 'xl': ('1.25rem', '1.75rem'), '2xl': ('1.5rem', '2rem'),
+    '3xl': ('1.875rem', '2.25rem'), '4xl': ('2.25rem', '2.5rem'), '5xl': ('3rem', '1'), '6xl': ('3.75rem', '1'),
+}
+FONT_WEIGHT = {'light': '300', 'normal': '400', 'medium': '500', 'semibold': '600', 'bold': '700', 'extrabold': '800'}
+MAX_WIDTH = {
+    'xs': '20rem', 'sm': '24rem', 'md': '28rem', 'lg': '32rem', 'xl': '36rem', '2xl': '42rem', '3xl': '48rem',
+    '4xl': '56rem', '5xl': '64rem', '6xl': '72rem', '7xl': '80rem', 'full': '100%', 'none': 'none',
+}
+RADIUS = {'': '0.25rem', 'none': '0px', 'sm': '0.125rem', 'md': '0.375rem', 'lg': '0.5rem', 'xl': '0.75rem',
+          '2xl': '1rem', 'full': '9999px'}
+SHADOW = {
+    'sm': ('0 1px 2px 0 rgb(0 0 0 / 0.05)', '0 1px 2px 0 var(--tw-shadow-color)'),
+    '': ('0 1px 3px 0 rgb(0 0 0 / 0.1), 0 1px 2px -1px rgb(0 0 0 / 0.1)',
+         '0 1px 3px 0 var(--tw-shadow-color), 0 1px 2px -1px var(--tw-shadow-color)'),
+    'md': ('0 4px 6px -1px rgb(0 0 0 / 0.1), 0 2px 4px -2px rgb(0 0 0 / 0.1)',
+           '0 4px 6px -1px var(--tw-shadow-color), 0 2px 4px -2px var(--tw-shadow-color)'),
+    'lg': ('0 10px 15px -3px rgb(0 0 0 / 0.1), 0 4px 6px -4px rgb(0 0 0 / 0.1)',
+           '0 10px 15px -3px var(--tw-shadow-color), 0 4px 6px -4px var(--tw-shadow-color)'),
+    'xl': ('0 20px 25px -5px rgb(0 0 0 / 0.1), 0 8px 10px -6px rgb(0 0 0 / 0.1)',
+           '0 20px 25px -5px var(--tw-shadow-color), 0 8px 10px -6px var(--tw-shadow-color)'),
+    'none': ('0 0 #0000', '0 0 #0000'),
+}
+SCREENS = (('sm', '640px'), ('md', '768px'), ('lg', '1024px'), ('xl', '1280px'), ('2xl', '1536px'))
+PSEUDO = {'hover': ':hover', 'focus': ':focus', 'active': ':active', 'first': ':first-child', 'last': ':last-child'}
+DISPLAY = {'block': 'block', 'inline-block': 'inline-block', 'inline': 'inline', 'flex': 'flex',
+           'inline-flex': 'inline-flex', 'grid': 'grid', 'contents': 'contents', 'hidden': 'none'}
+POSITION = ('static', 'fixed', 'absolute', 'relative', 'sticky')
+TRANSITION = {
+    '': 'color, background-color, border-color, text-decoration-color, fill, stroke, opacity, box-shadow, '
+        'transform, filter, backdrop-filter',
+    'all': 'all',
+    'colors': 'color, background-color, border-color, text-decoration-color, fill, stroke',
+    'opacity': 'opacity',
+    'transform': 'transform',
+}
+EASE = 'cubic-bezier(0.4, 0, 0.2, 1)'
+
+PREFLIGHT = """*,::before,::after{box-sizing:border-box;border-width:0;border-style:solid;border-color:#e5e7eb}
+::before,::after{--tw-content:''}
+html,:host{line-height:1.5;-webkit-text-size-adjust:100%;-moz-tab-size:4;tab-size:4;font-family:ui-sans-serif,system-ui,sans-serif,"Apple Color Emoji","Segoe UI Emoji","Segoe UI Symbol","Noto Color Emoji";font-feature-settings:normal;font-variation-settings:normal;-webkit-tap-highlight-color:transparent}
+body{margin:0;line-height:inherit}
+hr{height:0;color:inherit;border-top-width:1px}
+abbr:where([title]){text-decoration:underline dotted}
+h1,h2,h3,h4,h5,h6{font-size:inherit;font-weight:inherit}
+a{color:inherit;text-decoration:inherit}
+b,strong{font-weight:bolder}
+code,kbd,samp,pre{font-family:ui-monospace,SFMono-Regular,Menlo,Monaco,Consolas,"Liberation Mono","Courier New",monospace;font-size:1em}
+small{font-size:80%}
+sub,sup{font-size:75%;line-height:0;position:relative;vertical-align:baseline}
+sub{bottom:-0.25em}
+sup{top:-0.5em}
+table{text-indent:0;border-color:inherit;border-collapse:collapse}
+button,input,optgroup,select,textarea{font-family:inherit;font-feature-settings:inherit;font-variation-settings:inherit;font-size:100%;font-weight:inherit;line-height:inherit;letter-spacing:inherit;color:inherit;margin:0;padding:0}
+button,select{text-transform:none}
+button,input:where([type='button']),input:where([type='reset']),input:where([type='submit']){-webkit-appearance:button;background-color:transparent;background-image:none}
+:-moz-focusring{outline:auto}
+:-moz-ui-invalid{box-shadow:none}
+progress{vertical-align:baseline}
+::-webkit-inner-spin-button,::-webkit-outer-spin-button{height:auto}
+[type='search']{-webkit-appearance:textfield;outline-offset:-2px}
+::-webkit-search-decoration{-webkit-appearance:none}
+::-webkit-file-upload-button{-webkit-appearance:button;font:inherit}
+summary{display:list-item}
+blockquote,dl,dd,h1,h2,h3,h4,h5,h6,hr,figure,p,pre{margin:0}
+fieldset{margin:0;padding:0}
+legend{padding:0}
+ol,ul,menu{list-style:none;margin:0;padding:0}
+dialog{padding:0}
+textarea{resize:vertical}
+input::placeholder,textarea::placeholder{opacity:1;color:#9ca3af}
+button,[role="button"]{cursor:pointer}
+:disabled{cursor:default}
+img,svg,video,canvas,audio,iframe,embed,object{display:block;vertical-align:middle}
+img,video{max-width:100%;height:auto}
+[hidden]{display:none}
+*,::before,::after{--tw-translate-x:0;--tw-translate-y:0;--tw-ring-inset: ;--tw-ring-offset-width:0px;--tw-ring-offset-color:#fff;--tw-ring-color:rgb(59 130 246 / 0.5);--tw-ring-offset-shadow:0 0 #0000;--tw-ring-shadow:0 0 #0000;--tw-shadow:0 0 #0000;--tw-shadow-colored:0 0 #0000;--tw-scroll-snap-strictness:proximity}
+"""
+
+# candidate class names: anything that looks like a utility, wherever it is
+# (class attributes, JS string literals, template expressions)
+CANDIDATE = re.compile(r'[A-Za-z0-9_:/.\[\]#%-]*[A-Za-z0-9\]%]')
+
+
+def extract_candidates(text):
+    return set(CANDIDATE.findall(text))
+
+
+def escape_class(name):
+    out = []
+    for i, ch in enumerate(name):
+        if ch.isalnum() and not (i == 0 and ch.isdigit()) or ch in '-_':
+            out.append(ch)
+        else:
+            out.append('\\' + ch)
+    return ''.join(out)
+
+
+def _arbitrary(v):
+    if v.startswith('[') and v.endswith(']') and len(v) > 2:
+        return v[1:-1].replace('_', ' ')
+    return None
+
+
+def _fraction(v):
+    m = re.match(r'^(\d+)/(\d+)$', v)
+    if m and int(m.group(2)):
+        pct = 100.0 * int(m.group(1)) / int(m.group(2))
+        return ('%.6f' % pct).rstrip('0').rstrip('.') + '%'
+    return None
+
+
+def _spacing(v, extra=None):
+    if extra and v in extra:
+        return extra[v]
+    return SPACING.get(v) or _arbitrary(v)
+
+
+def _length(v, extra=None):
+    return _spacing(v, extra) or _fraction(v)
+
+
+def _rgb(hex_color):
+    h = hex_color.lstrip('#')
+    if len(h) in (3, 4):
+        h = ''.join(c * 2 for c in h)
+    if len(h) not in (6, 8) or not all(c in '0123456789abcdefABCDEF' for c in h):
+        return None
+    r, g, b = int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16)
+    alpha = int(h[6:8], 16) / 255.0 if len(h) == 8 else None
+    return r, g, b, alpha
+
+
+def _color(v, opacity_var):
+    """Declarations for a colour token, Tailwind style (opacity via CSS var)."""
+    if v in ('transparent', 'current', 'inherit'):
+        return {'transparent': 'transparent', 'current': 'currentColor', 'inherit': 'inherit'}[v], None
+    if v == 'black':
+        hex_color = '#000000'
+    elif v == 'white':
+        hex_color = '#ffffff'
+    elif '-' in v and v.rsplit('-', 1)[0] in PALETTE and v.rsplit('-', 1)[1] in SHADES:
+        name, shade = v.rsplit('-', 1)
+        hex_color = PALETTE[name][SHADES.index(shade)]
+    else:
+        arb = _arbitrary(v)
+        if not arb or not arb.startswith('#'):
+            return None
+        hex_color = arb
+    rgb = _rgb(hex_color)
+    if rgb is None:
+        return None
+    r, g, b, alpha = rgb
+    if alpha is not None:
+        return 'rgb(%d %d %d / %s)' % (r, g, b, ('%.3f' % alpha).rstrip('0').rstrip('.')), None
+    return 'rgb(%d %d %d / var(%s))' % (r, g, b, opacity_var), opacity_var
+
+
+def _color_decl(prop, v, opacity_var):
+    c = _color(v, opacity_var)
+    if c is None:
+        return None
+    value, var = c
+    return '%s:1;%s:%s' % (var, prop, value) if var else '%s:%s' % (prop, value)
+
+
+def _sides(prefix, props):
+    # p/px/py/pt.. m/mx/my/mt.. -> (group suffix, [properties])
+    return {
+        prefix: ('all', props),
+        prefix + 'x': ('axis', [props[0] + '-left', props[0] + '-right']),
+        prefix + 'y': ('axis', [props[0] + '-top', props[0] + '-bottom']),
+        prefix + 't': ('side', [props[0] + '-top']),
+        prefix + 'r': ('side', [props[0] + '-right']),
+        prefix + 'b': ('side', [props[0] + '-bottom']),
+        prefix + 'l': ('side', [props[0] + '-left']),
+    }
+
+
+MARGIN = _sides('m', ['margin'])
+PADDING = _sides('p', ['padding'])
+INSET = {
+    'inset': ('all', ['inset']),
+    'inset-x': ('axis', ['left', 'right']),
+    'inset-y': ('axis', ['top', 'bottom']),
+    'top': ('side', ['top']), 'right': ('side', ['right']),
+    'bottom': ('side', ['bottom']), 'left': ('side', ['left']),
+}
+
+# emitted in this order, like Tailwind's core plugin order, so e.g. `hidden`
+# beats `flex` and `mt-4` beats `m-0`
+GROUPS = [
+    'position', 'inset-all', 'inset-axis', 'inset-side', 'z-index', 'grid-column',
+    'margin-all', 'margin-axis', 'margin-side', 'display', 'height', 'width', 'min-width', 'max-width',
+    'flex', 'flex-basis', 'transform', 'scroll-snap-type', 'grid-template-columns', 'flex-direction',
+    'flex-wrap', 'align-items', 'justify-content', 'gap', 'space', 'overflow', 'scroll-behavior',
+    'border-radius', 'border-width', 'border-color', 'background-color', 'background-opacity',
+    'object-fit', 'padding-all', 'padding-axis', 'padding-side', 'text-align', 'font-size', 'font-weight',
+    'text-color', 'text-opacity', 'text-decoration', 'opacity', 'box-shadow', 'outline', 'ring-width',
+    'ring-color', 'transition', 'duration',
+]
+
+
+def parse_utility(name):
+    """(group, declarations, selector suffix) for a bare utility, or None."""
+    neg = name.startswith('-')
+    u = name[1:] if neg else name
+
+    def signed(v):
+        return '-' + v if neg and v not in ('0px', 'auto') else v
+
+    if u in POSITION and not neg:
+        return 'position', 'position:%s' % u, ''
+    if u in DISPLAY and not neg:
+        return 'display', 'display:%s' % DISPLAY[u], ''
+
+    for prefix in sorted(INSET, key=len, reverse=True):
+        if u.startswith(prefix + '-'):
+            v = _length(u[len(prefix) + 1:], {'auto': 'auto', 'full': '100%'})
+            if v:
+                kind, props = INSET[prefix]
+                return 'inset-' + kind, ';'.join('%s:%s' % (p, signed(v)) for p in props), ''
+    for table, group in ((MARGIN, 'margin'), (PADDING, 'padding')):
+        head, _, v = u.partition('-')
+        if head in table and v:
+            if group == 'padding' and neg:
+                return None
+            value = _spacing(v, {'auto': 'auto'} if group == 'margin' else None)
+            if value:
+                kind, props = table[head]
+                return '%s-%s' % (group, kind), ';'.join('%s:%s' % (p, signed(value)) for p in props), ''
+    if neg and not u.startswith('translate-'):
+        return None
+
+    head, _, v = u.partition('-')
+    if head == 'z':
+        if v == 'auto' or v.isdigit():
+            return 'z-index', 'z-index:%s' % v, ''
+    elif u == 'col-span-full':
+        return 'grid-column', 'grid-column:1 / -1', ''
+    elif u.startswith('col-span-') and u[9:].isdigit():
+        n = u[9:]
+        return 'grid-column', 'grid-column:span %s / span %s' % (n, n), ''
+    elif head in ('h', 'w'):
+        value = _length(v, {'auto': 'auto', 'full': '100%', 'screen': '100vw' if head == 'w' else '100vh',
+                            'fit': 'fit-content', 'min': 'min-content', 'max': 'max-content'})
+        if value:
+            return ('height' if head == 'h' else 'width'), '%s:%s' % ('height' if head == 'h' else 'width', value), ''
+    elif u.startswith('min-w-'):
+        value = _arbitrary(u[6:]) or {'0': '0px', 'full': '100%', 'min': 'min-content', 'max': 'max-content'}.get(u[6:])
+        if value:
+            return 'min-width', 'min-width:%s' % value, ''
+    elif u.startswith('max-w-'):
+        value = MAX_WIDTH.get(u[6:]) or _arbitrary(u[6:])
+        if value:
+            return 'max-width', 'max-width:%s' % value, ''
+    elif u in ('flex-1', 'flex-auto', 'flex-none', 'flex-initial'):
+        return 'flex', 'flex:%s' % {'flex-1': '1 1 0%', 'flex-auto': '1 1 auto', 'flex-none': 'none',
+                                    'flex-initial': '0 1 auto'}[u], ''
+    elif head == 'basis':
+        value = _length(v, {'auto': 'auto', 'full': '100%'})
+        if value:
+            return 'flex-basis', 'flex-basis:%s' % value, ''
+    elif u.startswith('translate-x-') or u.startswith('translate-y-'):
+        axis = u[10]
+        value = _length(u[12:], {'full': '100%'})
+        if value:
+            return 'transform', ('--tw-translate-%s:%s;transform:translate(var(--tw-translate-x), var(--tw-translate-y))'
+                                 % (axis, signed(value))), ''
+    elif u == 'snap-x' or u == 'snap-y':
+        return 'scroll-snap-type', 'scroll-snap-type:%s var(--tw-scroll-snap-strictness)' % u[5], ''
+    elif u in ('snap-mandatory', 'snap-proximity'):
+        return 'scroll-snap-type', '--tw-scroll-snap-strictness:%s' % u[5:], ''
+    elif u.startswith('grid-cols-'):
+        n = u[10:]
+        if n.isdigit():
+            return 'grid-template-columns', 'grid-template-columns:repeat(%s, minmax(0, 1fr))' % n, ''
+    elif u in ('flex-row', 'flex-col', 'flex-row-reverse', 'flex-col-reverse'):
+        return 'flex-direction', 'flex-direction:%s' % u[5:].replace('col', 'column'), ''
+    elif u in ('flex-wrap', 'flex-nowrap'):
+        return 'flex-wrap', 'flex-wrap:%s' % u[5:], ''
+    elif head == 'items' and v in ('start', 'end', 'center', 'baseline', 'stretch'):
+        return 'align-items', 'align-items:%s' % ('flex-' + v if v in ('start', 'end') else v), ''
+    elif head == 'justify' and v in ('start', 'end', 'center', 'between', 'around', 'evenly'):
+        value = {'start': 'flex-start', 'end': 'flex-end', 'between': 'space-between',
+                 'around': 'space-around', 'evenly': 'space-evenly'}.get(v, v)
+        return 'justify-content', 'justify-content:%s' % value, ''
+    elif head == 'gap':
+        if v.startswith('x-') or v.startswith('y-'):
+            value = _spacing(v[2:])
+            if value:
+                return 'gap', '%s-gap:%s' % ('column' if v[0] == 'x' else 'row', value), ''
+        value = _spacing(v)
+        if value:
+            return 'gap', 'gap:%s' % value, ''
+    elif u.startswith('space-x-') or u.startswith('space-y-'):
+        value = _spacing(u[8:])
+        if value:
+            prop = 'margin-left' if u[6] == 'x' else 'margin-top'
+            return 'space', '%s:%s' % (prop, value), ' > :not([hidden]) ~ :not([hidden])'
+    elif head == 'overflow' and v.split('-')[-1] in ('auto', 'hidden', 'visible', 'scroll'):
+        if v.startswith('x-') or v.startswith('y-'):
+            return 'overflow', 'overflow-%s:%s' % (v[0], v[2:]), ''
+        return 'overflow', 'overflow:%s' % v, ''
+    elif u in ('scroll-smooth', 'scroll-auto'):
+        return 'scroll-behavior', 'scroll-behavior:%s' % v, ''
+    elif head == 'rounded' and v in RADIUS:
+        return 'border-radius', 'border-radius:%s' % RADIUS[v], ''
+    elif head == 'border':
+        if v == '' or v in ('0', '2', '4', '8'):
+            return 'border-width', 'border-width:%spx' % (v or '1'), ''
+        decl = _color_decl('border-color', v, '--tw-border-opacity')
+        if decl:
+            return 'border-color', decl, ''
+    elif head == 'bg':
+        if v.startswith('opacity-') and v[8:].isdigit():
+            return 'background-opacity', '--tw-bg-opacity:%s' % _opacity(v[8:]), ''
+        decl = _color_decl('background-color', v, '--tw-bg-opacity')
+        if decl:
+            return 'background-color', decl, ''
+    elif head == 'object' and v in ('cover', 'contain', 'fill', 'none'):
+        return 'object-fit', 'object-fit:%s' % v, ''
+    elif head == 'text':
+        if v in ('left', 'center', 'right', 'justify'):
+            return 'text-align', 'text-align:%s' % v, ''
+        if v in FONT_SIZE:
+            return 'font-size', 'font-size:%s;line-height:%s' % FONT_SIZE[v], ''
+        if v.startswith('opacity-') and v[8:].isdigit():
+            return 'text-opacity', '--tw-text-opacity:%s' % _opacity(v[8:]), ''
+        decl = _color_decl('color', v, '--tw-text-opacity')
+        if decl:
+            return 'text-color', decl, ''
+    elif head == 'font' and v in FONT_WEIGHT:
+        return 'font-weight', 'font-weight:%s' % FONT_WEIGHT[v], ''
+    elif u in ('underline', 'no-underline', 'line-through'):
+        return 'text-decoration', 'text-decoration-line:%s' % ('none' if u == 'no-underline' else u), ''
+    elif head == 'opacity' and v.isdigit():
+        return 'opacity', 'opacity:%s' % _opacity(v), ''
+    elif head == 'shadow' and v in SHADOW:
+        shadow, colored = SHADOW[v]
+        return 'box-shadow', ('--tw-shadow:%s;--tw-shadow-colored:%s;box-shadow:var(--tw-ring-offset-shadow, 0 0 #0000), '
+                              'var(--tw-ring-shadow, 0 0 #0000), var(--tw-shadow)' % (shadow, colored)), ''
+    elif u == 'outline-none':
+        return 'outline', 'outline:2px solid transparent;outline-offset:2px', ''
+    elif head == 'ring':
+        if v == '' or v in ('0', '1', '2', '4', '8'):
+            return 'ring-width', ('--tw-ring-offset-shadow:var(--tw-ring-inset) 0 0 0 var(--tw-ring-offset-width) '
+                                  'var(--tw-ring-offset-color);--tw-ring-shadow:var(--tw-ring-inset) 0 0 0 '
+                                  'calc(%spx + var(--tw-ring-offset-width)) var(--tw-ring-color);box-shadow:'
+                                  'var(--tw-ring-offset-shadow), var(--tw-ring-shadow), var(--tw-shadow, 0 0 #0000)'
+                                  % (v or '3')), ''
+        decl = _color_decl('--tw-ring-color', v, '--tw-ring-opacity')
+        if decl:
+            return 'ring-color', decl, ''
+    elif head == 'transition' and v in TRANSITION:
+        return 'transition', ('transition-property:%s;transition-timing-function:%s;transition-duration:150ms'
+                              % (TRANSITION[v], EASE)), ''
+    elif head == 'duration' and v.isdigit():
+        return 'duration', 'transition-duration:%sms' % v, ''
+    return None
+
+
+def _opacity(v):
+    return ('%.2f' % (int(v) / 100.0)).rstrip('0').rstrip('.') or '0'
+
+
+def parse_class(token):
+    """(screen or None, pseudo selector, group, declarations, suffix) or None."""
+    parts = token.split(':')
+    utility, variants = parts[-1], parts[:-1]
+    screen, pseudo = None, ''
+    screens = dict(SCREENS)
+    for v in variants:
+        if v in screens and screen is None and not pseudo:
+            screen = v
+        elif v in PSEUDO:
+            pseudo += PSEUDO[v]
+        else:
+            return None
+    parsed = parse_utility(utility)
+    if parsed is None:
+        return None
+    group, decls, suffix = parsed
+    return screen, pseudo, group, decls, suffix
+
+
+def utility_css(candidates):
+    rules = []
+    for token in candidates:
+        parsed = parse_class(token)
+        if parsed:
+            rules.append((token,) + parsed)
+    order = {g: i for i, g in enumerate(GROUPS)}
+    screen_order = [None] + [s for s, _ in SCREENS]
+
+    def sort_key(rule):
+        token, screen, pseudo, group = rule[:4]
+        return (screen_order.index(screen), bool(pseudo), order[group], token)
+
+    out = []
+    current_screen = None
+    for token, screen, pseudo, group, decls, suffix in sorted(rules, key=sort_key):
+        if screen != current_screen:
+            if current_screen is not None:
+                out.append('}')
+            out.append('@media (min-width:%s){' % dict(SCREENS)[screen])
+            current_screen = screen
+        out.append('.%s%s%s{%s}' % (escape_class(token), pseudo, suffix, decls))
+    if current_screen is not None:
+        out.append('}')
+    return '\n'.join(out) + '\n'
+
+
+# ---------------------------------------------------------------------------
+# minification
+# ---------------------------------------------------------------------------
+_CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/)', re.S)
+
+
+def minify_css(css):
+    # conservative: drop comments and whitespace around punctuation, but
+    # never touch strings or the space in descendant selectors
+    out = []
+    for i, part in enumerate(_CSS_TOKENS.split(css)):
+        if i % 2:
+            if not part.startswith('/*'):
+                out.append(part)
+            continue
+        part = re.sub(r'\s+', ' ', part)
+        part = re.sub(r'\s*([{};,>])\s*', r'\1', part)
+        part = part.replace(';}', '}')
+        out.append(part)
+    return ''.join(out).strip()
+
+
+# ---------------------------------------------------------------------------
+# build
+# ---------------------------------------------------------------------------
+class AssetBuilder(object):
+    """Builds fingerprinted bundles into <static>/dist plus manifest.json.
+
+    bundles maps the logical static filename (what templates pass to
+    url_for) to either a source path under static/ or a callable returning
+    the bundle text.
+    """
+
+    def __init__(self, static_dir, bundles, scan_globs, out='dist'):
+        self.static_dir = static_dir
+        self.bundles = bundles
+        self.scan_globs = scan_globs
+        self.out = out
+        self.manifest_path = os.path.join(static_dir, out, 'manifest.json')
+
+    def sources(self):
+        files = []
+        for pattern in self.scan_globs:
+            files.extend(glob.glob(pattern))
+        for src in self.bundles.values():
+            if isinstance(src, str):
+                files.append(os.path.join(self.static_dir, src))
+        files.append(__file__)
+        return sorted(set(files))
+
+    def is_stale(self):
+        try:
+            built = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return True
+        return any(os.path.getmtime(f) > built for f in self.sources() if os.path.exists(f))
+
+    def candidates(self):
+        found = set()
+        for pattern in self.scan_globs:
+            for path in glob.glob(pattern):
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    found |= extract_candidates(f.read())
+        return found
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def build(self):
+        """Write every bundle; returns the new manifest."""
+        previous = self.load_manifest()
+        manifest = {}
+        for name, src in sorted(self.bundles.items()):
+            if callable(src):
+                data = src()
+            else:
+                with open(os.path.join(self.static_dir, src), 'r', encoding='utf-8') as f:
+                    data = f.read()
+                if name.endswith('.css'):
+                    data = minify_css(data)
+            body = data.encode('utf-8')
+            stem, ext = os.path.splitext(name)
+            hashed = '%s/%s.%s%s' % (self.out, stem, hashlib.sha256(body).hexdigest()[:12], ext)
+            target = os.path.join(self.static_dir, hashed)
+            if not os.path.exists(target):
+                write_compressed(target, body)
+            manifest[name] = hashed
+
+        # keep the previous build's files for pages still cached by clients
+        keep = set(manifest.values()) | set(previous.values())
+        out_dir = os.path.join(self.static_dir, self.out)
+        for base, _, files in os.walk(out_dir):
+            for fn in files:
+                rel = os.path.relpath(os.path.join(base, fn), self.static_dir).replace(os.sep, '/')
+                if fn == 'manifest.json' or re.sub(r'\.(gz|br)$', '', rel) in keep:
+                    continue
+                os.remove(os.path.join(base, fn))
+
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+        return manifest
+
+    def tailwind_css(self):
+        return PREFLIGHT + utility_css(self.candidates())
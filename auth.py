@@ -0,0 +1,180 @@
+"""Editor logins for /verifier.
+
+verifier.json lists the editors ({"user", "email", "password_hash"}). The
+app indexes it by email once per version of the file (content.derived),
+so a login is a dict lookup rather than a scan of the file.
+
+Passwords are stored as salted scrypt hashes (werkzeug.security). Entries
+still carrying a plain "password" keep working until `flask auth migrate`
+rewrites the file with hashes. Checking a hash costs tens of milliseconds
+of CPU by design, so it runs on a small dedicated pool with a bounded
+queue: a flood of attempts is turned away with "busy" instead of tying up
+the threads that serve the public pages. Unknown emails are checked
+against a dummy hash so they take as long as wrong passwords.
+
+Attempts are throttled before any hashing, with token buckets per client
+address and per (account, client address): each attempt takes a token,
+tokens come back at a fixed rate, and a successful login refills the
+account's bucket for that address. The account buckets are per address so
+that someone who knows an editor's email cannot lock them out from
+elsewhere. The client address must be the real one, so the app trusts
+X-Forwarded-For only from a configured number of proxies (PROXY_HOPS).
+"""
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+HASH_METHOD = 'scrypt'
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=HASH_METHOD)
+
+
+def index_editors(doc):
+    """{normalized email: editor} for a verifier.json document; the first entry wins."""
+    found = {}
+    for editor in (doc or {}).get('editors', []):
+        email = normalize_email(editor.get('email'))
+        if email:
+            found.setdefault(email, editor)
+    return found
+
+
+def migrate_editors(doc):
+    """Replace plain passwords with hashes in place; returns how many changed."""
+    changed = 0
+    for editor in (doc or {}).get('editors', []):
+        if editor.get('password') is not None:
+            if not editor.get('password_hash'):
+                editor['password_hash'] = hash_password(editor['password'])
+            del editor['password']
+            changed += 1
+    return changed
+
+
+class TokenBuckets(object):
+    """`capacity` attempts per key, refilled at `rate` per second."""
+
+    def __init__(self, capacity, rate, max_keys=10000):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()   # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, now):
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = [self.capacity, now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            b[0] = min(self.capacity, b[0] + (now - b[1]) * self.rate)
+            b[1] = now
+            self._buckets.move_to_end(key)
+        return b
+
+    def wait(self, key, now=None):
+        """Seconds until `key` has a token (0 if it has one now)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            b = self._bucket(key, now)
+            return 0 if b[0] >= 1 else (1 - b[0]) / self.rate
+
+    def take(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            b = self._bucket(key, now)
+            b[0] = max(0.0, b[0] - 1)
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class EditorAuth(object):
+
+    def __init__(self, editors, workers=2, max_pending=8, timeout=10,
+                 ip_burst=10, ip_per_minute=10, account_burst=5, account_per_minute=5):
+        self.editors = editors          # fn() -> {email: editor}
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.by_ip = TokenBuckets(ip_burst, ip_per_minute / 60.0)
+        self.by_account = TokenBuckets(account_burst, account_per_minute / 60.0)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auth')
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._dummy = hash_password('not a password')
+        self.results = {'ok': 0, 'failed': 0, 'throttled': 0, 'busy': 0}
+
+    def _check(self, editor, password):
+        if editor is None:
+            check_password_hash(self._dummy, password)
+            return False
+        if editor.get('password_hash'):
+            try:
+                return check_password_hash(editor['password_hash'], password)
+            except ValueError:   # unknown hash method
+                return False
+        # not migrated yet
+        plain = editor.get('password')
+        return plain is not None and hmac.compare_digest(str(plain).encode('utf-8'), password.encode('utf-8'))
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _verify(self, editor, password):
+        # None when the pool is backed up; a check that timed out still
+        # counts as pending until it finishes
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+        future = self._pool.submit(self._check, editor, password)
+        future.add_done_callback(self._release)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            return None
+
+    def login(self, email, password, client):
+        """(result, editor or None, retry_after): result is 'ok', 'failed', 'throttled' or 'busy'."""
+        email = normalize_email(email)
+        keys = ((self.by_ip, client), (self.by_account, (email, client)))
+        wait = max(buckets.wait(key) for buckets, key in keys)
+        if wait:
+            return self._result('throttled'), None, int(wait) + 1
+        for buckets, key in keys:
+            buckets.take(key)
+        if not email or not password:
+            return self._result('failed'), None, 0
+        editor = self.editors().get(email)
+        ok = self._verify(editor, password)
+        if ok is None:
+            return self._result('busy'), None, 1
+        if not ok:
+            return self._result('failed'), None, 0
+        self.by_account.reset((email, client))
+        return self._result('ok'), editor, 0
+
+    def _result(self, result):
+        with self._lock:
+            self.results[result] += 1
+        return result
+
+    def stats(self):
+        return dict(self.results, pending=self._pending, tracked_clients=len(self.by_ip),
+                    tracked_accounts=len(self.by_account))
@@ -0,0 +1,64 @@
+"""Compare two bench.run result files.
+
+    python -m bench.compare bench/results/BASE.json bench/results/NEW.json
+    python -m bench.compare BASE.json NEW.json --fail-over 10   # exit 1 if any p95 got >10% slower
+
+Rows are matched on (size, mode, backend, route); the change columns are
+NEW relative to BASE, so a negative latency change is an improvement.
+"""
+import argparse
+import json
+import sys
+
+FIELDS = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    rows = {}
+    for run in report['runs']:
+        for route, r in run['routes'].items():
+            rows[(run['size'], run['mode'], run['backend'], route)] = r
+    return report['meta'], rows
+
+
+def change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) * 100.0 / old
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--fail-over', type=float, default=None, metavar='PCT',
+                        help='exit 1 when a p95 regresses by more than PCT percent')
+    args = parser.parse_args(argv)
+    base_meta, base = load(args.base)
+    new_meta, new = load(args.new)
+    print('base %s%s' % ((base_meta.get('commit') or '?')[:10], ' (dirty)' if base_meta.get('dirty') else ''))
+    print('new  %s%s' % ((new_meta.get('commit') or '?')[:10], ' (dirty)' if new_meta.get('dirty') else ''))
+    print('%-7s %-6s %-6s %-15s %s' % ('size', 'mode', 'store', 'route',
+                                       '  '.join('%-22s' % f for f in FIELDS)))
+    regressed = []
+    for key in sorted(set(base) & set(new)):
+        cells = []
+        for f in FIELDS:
+            old, cur = base[key].get(f), new[key].get(f)
+            delta = change(old, cur)
+            cells.append('%-22s' % ('%s -> %s (%+.1f%%)' % (old, cur, delta) if delta is not None else '%s -> %s' % (old, cur)))
+        print('%-7s %-6s %-6s %-15s %s' % (key + ('  '.join(cells),)))
+        delta = change(base[key].get('p95_ms'), new[key].get('p95_ms'))
+        if args.fail_over is not None and delta is not None and delta > args.fail_over:
+            regressed.append('%s/%s/%s/%s p95 %+.1f%%' % (key + (delta,)))
+    for key in sorted(set(base) ^ set(new)):
+        print('only in %s: %s' % ('base' if key in base else 'new', '/'.join(str(k) for k in key)))
+    if regressed:
+        print('regressions over %.1f%%:\n  %s' % (args.fail_over, '\n  '.join(regressed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Synthetic posts.json / project_pages.json for the benchmarks.
+
+`size` is the number of projects. Every size also gets size // 4 blog
+posts (at least 3) and a page for 80% of the projects, with 3-8 sections
+each: a hero, markdown text (headings, lists, links), image/feature
+blocks and galleries of 4-12 captioned images drawn from static/img.
+The same seed always produces the same data.
+
+    python -m bench.datasets 1000 --out /tmp/plh-1k
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+from auth import hash_password
+
+WORDS = ('palm', 'villa', 'estate', 'garden', 'harbour', 'ridge', 'meadow', 'cedar', 'grove', 'lagoon',
+         'summit', 'haven', 'orchard', 'terrace', 'crest', 'spring', 'valley', 'court', 'heights', 'park')
+FILLER = ('investors', 'secure', 'plots', 'with', 'verified', 'titles', 'and', 'road', 'access', 'near',
+          'the', 'city', 'our', 'team', 'handles', 'survey', 'allocation', 'fencing', 'drainage', 'returns',
+          'annual', 'yield', 'for', 'every', 'family', 'buying', 'land', 'today', 'in', 'a', 'growing', 'area')
+IMAGES = ('static/img/palmvilla1.png', 'static/img/palmvilla2.png', 'static/img/futureresidentialestate.png',
+          'static/img/heroimage.jpeg', 'static/img/aboutimg.png', 'static/img/blog-post-1.jpg',
+          'static/img/blog-post-2.jpg', 'static/img/blog-post-3.jpg', 'static/img/blog-post-4.jpg',
+          'static/img/IRIimg1.png', 'static/img/IRIimg2.png', 'static/img/IRIimg3.png')
+EPOCH = datetime(2024, 1, 1)
+
+BENCH_USER = {'user': 'bench', 'email': 'bench@example.com', 'password': 'bench-password'}
+
+
+def sentence(rnd, words=12):
+    text = ' '.join(rnd.choice(FILLER) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def markdown(rnd):
+    parts = ['## ' + sentence(rnd, 4).rstrip('.')]
+    for _ in range(rnd.randint(2, 4)):
+        parts.append(' '.join(sentence(rnd, rnd.randint(8, 20)) for _ in range(rnd.randint(2, 5))))
+    parts.append('\n'.join('- **%s** %s' % (rnd.choice(WORDS), sentence(rnd, 6)) for _ in range(rnd.randint(3, 6))))
+    parts.append('Read more on [our site](https://example.com/%s).' % rnd.choice(WORDS))
+    return '\n\n'.join(parts)
+
+
+def stamp(rnd, i):
+    return (EPOCH + timedelta(minutes=i * 7 + rnd.randint(0, 6))).isoformat() + 'Z'
+
+
+def section(rnd, kind):
+    s = {'id': 'sec-%08x' % rnd.getrandbits(32), 'type': kind}
+    if kind == 'hero':
+        s.update(title=sentence(rnd, 4), subheader=sentence(rnd, 8), cover=rnd.choice(IMAGES), excerpt=sentence(rnd))
+    elif kind == 'text':
+        s.update(header=sentence(rnd, 4), content=markdown(rnd))
+    elif kind in ('image', 'feature'):
+        s.update(title=sentence(rnd, 4), caption=sentence(rnd, 6), cover=rnd.choice(IMAGES), text=sentence(rnd, 20))
+    else:
+        s['images'] = [{'src': rnd.choice(IMAGES), 'caption': sentence(rnd, 5)} for _ in range(rnd.randint(4, 12))]
+    return s
+
+
+def generate(size, seed=1):
+    """(posts, pages) documents for `size` projects."""
+    rnd = random.Random('%s:%s' % (seed, size))
+    projects, pages = [], []
+    for i in range(size):
+        name = '%s %s %d' % (rnd.choice(WORDS).title(), rnd.choice(WORDS).title(), i + 1)
+        slug = name.lower().replace(' ', '-')
+        created = stamp(rnd, i)
+        projects.append({
+            'id': 'proj-%d' % (i + 1), 'title': name, 'header': name, 'subheader': sentence(rnd, 8),
+            'excerpt': sentence(rnd, 16), 'cover': rnd.choice(IMAGES), 'published': rnd.random() < 0.9,
+            'is_sold': rnd.random() < 0.2, 'is_coming': rnd.random() < 0.1, 'link': '/projects/%s.html' % slug,
+            'slug': slug, 'created_at': created, 'updated_at': created,
+        })
+        if rnd.random() < 0.8:
+            kinds = ['hero'] + [rnd.choice(('text', 'text', 'gallery', 'image', 'feature'))
+                                for _ in range(rnd.randint(2, 7))]
+            pages.append({
+                'project_id': 'proj-%d' % (i + 1), 'slug': slug, 'title': name, 'excerpt': sentence(rnd, 16),
+                'sections': [section(rnd, k) for k in kinds],
+                'created_at': created, 'updated_at': created,
+            })
+    blog = []
+    for i in range(max(3, size // 4)):
+        title = sentence(rnd, 6).rstrip('.')
+        slug = '%s-%d' % ('-'.join(title.lower().split()[:4]), i + 1)
+        published = rnd.random() < 0.85
+        blog.append({
+            'id': 'blog-%d' % (i + 1), 'title': title, 'header': title, 'subheader': sentence(rnd, 6),
+            'excerpt': sentence(rnd, 18), 'cover': rnd.choice(IMAGES), 'slug': slug,
+            'tags': rnd.sample(WORDS, 2), 'published': published, 'is_event': False,
+            'status': 'published' if published else 'draft', 'link': '/blog/%s.html' % slug,
+            'created_at': stamp(rnd, i), 'updated_at': stamp(rnd, i),
+        })
+    return {'projects': projects, 'blog': blog}, {'project_pages': pages}
+
+
+def bench_editor():
+    # stored the way the app stores editors; BENCH_USER keeps the password to log in with
+    return {'user': BENCH_USER['user'], 'email': BENCH_USER['email'],
+            'password_hash': hash_password(BENCH_USER['password'])}
+
+
+def write_dataset(root, size, seed=1):
+    """Write static/data/{posts,project_pages,verifier}.json under root; returns their sizes."""
+    posts, pages = generate(size, seed)
+    data_dir = os.path.join(root, 'static', 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    sizes = {}
+    for name, doc in (('posts.json', posts), ('project_pages.json', pages),
+                      ('verifier.json', {'editors': [bench_editor()]})):
+        path = os.path.join(data_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(doc, f, indent=2)
+        sizes[name] = os.path.getsize(path)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('size', type=int)
+    parser.add_argument('--out', default='.', help='directory to write static/data/*.json into')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    for name, n in sorted(write_dataset(args.out, args.size, args.seed).items()):
+        print('%s: %d bytes' % (name, n))
+
+
+if __name__ == '__main__':
+    main()
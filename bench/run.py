@@ -0,0 +1,449 @@
+"""Benchmark the public and editor routes against synthetic datasets.
+
+    python -m bench.run                                  # 10 and 1k projects, test client
+    python -m bench.run --sizes 10,1000,10000,100000 --mode client,server
+    python -m bench.run --backend sqlite --routes project_page,save_page
+    python -m bench.compare bench/results/OLD.json bench/results/NEW.json
+
+For each size a scratch copy of the app is made under --workdir with a
+fresh dataset (bench/datasets.py), then measured in one or both modes:
+
+* client - a child process imports the app and drives the Flask test
+  client, so latencies are the app's own, without HTTP in the way;
+* server - the app runs under --workers long-lived worker processes
+  (gunicorn sync workers if gunicorn is installed, otherwise a small
+  prefork of werkzeug servers sharing one listening socket) and
+  --concurrency threads send HTTP requests.
+
+Every route gets --warmup unmeasured requests and then --requests measured
+ones. Results (throughput, p50/p95/p99/max in ms, errors and the cold
+first request) are written as JSON together with the commit they ran on.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+from datetime import datetime
+
+from bench.datasets import BENCH_USER, write_dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES = ('project_page', 'home', 'posts_json', 'save_page', 'update_project', 'upload_media')
+
+
+# ---- requests ----
+def png(n):
+    # a distinct 2x2 image per n, so uploads are not deduplicated
+    pixels = n.to_bytes(12, 'big')
+    raw = b'\x00' + pixels[:6] + b'\x00' + pixels[6:]
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 2, 2, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+class Scenarios(object):
+    """Builds (method, path, headers, body, expected statuses) per route from the dataset."""
+
+    def __init__(self, root, seed=1):
+        with open(os.path.join(root, 'static', 'data', 'posts.json'), encoding='utf-8') as f:
+            posts = json.load(f)
+        with open(os.path.join(root, 'static', 'data', 'project_pages.json'), encoding='utf-8') as f:
+            self.pages = json.load(f)['project_pages']
+        self.projects = posts['projects']
+        self.published = [p for p in self.projects if p.get('published')] or self.projects
+        self.rnd = random.Random(seed)
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def make(self, route):
+        with self._lock:
+            return getattr(self, route)()
+
+    def project_page(self):
+        return 'GET', '/projects/%s.html' % self.rnd.choice(self.published)['slug'], {}, b'', (200,)
+
+    def home(self):
+        return 'GET', '/', {}, b'', (200,)
+
+    def posts_json(self):
+        return 'GET', '/static/data/posts.json', {}, b'', (200,)
+
+    def save_page(self):
+        # the builder's full save, with one caption (or the title) changed
+        page = json.loads(json.dumps(self.rnd.choice(self.pages)))
+        galleries = [s for s in page['sections'] if s.get('images')]
+        if galleries:
+            galleries[0]['images'][0]['caption'] = 'bench %d' % self.rnd.getrandbits(32)
+        else:
+            page['title'] = 'bench %d' % self.rnd.getrandbits(32)
+        body = json.dumps({k: page[k] for k in ('project_id', 'slug', 'title', 'excerpt', 'sections')})
+        return 'POST', '/settings/save_page', {'Content-Type': 'application/json'}, body.encode('utf-8'), (200,)
+
+    def update_project(self):
+        p = self.rnd.choice(self.projects)
+        form = {'id': p['id'], 'title': p['title'], 'header': p['header'], 'subheader': p['subheader'],
+                'excerpt': 'bench %d' % self.rnd.getrandbits(32), 'link': p['link']}
+        if p.get('published'):
+            form['published'] = 'on'
+        return ('POST', '/settings/update_project', {'Content-Type': 'application/x-www-form-urlencoded'},
+                urllib.parse.urlencode(form).encode('utf-8'), (302,))
+
+    def upload_media(self):
+        self.uploads += 1
+        boundary = 'benchboundary%d' % self.uploads
+        body = (('--%s\r\nContent-Disposition: form-data; name="file"; filename="bench-%d.png"\r\n'
+                 'Content-Type: image/png\r\n\r\n' % (boundary, self.uploads)).encode('ascii') +
+                png(self.rnd.getrandbits(64) << 32 | self.uploads) + ('\r\n--%s--\r\n' % boundary).encode('ascii'))
+        return 'POST', '/settings/upload_media', {'Content-Type': 'multipart/form-data; boundary=' + boundary}, body, (200,)
+
+
+def summarize(latencies, wall, errors, first):
+    ms = sorted(t * 1000 for t in latencies)
+
+    def pct(p):
+        return round(ms[max(0, int(math.ceil(p / 100.0 * len(ms))) - 1)], 3) if ms else None
+    return {
+        'requests': len(ms), 'errors': errors, 'seconds': round(wall, 3),
+        'throughput_rps': round(len(ms) / wall, 1) if wall else None,
+        'first_ms': round(first * 1000, 3) if first is not None else None,
+        'mean_ms': round(sum(ms) / len(ms), 3) if ms else None,
+        'p50_ms': pct(50), 'p95_ms': pct(95), 'p99_ms': pct(99), 'max_ms': round(ms[-1], 3) if ms else None,
+    }
+
+
+# ---- scratch copy of the app ----
+def prepare(workdir, size, seed):
+    """A copy of the app with a generated dataset; returns the dataset's file sizes."""
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(os.path.join(workdir, 'static', 'data'))
+    for name in os.listdir(ROOT):
+        if name.endswith('.py'):
+            shutil.copy2(os.path.join(ROOT, name), workdir)
+    ignore = shutil.ignore_patterns('__pycache__', 'results')
+    shutil.copytree(os.path.join(ROOT, 'templates'), os.path.join(workdir, 'templates'), ignore=ignore)
+    shutil.copytree(os.path.join(ROOT, 'bench'), os.path.join(workdir, 'bench'), ignore=ignore)
+    static = os.path.join(ROOT, 'static')
+    for name in os.listdir(static):
+        src = os.path.join(static, name)
+        if name.endswith('.css'):
+            shutil.copy2(src, os.path.join(workdir, 'static'))
+        elif name == 'vendor':
+            shutil.copytree(src, os.path.join(workdir, 'static', name))
+        elif name == 'img':
+            os.symlink(src, os.path.join(workdir, 'static', name))
+    for name in os.listdir(os.path.join(static, 'data')):
+        if name.endswith('.js'):
+            shutil.copy2(os.path.join(static, 'data', name), os.path.join(workdir, 'static', 'data'))
+    os.makedirs(os.path.join(workdir, 'static', 'uploads'))
+    return write_dataset(workdir, size, seed)
+
+
+def child_env(args):
+    env = dict(os.environ, PYTHONPATH='.', FLASK_STORAGE_BACKEND=args.backend, FLASK_EXPORT_ON_SAVE='false')
+    env.pop('FLASK_DEBUG', None)
+    return env
+
+
+def prepare_backend(backend):
+    # runs in the scratch directory; the SQLite backend starts from the JSON files
+    if backend == 'sqlite':
+        from storage import SqliteStorage
+        db = SqliteStorage(os.path.join('instance', 'content.db'), os.path.join('static', 'data', 'posts.json'),
+                           os.path.join('static', 'data', 'project_pages.json'))
+        with open(db.paths['posts'], encoding='utf-8') as f, open(db.paths['pages'], encoding='utf-8') as g:
+            db.import_documents(json.load(f), json.load(g))
+
+
+def import_app(backend):
+    prepare_backend(backend)
+    import app
+    return app
+
+
+# ---- client mode (child process) ----
+def run_client(args):
+    started = time.perf_counter()
+    site = import_app(args.backend)
+    startup = time.perf_counter() - started
+    scenarios = Scenarios('.', args.seed)
+    client = site.app.test_client()
+    with client.session_transaction() as s:
+        s['user'] = BENCH_USER['user']
+    results = {}
+    for route in args.routes:
+        def send():
+            method, path, headers, body, expected = scenarios.make(route)
+            t = time.perf_counter()
+            resp = client.open(path, method=method, headers=headers, data=body)
+            resp.get_data()
+            return time.perf_counter() - t, resp.status_code in expected
+        first = send()[0]
+        for _ in range(args.warmup):
+            send()
+        latencies, errors = [], 0
+        t0 = time.perf_counter()
+        for _ in range(args.requests):
+            spent, ok = send()
+            latencies.append(spent)
+            errors += not ok
+        results[route] = summarize(latencies, time.perf_counter() - t0, errors, first)
+    return {'startup_s': round(startup, 3), 'routes': results}
+
+
+# ---- server mode ----
+def run_server_child(args):
+    # prefork: --workers processes accept on one socket and serve one request
+    # at a time each, like gunicorn's sync workers. The app is imported after
+    # the fork so every worker starts its own background threads.
+    import logging
+    import signal
+    from werkzeug.serving import make_server
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            import app
+            logging.getLogger('werkzeug').setLevel(logging.ERROR)
+            make_server('127.0.0.1', args.port, app.app, fd=sock.fileno()).serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    os.wait()   # a worker died: stop the rest
+    stop(None, None)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, workdir, port):
+    gunicorn = shutil.which('gunicorn')
+    if args.server == 'gunicorn' and not gunicorn:
+        raise SystemExit('--server gunicorn: gunicorn is not installed (pip install gunicorn, or use --server prefork)')
+    if args.server != 'prefork' and gunicorn:
+        cmd = [gunicorn, '-w', str(args.workers), '-b', '127.0.0.1:%d' % port, '--log-level', 'warning', 'app:app']
+        kind = 'gunicorn'
+    else:
+        cmd = [sys.executable, '-m', 'bench.run', '--child', 'server', '--port', str(port),
+               '--workers', str(args.workers), '--backend', args.backend]
+        kind = 'prefork'
+    # the database is loaded once here, not by each worker
+    subprocess.check_call([sys.executable, '-m', 'bench.run', '--child', 'prepare', '--backend', args.backend],
+                          cwd=workdir, env=child_env(args))
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    proc = subprocess.Popen(cmd, cwd=workdir, env=child_env(args), stdout=log, stderr=subprocess.STDOUT)
+    started = time.perf_counter()
+    while True:
+        if proc.poll() is not None:
+            raise SystemExit('server exited, see %s' % log.name)
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return proc, kind, time.perf_counter() - started
+        except OSError:
+            if time.perf_counter() - started > args.startup_timeout:
+                proc.kill()
+                raise SystemExit('server did not start in %ds, see %s' % (args.startup_timeout, log.name))
+            time.sleep(0.2)
+
+
+def login(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    body = urllib.parse.urlencode({'email': BENCH_USER['email'], 'password': BENCH_USER['password']})
+    conn.request('POST', '/verifier', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    resp = conn.getresponse()
+    resp.read()
+    cookie = resp.getheader('Set-Cookie') or ''
+    conn.close()
+    if 'session=' not in cookie:
+        raise SystemExit('could not log in as %s' % BENCH_USER['email'])
+    return cookie.split(';', 1)[0]
+
+
+def http_load(port, cookie, scenarios, route, total, concurrency):
+    """Send `total` requests from `concurrency` keep-alive connections."""
+    lock = threading.Lock()
+    state = {'left': total, 'errors': 0}
+    latencies = []
+
+    def connect():
+        return http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+
+    def worker():
+        conn = connect()
+        while True:
+            with lock:
+                if state['left'] <= 0:
+                    break
+                state['left'] -= 1
+            method, path, headers, body, expected = scenarios.make(route)
+            headers = dict(headers, Cookie=cookie)
+            t = time.perf_counter()
+            try:
+                conn.request(method, path, body or None, headers)
+                resp = conn.getresponse()
+                resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                conn = connect()
+                with lock:
+                    state['errors'] += 1
+                continue
+            spent = time.perf_counter() - t
+            with lock:
+                latencies.append(spent)
+                state['errors'] += resp.status not in expected
+            if resp.will_close:
+                conn.close()
+                conn = connect()
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - t0, state['errors']
+
+
+def run_server(args, workdir):
+    port = free_port()
+    proc, kind, startup = start_server(args, workdir, port)
+    try:
+        cookie = login(port)
+        scenarios = Scenarios(workdir, args.seed)
+        results = {}
+        for route in args.routes:
+            first = http_load(port, cookie, scenarios, route, 1, 1)[0]
+            http_load(port, cookie, scenarios, route, args.warmup, args.concurrency)
+            latencies, wall, errors = http_load(port, cookie, scenarios, route, args.requests, args.concurrency)
+            results[route] = summarize(latencies, wall, errors, first[0] if first else None)
+        return {'server': kind, 'workers': args.workers, 'concurrency': args.concurrency,
+                'startup_s': round(startup, 3), 'routes': results}
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# ---- driver ----
+def git_info():
+    def git(*cmd):
+        try:
+            return subprocess.check_output(('git',) + cmd, cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='10,1000', help='comma-separated project counts')
+    parser.add_argument('--mode', default='client', help='client, server or client,server')
+    parser.add_argument('--routes', default=','.join(ROUTES), help='comma-separated: ' + ', '.join(ROUTES))
+    parser.add_argument('--backend', default='json', choices=('json', 'sqlite'))
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=8, help='server mode: parallel connections')
+    parser.add_argument('--workers', type=int, default=4, help='server mode: worker processes')
+    parser.add_argument('--server', default='auto', choices=('auto', 'gunicorn', 'prefork'),
+                        help='server mode: gunicorn if installed (auto), or the built-in prefork server')
+    parser.add_argument('--startup-timeout', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', default=os.path.join(ROOT, 'instance', 'bench'))
+    parser.add_argument('--out', default=None, help='result file (default bench/results/<commit>-<time>.json)')
+    parser.add_argument('--child', choices=('client', 'server', 'prepare'), help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.routes = [r for r in args.routes.split(',') if r]
+    unknown = set(args.routes) - set(ROUTES)
+    if unknown:
+        parser.error('unknown routes: %s' % ', '.join(sorted(unknown)))
+
+    if args.child == 'client':
+        with open(args.result, 'w') as f:
+            json.dump(run_client(args), f)
+        return
+    if args.child == 'server':
+        run_server_child(args)
+        return
+    if args.child == 'prepare':
+        prepare_backend(args.backend)
+        return
+
+    info = git_info()
+    report = {'meta': dict(info, started_at=datetime.utcnow().isoformat() + 'Z', python=platform.python_version(),
+                           platform=platform.platform(), cpus=os.cpu_count(), backend=args.backend,
+                           requests=args.requests, warmup=args.warmup, seed=args.seed),
+              'runs': []}
+    for size in [int(s) for s in args.sizes.split(',') if s]:
+        for mode in [m for m in args.mode.split(',') if m]:
+            workdir = os.path.join(args.workdir, '%s-%d' % (args.backend, size))
+            t = time.perf_counter()
+            dataset = prepare(workdir, size, args.seed)
+            generated = time.perf_counter() - t
+            print('size %d (%s): dataset %.1f MB in %.1fs' % (size, mode, sum(dataset.values()) / 1e6, generated))
+            if mode == 'client':
+                result_path = os.path.join(workdir, 'result.json')
+                subprocess.check_call([sys.executable, '-m', 'bench.run', '--child', 'client', '--result', result_path]
+                                      + (sys.argv[1:] if argv is None else list(argv)), cwd=workdir, env=child_env(args))
+                with open(result_path) as f:
+                    run = json.load(f)
+            elif mode == 'server':
+                run = run_server(args, workdir)
+            else:
+                parser.error('unknown mode %r' % mode)
+            run.update(size=size, mode=mode, backend=args.backend, dataset_bytes=dataset,
+                       generate_s=round(generated, 3))
+            report['runs'].append(run)
+            for route, r in run['routes'].items():
+                print('  %-15s %8.1f req/s  p50 %8.2f  p95 %8.2f  p99 %8.2f ms  errors %d' % (
+                    route, r['throughput_rps'] or 0, r['p50_ms'] or 0, r['p95_ms'] or 0, r['p99_ms'] or 0, r['errors']))
+
+    out = args.out or os.path.join(ROOT, 'bench', 'results', '%s-%s.json' % (
+        (info['commit'] or 'nogit')[:10], datetime.utcnow().strftime('%Y%m%d-%H%M%S')))
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('results: %s' % out)
+
+
+if __name__ == '__main__':
+    main()
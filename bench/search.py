@@ -0,0 +1,109 @@
+"""Latency of the in-process search index (search.py) on a synthetic corpus.
+
+    python -m bench.search                      # 40k projects + 10k blog posts = 50k documents
+    python -m bench.search --size 4000 --rounds 20
+    python -m bench.search --max-p99 10         # exit 1 if any measured p99 is over 10 ms
+
+Measures, on an index built from bench/datasets.py:
+
+* the full build, as the first load of posts.json / project_pages.json;
+* the first run of every query on the fresh index (nothing warmed up);
+* p50/p99 over --rounds of the whole query mix (public, editor and
+  type-filtered variants);
+* re-indexing one edited project (the store listener), and the first
+  query after it.
+"""
+import argparse
+import sys
+import time
+
+from bench.datasets import generate
+from content_store import freeze
+from search import SearchIndex
+
+POSTS, PAGES = 'posts.json', 'project_pages.json'
+QUERIES = ('land today a', 'investors secure', 'the city', 'pa', 'palm', 'villa ga', 'gr', 'harbour ridge',
+           'returns annual yield', 'verified titles road', 'summit*', 'l', 'cedar grove 12', 'drainage')
+VARIANTS = (
+    ('public', {}),
+    ('editor', {'include_unpublished': True}),
+    ('blog', {'types': ('blog',)}),
+    ('project', {'types': ('project',), 'include_unpublished': True}),
+)
+
+
+def ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=40000, help='projects (blog posts are a quarter of that)')
+    parser.add_argument('--rounds', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-p99', type=float, default=None, metavar='MS',
+                        help='exit 1 when a first-run, after-edit or warm p99 latency exceeds MS')
+    args = parser.parse_args(argv)
+
+    # listeners get frozen documents, an edit sharing every untouched entry
+    posts, pages = map(freeze, generate(args.size, args.seed))
+    index = SearchIndex(POSTS, PAGES)
+    start = time.perf_counter()
+    index.on_content_change(POSTS, None, posts)
+    index.on_content_change(PAGES, None, pages)
+    stats = index.stats()
+    print('build: %.2fs, %d documents, %d terms' % (ms(start) / 1000, stats['documents'], stats['terms']))
+
+    worst = 0.0
+    first = []
+    for q in QUERIES:
+        for _, kw in VARIANTS:
+            start = time.perf_counter()
+            index.search(q, **kw)
+            first.append((ms(start), q, kw))
+    first.sort(reverse=True)
+    worst = max(worst, first[0][0])
+    print('first run: max %.2f ms (%r %s), p99 %.2f ms' % (
+        first[0][0], first[0][1], first[0][2], percentile([t for t, _, _ in first], 99)))
+
+    timings = []
+    for _ in range(args.rounds):
+        for q in QUERIES:
+            for _, kw in VARIANTS:
+                start = time.perf_counter()
+                index.search(q, **kw)
+                timings.append(ms(start))
+    p99 = percentile(timings, 99)
+    worst = max(worst, p99)
+    print('warm: %d queries, p50 %.2f ms, p99 %.2f ms, max %.2f ms' % (
+        len(timings), percentile(timings, 50), p99, max(timings)))
+
+    edits, after = [], []
+    for n in range(5):
+        projects = list(posts['projects'])
+        i = (n * 7919) % len(projects)
+        projects[i] = dict(projects[i], title='%s renamed %d' % (projects[i]['title'], n),
+                           version=projects[i].get('version', 0) + 1)
+        posts = freeze(dict(posts, projects=projects))
+        start = time.perf_counter()
+        index.on_content_change(POSTS, None, posts)
+        edits.append(ms(start))
+        start = time.perf_counter()
+        index.search(QUERIES[n % len(QUERIES)])
+        after.append(ms(start))
+    worst = max(worst, max(after))
+    print('edit: re-index max %.2f ms, first query after max %.2f ms' % (max(edits), max(after)))
+
+    if args.max_p99 is not None and worst > args.max_p99:
+        print('over budget: %.2f ms > %.2f ms' % (worst, args.max_p99))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""On-the-fly brotli/gzip for HTML, JSON and the other text responses.
+
+The app runs ResponseCompressor.compress() as an after_request hook. The
+encoding is negotiated from Accept-Encoding (br when the brotli module is
+installed, else gzip), and the compressed body is kept in an LRU keyed by
+the content it was made from: the digest of a rendered body, or the path
+and ETag of a file response (send_file), so a page or posts.json is
+compressed once per version no matter how many clients fetch it.
+
+Compressed responses get a weak ETag (W/"..."), as nginx does: the route's
+own If-None-Match check compares weakly, so revalidations still end in a
+304 before anything is rendered or compressed.
+"""
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+from metrics import phase
+from render_cache import LRUCache
+
+COMPRESSIBLE = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'application/json', 'application/xml', 'text/xml',
+    'application/rss+xml', 'application/atom+xml', 'application/javascript', 'text/javascript',
+    'image/svg+xml',
+}
+
+
+class ResponseCompressor(object):
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, min_size=1024, max_size=8 * 1024 * 1024, level=6,
+                 brotli_quality=5):
+        self.cache = LRUCache(max_bytes=max_bytes)
+        self.min_size = min_size
+        self.max_size = max_size    # larger bodies go out as they are
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compressed = 0
+
+    def _encode(self, data, encoding):
+        with phase('compress'):
+            if encoding == 'br':
+                return brotli.compress(data, quality=self.brotli_quality)
+            return gzip.compress(data, self.level, mtime=0)
+
+    def wants(self, request, resp):
+        """The encoding to use for `resp`, or None to send it as it is."""
+        if resp.status_code != 200 or resp.mimetype not in COMPRESSIBLE:
+            return None
+        if 'Content-Encoding' in resp.headers or 'no-transform' in (resp.headers.get('Cache-Control') or ''):
+            return None
+        if resp.is_streamed and not resp.direct_passthrough:
+            return None
+        length = resp.content_length
+        if length is not None and not self.min_size <= length <= self.max_size:
+            return None
+        return request.accept_encodings.best_match(self.encodings)
+
+    def compress(self, request, resp):
+        resp.vary.add('Accept-Encoding')
+        encoding = self.wants(request, resp)
+        if encoding is None:
+            return resp
+        if resp.direct_passthrough:
+            # a file: its ETag already names the version
+            etag = resp.get_etag()[0]
+            if not etag or resp.content_length is None:
+                return resp
+            key = ('file', request.path, etag, encoding)
+            body = self.cache.get(key)
+            resp.direct_passthrough = False
+            if body is None:
+                data = resp.get_data()
+            elif hasattr(resp.response, 'close'):
+                resp.response.close()
+        else:
+            data = resp.get_data()
+            if len(data) < self.min_size:
+                return resp
+            key = ('body', hashlib.blake2b(data, digest_size=16).digest(), encoding)
+            body = self.cache.get(key)
+        if body is None:
+            body = self._encode(data, encoding)
+            self.cache.set(key, body, len(body))
+            self.compressed += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(body)
+        resp.set_data(body)
+        resp.headers['Content-Encoding'] = encoding
+        resp.headers.pop('Accept-Ranges', None)
+        etag, weak = resp.get_etag()
+        if etag and not weak:
+            resp.set_etag(etag, weak=True)
+        return resp
+
+    def stats(self):
+        return dict(self.cache.stats(), encodings=list(self.encodings), compressed=self.compressed,
+                    bytes_in=self.bytes_in, bytes_out=self.bytes_out)
@@ -0,0 +1,151 @@
+"""Hash indexes over the cached content documents.
+
+Maps slug / link-slug / id -> project, id -> blog post and
+project_id -> page, plus list positions so read-modify-write handlers can
+jump straight to an entry. The index subscribes to the ContentStore: a
+full build happens once, after that each new version of a file is diffed
+by id and only added/changed/removed entries are re-indexed. slugify() is
+memoized per link, so no regex work happens on the lookup path.
+"""
+import threading
+
+
+def _ids(items):
+    return {e.get('id'): e for e in items if e.get('id')}
+
+
+class ContentIndex(object):
+
+    def __init__(self, posts_path, pages_path, slugify):
+        self.posts_path = posts_path
+        self.pages_path = pages_path
+        self._slugify = slugify
+        self._lock = threading.Lock()
+        self._link_slugs = {}   # link -> slugify(link)
+        self._projects = ()
+        self.projects_by_id = {}
+        self.projects_by_slug = {}
+        self.projects_by_link_slug = {}
+        self.blog_by_id = {}
+        self.pages_by_project_id = {}
+        self.project_pos = {}
+        self.blog_pos = {}
+        self.page_pos = {}
+        self.full_builds = 0
+        self.incremental_updates = 0
+
+    # ---- store listener ----
+    def on_content_change(self, path, old, new):
+        with self._lock:
+            if path == self.posts_path:
+                self._apply_posts(old, new)
+            elif path == self.pages_path:
+                self._apply_pages(new)
+
+    def _link_slug(self, link):
+        if not link:
+            return ''
+        s = self._link_slugs.get(link)
+        if s is None:
+            s = self._slugify(link)
+            self._link_slugs[link] = s
+        return s
+
+    def _apply_posts(self, old, new):
+        projects = new.get('projects', ())
+        blog = new.get('blog', ())
+
+        if old is None or (not self._projects and projects):
+            self.projects_by_id = {}
+            self.projects_by_slug = {}
+            self.projects_by_link_slug = {}
+            for p in projects:
+                self._index_project(p)
+            self.full_builds += 1
+        else:
+            before = _ids(self._projects)
+            after = _ids(projects)
+            stale = [p for pid, p in before.items() if after.get(pid) != p]
+            fresh = [p for pid, p in after.items() if before.get(pid) != p]
+            if stale or fresh:
+                self.incremental_updates += 1
+            for p in stale:
+                self._unindex_project(p, projects)
+            for p in fresh:
+                self._index_project(p)
+
+        self._projects = projects
+        self.project_pos = {p.get('id'): i for i, p in enumerate(projects)}
+        self.blog_by_id = _ids(blog)
+        self.blog_pos = {b.get('id'): i for i, b in enumerate(blog)}
+
+    def _index_project(self, p):
+        pid = p.get('id')
+        if pid:
+            self.projects_by_id[pid] = p
+        slug = p.get('slug')
+        if slug:
+            self.projects_by_slug.setdefault(slug, p)
+        link_slug = self._link_slug(p.get('link', ''))
+        if link_slug:
+            self.projects_by_link_slug.setdefault(link_slug, p)
+
+    def _unindex_project(self, p, remaining):
+        pid = p.get('id')
+        self.projects_by_id.pop(pid, None)
+        slug = p.get('slug')
+        if slug and self.projects_by_slug.get(slug, {}).get('id') == pid:
+            del self.projects_by_slug[slug]
+            # another project may share the slug; keep first-wins order
+            for other in remaining:
+                if other.get('id') != pid and other.get('slug') == slug:
+                    self.projects_by_slug[slug] = other
+                    break
+        link_slug = self._link_slug(p.get('link', ''))
+        if link_slug and self.projects_by_link_slug.get(link_slug, {}).get('id') == pid:
+            del self.projects_by_link_slug[link_slug]
+            for other in remaining:
+                if other.get('id') != pid and self._link_slug(other.get('link', '')) == link_slug:
+                    self.projects_by_link_slug[link_slug] = other
+                    break
+
+    def _apply_pages(self, new):
+        pages = new.get('project_pages', ())
+        by_project = {}
+        for e in pages:
+            by_project.setdefault(e.get('project_id'), e)
+        self.pages_by_project_id = by_project
+        self.page_pos = {e.get('project_id'): i for i, e in enumerate(pages)}
+
+    # ---- lookups (caller refreshes the store first) ----
+    def project_by_slug(self, slug):
+        return self.projects_by_slug.get(slug) or self.projects_by_link_slug.get(slug)
+
+    def project_by_id(self, project_id):
+        return self.projects_by_id.get(project_id)
+
+    def blog_post(self, blog_id):
+        return self.blog_by_id.get(blog_id)
+
+    def page_for_project(self, project_id):
+        return self.pages_by_project_id.get(project_id)
+
+    def stats(self):
+        return {
+            'projects': len(self.projects_by_id),
+            'blog': len(self.blog_by_id),
+            'pages': len(self.pages_by_project_id),
+            'full_builds': self.full_builds,
+            'incremental_updates': self.incremental_updates,
+        }
+
+
+def find_position(items, key, value, hint=None):
+    # use the index's position if it still points at the right entry,
+    # otherwise fall back to a scan (the list came from a newer/older file)
+    if hint is not None and 0 <= hint < len(items) and items[hint].get(key) == value:
+        return hint
+    for i, e in enumerate(items):
+        if e.get(key) == value:
+            return i
+    return None
@@ -0,0 +1,183 @@
+"""In-process cache for the JSON content files (posts.json, project_pages.json).
+
+Each file is parsed once and kept in memory; it is only re-read when its
+mtime, size or inode changes on disk. Callers get read-only views
+(FrozenDict / tuple) so a handler can't corrupt the shared copy by accident.
+Use thaw() when a mutable copy is really needed.
+"""
+import json
+import os
+import threading
+
+from metrics import phase, count_io
+
+
+class FrozenDict(dict):
+    # dict subclass so jsonify / templates / dict(x) keep working unchanged
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('content views are read-only; use thaw() for a mutable copy')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+def freeze(obj):
+    if isinstance(obj, FrozenDict):
+        return obj
+    if isinstance(obj, dict):
+        return FrozenDict((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(v) for v in obj)
+    return obj
+
+
+def thaw(obj):
+    if isinstance(obj, dict):
+        return {k: thaw(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [thaw(v) for v in obj]
+    return obj
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def fd_signature(fd):
+    st = os.fstat(fd)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class ContentStore(object):
+    """Parsed, read-only JSON documents validated against the file's stat().
+
+    Subclasses can serve documents from elsewhere by overriding
+    source_signature() (a cheap version check) and read_source().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}      # path -> (signature, generation, frozen data)
+        self._derived = {}      # name -> (generations, value)
+        self._generation = 0
+        self._listeners = []
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def get(self, path, default=None):
+        return self._load(path, default)[1]
+
+    # ---- source hooks (overridden by non-file backends) ----
+    def source_signature(self, path):
+        return file_signature(path)
+
+    def read_source(self, path, previous):
+        with open(path, 'r', encoding='utf-8') as f:
+            count_io('read', os.fstat(f.fileno()).st_size, 'content_load')
+            return json.load(f)
+
+    def _load(self, path, default=None):
+        # returns (generation, data) read together under the lock
+        sig = self.source_signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == sig:
+                self.hits += 1
+                return entry[1], entry[2]
+
+        if sig is None:
+            data = default if default is not None else {}
+        else:
+            with phase('content_load'):
+                data = self.read_source(path, entry[2] if entry else None)
+        return self._install(path, sig, freeze(data), reparsed=True)
+
+    def put(self, path, data, sig):
+        # called by the writer with the signature of the file it just wrote,
+        # so our own writes don't pay for a re-parse
+        return self._install(path, sig, freeze(data), reparsed=False)[1]
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def _install(self, path, sig, data, reparsed):
+        with self._lock:
+            old = self._entries.get(path)
+            if old is not None and old[0] == sig and sig is not None:
+                # another thread got here first with the same file version
+                self.hits += 1
+                return old[1], old[2]
+            if reparsed:
+                if old is None:
+                    self.misses += 1
+                else:
+                    self.reloads += 1
+            self._generation += 1
+            gen = self._generation
+            self._entries[path] = (sig, gen, data)
+            # listeners run under the lock so they see versions in order;
+            # they must not call back into the store
+            for fn in self._listeners:
+                fn(path, old[2] if old else None, data)
+        return gen, data
+
+    def signature(self, path):
+        # source version of the cached copy (on-disk (mtime_ns, size, inode)
+        # for files); unlike the generation counter this is the same in
+        # every worker process
+        self._load(path)
+        entry = self._entries.get(path)
+        return entry[0] if entry else None
+
+    def generation(self, path):
+        entry = self._entries.get(path)
+        return entry[1] if entry else 0
+
+    def version(self, *paths):
+        # refreshes each path first, so the result reflects what's on disk
+        return tuple(self._load(p)[0] for p in paths)
+
+    def derived(self, name, paths, builder):
+        """Value computed from `paths`, rebuilt only when one of them changes."""
+        loaded = [self._load(p) for p in paths]
+        key = tuple(gen for gen, _ in loaded)
+        docs = [doc for _, doc in loaded]
+        cached = self._derived.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        value = builder(*docs)
+        self._derived[name] = (key, value)
+        return value
+
+    def subscribe(self, fn):
+        # fn(path, old_data, new_data) after every (re)load or put
+        with self._lock:
+            self._listeners.append(fn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'reloads': self.reloads,
+                'files': {p: {'generation': e[1]} for p, e in self._entries.items()},
+            }
@@ -0,0 +1,174 @@
+"""Static export of the public site into a directory nginx can serve directly.
+
+Pages are described as (output path, fingerprint, render function). A page
+is only re-rendered when its fingerprint differs from the one recorded in
+<out>/.export-state.json, so rebuilds after an editor save touch just the
+pages whose source entries changed. Every HTML page gets .gz (and .br when
+the brotli module is installed) siblings, and /static/... references are
+rewritten to content-hashed copies so they can be cached forever.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from urllib.parse import quote, unquote
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+STATE_FILE = '.export-state.json'
+COMPRESSIBLE = {'.html', '.css', '.js', '.json', '.svg', '.xml', '.atom', '.txt'}
+
+# "/static/styles.css", 'static/img/x.png', url(/static/...) or the later
+# entries of a srcset list inside HTML
+STATIC_REF = re.compile(r'''(?P<q>["'(]|,\s*)/?static/(?P<path>[^"'()?#,\s]+)''')
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_compressed(path, data):
+    """Write `data` to `path` plus precompressed .gz/.br siblings."""
+    _atomic_write(path, data)
+    if os.path.splitext(path)[1] not in COMPRESSIBLE:
+        return
+    _atomic_write(path + '.gz', gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        _atomic_write(path + '.br', brotli.compress(data, quality=11))
+
+
+def link_or_copy(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class HashedAssets(object):
+    """Copies static files into the export under content-hashed names."""
+
+    def __init__(self, static_dir, out_dir):
+        self.static_dir = static_dir
+        self.out_dir = out_dir
+        self._names = {}  # (path, mtime, size) -> hashed relative name
+
+    def url(self, rel):
+        rel = unquote(rel)
+        if rel.startswith('dist/'):
+            # already fingerprinted by the asset build; mirrored as-is
+            return None
+        src = os.path.join(self.static_dir, rel)
+        if not os.path.isfile(src):
+            return None
+        st = os.stat(src)
+        key = (rel, st.st_mtime_ns, st.st_size)
+        name = self._names.get(key)
+        if name is None:
+            h = hashlib.sha256()
+            with open(src, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 16), b''):
+                    h.update(chunk)
+            stem, ext = os.path.splitext(rel)
+            name = '%s.%s%s' % (stem, h.hexdigest()[:10], ext)
+            dst = os.path.join(self.out_dir, 'static', name)
+            if not os.path.exists(dst):
+                if ext in COMPRESSIBLE:
+                    with open(src, 'rb') as f:
+                        write_compressed(dst, f.read())
+                else:
+                    link_or_copy(src, dst)
+            self._names[key] = name
+        return '/static/' + quote(name)
+
+    def rewrite(self, html):
+        def repl(m):
+            url = self.url(m.group('path'))
+            return m.group('q') + url if url else m.group(0)
+        return STATIC_REF.sub(repl, html)
+
+
+class SiteExporter(object):
+
+    def __init__(self, static_dir, out_dir):
+        self.static_dir = static_dir
+        self.out_dir = out_dir
+        self.assets = HashedAssets(static_dir, out_dir)
+        self._lock = threading.Lock()
+
+    def _state_path(self):
+        return os.path.join(self.out_dir, STATE_FILE)
+
+    def load_state(self):
+        try:
+            with open(self._state_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def build(self, pages, full=False, raw_dirs=(), data_files=()):
+        """pages: iterable of (relative output path, fingerprint, render()).
+
+        raw_dirs are static sub-directories mirrored as-is (content entries
+        reference those paths literally); data_files are (relative path,
+        bytes) written verbatim. Returns counts of rendered/skipped/removed.
+        """
+        with self._lock:
+            os.makedirs(self.out_dir, exist_ok=True)
+            old = {} if full else self.load_state()
+            state = {}
+            rendered = skipped = 0
+            for rel, fingerprint, render in pages:
+                state[rel] = fingerprint
+                target = os.path.join(self.out_dir, rel)
+                if old.get(rel) == fingerprint and os.path.exists(target):
+                    skipped += 1
+                    continue
+                html = self.assets.rewrite(render())
+                write_compressed(target, html.encode('utf-8'))
+                rendered += 1
+
+            # pages that are gone (deleted / unpublished / renamed)
+            removed = 0
+            for rel in set(old) - set(state):
+                for suffix in ('', '.gz', '.br'):
+                    try:
+                        os.remove(os.path.join(self.out_dir, rel + suffix))
+                    except FileNotFoundError:
+                        pass
+                removed += 1
+
+            for d in raw_dirs:
+                self._mirror(d)
+            for rel, data in data_files:
+                write_compressed(os.path.join(self.out_dir, rel), data)
+
+            _atomic_write(self._state_path(), json.dumps(state, indent=1, sort_keys=True).encode('utf-8'))
+            return {'rendered': rendered, 'skipped': skipped, 'removed': removed}
+
+    def _mirror(self, rel_dir):
+        src_root = os.path.join(self.static_dir, rel_dir)
+        for base, _, files in os.walk(src_root):
+            for name in files:
+                src = os.path.join(base, name)
+                dst = os.path.join(self.out_dir, 'static', os.path.relpath(src, self.static_dir))
+                try:
+                    if os.path.samefile(src, dst):
+                        continue
+                    if os.path.getmtime(dst) >= os.path.getmtime(src):
+                        continue
+                except OSError:
+                    pass
+                link_or_copy(src, dst)
@@ -0,0 +1,181 @@
+"""sitemap.xml, RSS and Atom feeds, written to disk when the content changes.
+
+The app hands build() the public URLs (path, lastmod, title, summary, ...)
+after editor saves; XML is rendered per entry and memoized by the entry's
+fields, so a rebuild only re-renders what changed. Files are replaced
+atomically and only when their bytes differ, which keeps their mtime (and
+so the Last-Modified / ETag the routes send) stable for crawlers polling an
+unchanged sitemap.
+
+Past `max_urls` entries sitemap.xml becomes a sitemap index pointing at
+sitemap-1.xml, sitemap-2.xml, ... (the protocol allows 50,000 URLs per
+file). manifest.json records the base URL, the content signatures the files
+were built from and the list of sitemap parts.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from xml.sax.saxutils import escape
+
+from content_store import file_signature
+from metrics import count_io, phase
+from storage import file_lock
+
+MANIFEST = 'manifest.json'
+XML_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n'
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def _iso(dt):
+    return dt.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+class SiteFeeds(object):
+
+    def __init__(self, out_dir, max_urls=50000, feed_items=50, title='', description=''):
+        self.out_dir = out_dir
+        self.max_urls = max_urls
+        self.feed_items = feed_items
+        self.title = title
+        self.description = description
+        self._memo = {}          # (base, entry key) -> rendered fragments
+        self._manifest = None    # (file signature, parsed manifest)
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.rendered = 0
+        self.written = 0
+
+    def path(self, name):
+        return os.path.join(self.out_dir, name)
+
+    def manifest(self):
+        # re-read only when another process rewrote it
+        path = self.path(MANIFEST)
+        sig = file_signature(path)
+        cached = self._manifest
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        self._manifest = (sig, data)
+        return data
+
+    def current(self, base, sources):
+        m = self.manifest()
+        return m is not None and m.get('base') == base and m.get('sources') == sources
+
+    # ---- rendering ----
+    def _fragments(self, base, e):
+        # e: loc (site path), lastmod (aware datetime or None), title, summary, guid
+        key = (base, e['loc'], e['lastmod'], e['title'], e['summary'], e['guid'])
+        hit = self._memo.get(key)
+        if hit is not None:
+            return hit
+        url = escape(base + e['loc'])
+        lastmod = '<lastmod>%s</lastmod>' % _iso(e['lastmod']) if e['lastmod'] else ''
+        sitemap = '<url><loc>%s</loc>%s</url>\n' % (url, lastmod)
+        updated = e['lastmod'] or datetime(1970, 1, 1, tzinfo=timezone.utc)
+        rss = ('<item><title>%s</title><link>%s</link><guid isPermaLink="false">%s</guid>'
+               '<pubDate>%s</pubDate><description>%s</description></item>\n' % (
+                   escape(e['title']), url, escape(e['guid']), format_datetime(updated.astimezone(timezone.utc)),
+                   escape(e['summary'])))
+        atom = ('<entry><title>%s</title><link href="%s"/><id>%s</id><updated>%s</updated>'
+                '<summary>%s</summary></entry>\n' % (
+                    escape(e['title']), url, url, _iso(updated), escape(e['summary'])))
+        hit = self._memo[key] = (sitemap, rss, atom)
+        self.rendered += 1
+        return hit
+
+    def render(self, base, pages, entries):
+        """{file name: bytes} for `pages` (sitemap-only URLs) and `entries`."""
+        fragments = [self._fragments(base, e) for e in entries]
+        urls = [self._fragments(base, p)[0] for p in pages] + [f[0] for f in fragments]
+        files = {}
+        urlset = '<urlset xmlns="%s">\n' % SITEMAP_NS
+        if len(urls) <= self.max_urls:
+            files['sitemap.xml'] = XML_HEAD + urlset + ''.join(urls) + '</urlset>\n'
+        else:
+            index = []
+            for n, start in enumerate(range(0, len(urls), self.max_urls), 1):
+                name = 'sitemap-%d.xml' % n
+                files[name] = XML_HEAD + urlset + ''.join(urls[start:start + self.max_urls]) + '</urlset>\n'
+                index.append('<sitemap><loc>%s</loc></sitemap>\n' % escape('%s/%s' % (base, name)))
+            files['sitemap.xml'] = (XML_HEAD + '<sitemapindex xmlns="%s">\n' % SITEMAP_NS + ''.join(index) +
+                                    '</sitemapindex>\n')
+
+        newest = sorted(range(len(entries)), key=lambda i: entries[i]['lastmod'] or datetime.min.replace(
+            tzinfo=timezone.utc), reverse=True)[:self.feed_items]
+        updated = entries[newest[0]]['lastmod'] if newest and entries[newest[0]]['lastmod'] else None
+        updated = updated or datetime(1970, 1, 1, tzinfo=timezone.utc)
+        title, description = escape(self.title), escape(self.description)
+        files['feed.xml'] = (
+            XML_HEAD + '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom"><channel>\n'
+            '<title>%s</title><link>%s/</link><description>%s</description><lastBuildDate>%s</lastBuildDate>\n'
+            '<atom:link href="%s/feed.xml" rel="self" type="application/rss+xml"/>\n' % (
+                title, escape(base), description, format_datetime(updated.astimezone(timezone.utc)), escape(base)) +
+            ''.join(fragments[i][1] for i in newest) + '</channel></rss>\n')
+        files['feed.atom'] = (
+            XML_HEAD + '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+            '<title>%s</title><subtitle>%s</subtitle><id>%s/</id><updated>%s</updated>\n'
+            '<link href="%s/"/><link rel="self" href="%s/feed.atom"/>\n' % (
+                title, description, escape(base), _iso(updated), escape(base), escape(base)) +
+            ''.join(fragments[i][2] for i in newest) + '</feed>\n')
+        return {name: body.encode('utf-8') for name, body in files.items()}
+
+    # ---- writing ----
+    def _write(self, name, data):
+        # unchanged files keep their mtime, so conditional GETs keep matching
+        target = self.path(name)
+        try:
+            with open(target, 'rb') as f:
+                if f.read() == data:
+                    return False
+        except FileNotFoundError:
+            pass
+        tmp = '%s.%d.tmp' % (target, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, target)
+        count_io('written', len(data), 'feeds')
+        self.written += 1
+        return True
+
+    def build(self, base, sources, load):
+        """Rebuild the files unless they match (base, sources).
+
+        load() -> (pages, entries) is only called when a rebuild is needed,
+        under a lock shared by every process using out_dir.
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        with self._lock, file_lock(self.path('.lock')):
+            if self.current(base, sources):
+                return None
+            with phase('feeds_build'):
+                pages, entries = load()
+                files = self.render(base, pages, entries)
+            # drop memo entries this build did not use (old versions, another base)
+            live = {(base, e['loc'], e['lastmod'], e['title'], e['summary'], e['guid']) for e in pages + entries}
+            for key in [k for k in self._memo if k not in live]:
+                del self._memo[key]
+            changed = [name for name, data in sorted(files.items()) if self._write(name, data)]
+            old = self.manifest() or {}
+            for name in set(old.get('files', ())) - set(files):
+                try:
+                    os.remove(self.path(name))
+                except FileNotFoundError:
+                    pass
+            manifest = {'base': base, 'sources': sources, 'files': sorted(files), 'urls': len(pages) + len(entries),
+                        'built_at': _iso(datetime.now(timezone.utc))}
+            self._write(MANIFEST, json.dumps(manifest, indent=2).encode('utf-8'))
+            self.builds += 1
+        return changed
+
+    def stats(self):
+        m = self.manifest() or {}
+        return {'urls': m.get('urls', 0), 'files': m.get('files', []), 'built_at': m.get('built_at'),
+                'builds': self.builds, 'rendered': self.rendered, 'written': self.written}
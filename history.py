@@ -0,0 +1,344 @@
+"""Append-only revision history for projects, blog posts and pages.
+
+Every committed write appends one row per entry to a SQLite log
+(instance/history.db): either a full snapshot of the entry or a diff
+against its previous revision, as zlib-compressed JSON. An entry gets a
+fresh snapshot every `snapshot_every` revisions (or whenever the diff
+would be about as big), so materialising any revision replays at most
+that many diffs. A delete is recorded as a snapshot of null, which keeps
+deleted entries restorable from the revision before it.
+
+Diffs are lists of ops on paths (lists of keys / list indexes):
+
+    ["s", path, value]               set (path [] replaces the entry)
+    ["d", path]                      delete a key
+    ["l", path, start, end, items]   replace list[start:end] with items
+
+compact() applies the retention policy: per entry, revisions that are
+both beyond the newest `keep` and older than `keep_days` are dropped, as
+is the whole history of entries deleted more than `keep_days` ago; the
+oldest surviving revision is rewritten as a snapshot.
+"""
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from media import upload_refs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS revisions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    version INTEGER,
+    at REAL NOT NULL,
+    user TEXT,
+    action TEXT NOT NULL,
+    note TEXT,
+    snapshot INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    UNIQUE (kind, key, seq)
+);
+CREATE INDEX IF NOT EXISTS revisions_at ON revisions (at);
+"""
+META_COLUMNS = ('seq', 'version', 'at', 'user', 'action', 'note', 'snapshot', 'size')
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def _pack(obj):
+    return zlib.compress(_dumps(obj).encode('utf-8'), 6)
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+# ---- diffs ----
+def diff(a, b, path=(), ops=None):
+    """Ops turning a into b."""
+    if ops is None:
+        ops = []
+    if a == b:
+        return ops
+    if isinstance(a, dict) and isinstance(b, dict):
+        for k in a:
+            if k not in b:
+                ops.append(['d', list(path) + [k]])
+        for k, v in b.items():
+            if k in a:
+                diff(a[k], v, path + (k,), ops)
+            else:
+                ops.append(['s', list(path) + [k], v])
+    elif isinstance(a, list) and isinstance(b, list):
+        # common head and tail; what's between is edited in place or spliced
+        n = min(len(a), len(b))
+        head = 0
+        while head < n and a[head] == b[head]:
+            head += 1
+        tail = 0
+        while tail < n - head and a[len(a) - 1 - tail] == b[len(b) - 1 - tail]:
+            tail += 1
+        if len(a) == len(b):
+            for i in range(head, len(a) - tail):
+                diff(a[i], b[i], path + (i,), ops)
+        else:
+            ops.append(['l', list(path), head, len(a) - tail, b[head:len(b) - tail]])
+    else:
+        ops.append(['s', list(path), b])
+    return ops
+
+
+def _parent(doc, path):
+    for part in path[:-1]:
+        doc = doc[part]
+    return doc
+
+
+def patch(doc, ops):
+    for op in ops:
+        path = op[1]
+        if op[0] == 's':
+            if not path:
+                doc = op[2]
+            else:
+                _parent(doc, path)[path[-1]] = op[2]
+        elif op[0] == 'd':
+            del _parent(doc, path)[path[-1]]
+        else:
+            target = _parent(doc, path)[path[-1]] if path else doc
+            target[op[2]:op[3]] = op[4]
+    return doc
+
+
+def _lookup(doc, path):
+    for part in path:
+        try:
+            doc = doc[part]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return doc
+
+
+def describe(before, after):
+    """Readable list of {path, old, new} between two revisions."""
+    changes = []
+    for op in diff(before, after):
+        path = op[1]
+        label = '.'.join(str(p) for p in path)
+        if op[0] == 'l':
+            old = _lookup(before, path) or []
+            changes.append({'path': '%s[%d:%d]' % (label, op[2], op[3]), 'old': old[op[2]:op[3]], 'new': op[4]})
+        else:
+            changes.append({'path': label, 'old': _lookup(before, path),
+                            'new': op[2] if op[0] == 's' else None})
+    return changes
+
+
+class RevisionLog(object):
+
+    def __init__(self, path, snapshot_every=20, keep=50, keep_days=90, cache_size=256):
+        self.path = path
+        self.snapshot_every = max(1, snapshot_every)
+        self.keep = keep
+        self.keep_days = keep_days
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._states = OrderedDict()    # row id -> materialised json text
+        self._cache_size = cache_size
+        self._refs = set()              # uploads referenced by any retained revision
+        self._refs_id = 0               # last row id scanned into _refs
+        self.last_compaction = None
+
+    def conn(self):
+        c = getattr(self._local, 'conn', None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            c.execute('PRAGMA journal_mode=WAL')
+            c.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            c.executescript(SCHEMA)
+            self._local.conn = c
+        return c
+
+    # ---- reading ----
+    def _materialize(self, conn, kind, key, seq):
+        """(row id, entry) at revision `seq`; entry is None for a delete."""
+        rows = conn.execute(
+            "SELECT id, snapshot, data FROM revisions WHERE kind = ? AND key = ? AND seq <= ? AND seq >= "
+            "(SELECT MAX(seq) FROM revisions WHERE kind = ? AND key = ? AND seq <= ? AND snapshot = 1) "
+            "ORDER BY seq", (kind, key, seq, kind, key, seq)).fetchall()
+        if not rows:
+            return None, None
+        row_id = rows[-1][0]
+        with self._lock:
+            text = self._states.get(row_id)
+            if text is not None:
+                self._states.move_to_end(row_id)
+        if text is not None:
+            return row_id, json.loads(text)
+        doc = None
+        for _, snapshot, data in rows:
+            doc = _unpack(data) if snapshot else patch(doc, _unpack(data))
+        self._remember(row_id, doc)
+        return row_id, doc
+
+    def _remember(self, row_id, doc):
+        with self._lock:
+            self._states[row_id] = _dumps(doc)
+            while len(self._states) > self._cache_size:
+                self._states.popitem(last=False)
+
+    def _meta(self, row):
+        meta = dict(zip(META_COLUMNS, row))
+        meta['snapshot'] = bool(meta['snapshot'])
+        return meta
+
+    def revisions(self, kind, key, limit=50, before=None):
+        """Newest first; `before` is a seq to page back from."""
+        sql = "SELECT %s FROM revisions WHERE kind = ? AND key = ?" % ', '.join(META_COLUMNS)
+        args = [kind, key]
+        if before is not None:
+            sql += " AND seq < ?"
+            args.append(before)
+        sql += " ORDER BY seq DESC LIMIT ?"
+        args.append(limit)
+        return [self._meta(r) for r in self.conn().execute(sql, args)]
+
+    def revision(self, kind, key, seq):
+        """(meta, entry, changes since the previous revision) or None."""
+        conn = self.conn()
+        row = conn.execute("SELECT %s FROM revisions WHERE kind = ? AND key = ? AND seq = ?"
+                           % ', '.join(META_COLUMNS), (kind, key, seq)).fetchone()
+        if row is None:
+            return None
+        _, item = self._materialize(conn, kind, key, seq)
+        prev = conn.execute("SELECT MAX(seq) FROM revisions WHERE kind = ? AND key = ? AND seq < ?",
+                            (kind, key, seq)).fetchone()[0]
+        before = self._materialize(conn, kind, key, prev)[1] if prev is not None else None
+        return self._meta(row), item, describe(before, item)
+
+    def deleted(self, kind, limit=50):
+        """Entries whose latest revision is a delete, most recent first."""
+        conn = self.conn()
+        rows = conn.execute(
+            "SELECT key, seq, at, user FROM revisions r WHERE kind = ? AND action = 'delete' AND seq = "
+            "(SELECT MAX(seq) FROM revisions WHERE kind = r.kind AND key = r.key) ORDER BY at DESC LIMIT ?",
+            (kind, limit)).fetchall()
+        found = []
+        for key, seq, at, user in rows:
+            item = self._materialize(conn, kind, key, seq - 1)[1] if seq > 1 else None
+            found.append({'key': key, 'seq': seq, 'at': at, 'user': user, 'restore_seq': seq - 1 if item else None,
+                          'title': (item or {}).get('title') or (item or {}).get('header') or ''})
+        return found
+
+    # ---- writing ----
+    def record(self, changes, user=None, note=None, now=None):
+        """Append a revision for each (kind, key, entry or None) that differs from its last one."""
+        now = time.time() if now is None else now
+        conn = self.conn()
+        remembered = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for kind, key, item in changes:
+                if key is None:
+                    continue
+                item = json.loads(_dumps(item))
+                last = conn.execute("SELECT seq, depth FROM revisions WHERE kind = ? AND key = ? "
+                                    "ORDER BY seq DESC LIMIT 1", (kind, key)).fetchone()
+                prev = self._materialize(conn, kind, key, last[0])[1] if last else None
+                if last and prev == item:
+                    continue
+                if item is None:
+                    action = 'delete'
+                else:
+                    action = 'update' if prev is not None else 'create'
+                data = None
+                if prev is not None and item is not None and last[1] + 1 < self.snapshot_every:
+                    ops = diff(prev, item)
+                    data = _pack(ops)
+                    if len(data) * 2 > len(_pack(item)):
+                        data = None
+                snapshot = data is None
+                if snapshot:
+                    data = _pack(item)
+                cur = conn.execute(
+                    "INSERT INTO revisions (kind, key, seq, version, at, user, action, note, snapshot, depth, size, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, key, (last[0] if last else 0) + 1, (item or {}).get('version'), now, user, action, note,
+                     int(snapshot), 0 if snapshot else last[1] + 1, len(data), data))
+                remembered.append((cur.lastrowid, item))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        for row_id, item in remembered:
+            self._remember(row_id, item)
+        return len(remembered)
+
+    # ---- retention ----
+    def compact(self, now=None):
+        now = time.time() if now is None else now
+        cutoff = now - self.keep_days * 86400
+        conn = self.conn()
+        result = {'dropped': 0, 'rewritten': 0, 'entries_removed': 0}
+        entries = conn.execute("SELECT kind, key FROM revisions WHERE at < ? GROUP BY kind, key",
+                               (cutoff,)).fetchall()
+        for kind, key in entries:
+            # one short transaction per entry so writers are not held up
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute("SELECT id, seq, at, action, snapshot FROM revisions WHERE kind = ? AND key = ? "
+                                    "ORDER BY seq", (kind, key)).fetchall()
+                if rows[-1][3] == 'delete' and rows[-1][2] < cutoff:
+                    conn.execute("DELETE FROM revisions WHERE kind = ? AND key = ?", (kind, key))
+                    result['dropped'] += len(rows)
+                    result['entries_removed'] += 1
+                else:
+                    first = 0
+                    while first < len(rows) - self.keep and rows[first][2] < cutoff:
+                        first += 1
+                    if first:
+                        row_id, seq, _, _, snapshot = rows[first]
+                        if not snapshot:
+                            item = self._materialize(conn, kind, key, seq)[1]
+                            data = _pack(item)
+                            conn.execute("UPDATE revisions SET snapshot = 1, depth = 0, size = ?, data = ? WHERE id = ?",
+                                         (len(data), data, row_id))
+                            result['rewritten'] += 1
+                        conn.execute("DELETE FROM revisions WHERE kind = ? AND key = ? AND seq < ?", (kind, key, seq))
+                        result['dropped'] += first
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        if result['dropped']:
+            conn.execute('PRAGMA incremental_vacuum')
+            with self._lock:
+                self._refs, self._refs_id = set(), 0
+        self.last_compaction = dict(result, at=now)
+        return result
+
+    def referenced_uploads(self):
+        """Upload paths any retained revision refers to (so rollbacks find their images)."""
+        with self._lock:
+            rows = self.conn().execute("SELECT id, data FROM revisions WHERE id > ? ORDER BY id",
+                                       (self._refs_id,)).fetchall()
+            for row_id, data in rows:
+                upload_refs(zlib.decompress(data).decode('utf-8'), self._refs)
+                self._refs_id = row_id
+            return set(self._refs)
+
+    def stats(self):
+        row = self.conn().execute(
+            "SELECT COUNT(*), COUNT(DISTINCT kind || ':' || key), COALESCE(SUM(size), 0), COALESCE(SUM(snapshot), 0) "
+            "FROM revisions").fetchone()
+        return {'revisions': row[0], 'entries': row[1], 'bytes': row[2], 'snapshots': row[3],
+                'cached_states': len(self._states), 'last_compaction': self.last_compaction}
@@ -0,0 +1,170 @@
+"""Responsive image derivatives for uploads and static/img.
+
+For every source image we write resized WebP + JPEG (PNG when the source
+has transparency) copies at a few widths, plus a tiny blurred placeholder
+as a data URI. The app runs process() from its job queue, so uploads
+return straight away. Results are recorded in static/derived/manifest.json,
+keyed by the source's web path ("static/img/palmvilla1.png").
+
+Pillow is optional: without it the pipeline is disabled and pages simply
+keep serving the original files.
+"""
+import base64
+import io
+import json
+import logging
+import os
+import threading
+
+try:
+    from PIL import Image, ImageFilter, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+from storage import file_lock
+
+log = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 1024, 1600)
+SOURCE_EXT = {'png', 'jpg', 'jpeg', 'webp', 'gif'}
+PLACEHOLDER_WIDTH = 16
+
+
+def web_path(src):
+    # normalise "/static/x.png", "static\\x.png" etc. to "static/x.png"
+    if not src or not isinstance(src, str):
+        return ''
+    return src.replace('\\', '/').lstrip('/')
+
+
+class ImagePipeline(object):
+
+    def __init__(self, root, out_dir, manifest_path, widths=WIDTHS, lock_path=None):
+        self.root = root
+        self.out_dir = out_dir
+        self.manifest_path = manifest_path
+        self.lock_path = lock_path or manifest_path + '.lock'   # shared by every process writing the manifest
+        self.widths = tuple(sorted(widths))
+        self.enabled = Image is not None
+        self._manifest_lock = threading.Lock()
+
+    def is_source(self, src):
+        if not src.startswith('static/') or src.startswith(self._derived_prefix()):
+            return False
+        return '.' in src and src.rsplit('.', 1)[1].lower() in SOURCE_EXT
+
+    def _derived_prefix(self):
+        return web_path(os.path.relpath(self.out_dir, self.root)) + '/'
+
+    # ---- processing ----
+    def process(self, src, force=False):
+        src = web_path(src)
+        fp = os.path.join(self.root, src)
+        if not os.path.isfile(fp):
+            return None
+        st = os.stat(fp)
+        source_sig = [st.st_mtime_ns, st.st_size]
+        if not force:
+            current = self.load_manifest().get(src)
+            if current and current.get('source') == source_sig:
+                return current
+
+        # static/img/palmvilla1.png -> <out_dir>/img/palmvilla1/
+        rel = src[len('static/'):]
+        stem = rel.rsplit('.', 1)[0]
+        target_dir = os.path.join(self.out_dir, stem)
+        os.makedirs(target_dir, exist_ok=True)
+
+        with Image.open(fp) as im:
+            im = ImageOps.exif_transpose(im)
+            has_alpha = im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info)
+            im = im.convert('RGBA' if has_alpha else 'RGB')
+            width, height = im.size
+            fallback_ext = 'png' if has_alpha else 'jpg'
+
+            # configured widths below the original, topped up with the
+            # original width when it is smaller than the largest one
+            widths = sorted({w for w in self.widths if w < width} | {min(width, self.widths[-1])})
+            info = {
+                'source': source_sig,
+                'width': width,
+                'height': height,
+                'fallback_type': 'image/png' if has_alpha else 'image/jpeg',
+                'webp': {},
+                'fallback': {},
+            }
+            for w in widths:
+                h = max(1, round(height * w / width))
+                resized = im.resize((w, h), Image.LANCZOS) if w != width else im
+                webp_name = '%d.webp' % w
+                resized.save(os.path.join(target_dir, webp_name), 'WEBP', quality=80, method=4)
+                fb_name = '%d.%s' % (w, fallback_ext)
+                if has_alpha:
+                    resized.save(os.path.join(target_dir, fb_name), 'PNG', optimize=True)
+                else:
+                    resized.save(os.path.join(target_dir, fb_name), 'JPEG', quality=82,
+                                 optimize=True, progressive=True)
+                info['webp'][str(w)] = self._url(target_dir, webp_name)
+                info['fallback'][str(w)] = self._url(target_dir, fb_name)
+
+            info['placeholder'] = self._placeholder(im)
+
+        self._record(src, info)
+        return info
+
+    def _url(self, target_dir, name):
+        return '/' + web_path(os.path.relpath(os.path.join(target_dir, name), self.root))
+
+    def _placeholder(self, im):
+        w, h = im.size
+        ph = im.convert('RGB').resize((PLACEHOLDER_WIDTH, max(1, round(h * PLACEHOLDER_WIDTH / w))))
+        ph = ph.filter(ImageFilter.GaussianBlur(1))
+        buf = io.BytesIO()
+        ph.save(buf, 'JPEG', quality=40)
+        return 'data:image/jpeg;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+    # ---- manifest ----
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _record(self, src, info):
+        # read-modify-write; other workers record their derivatives too
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        with self._manifest_lock, file_lock(self.lock_path):
+            manifest = self.load_manifest()
+            manifest[src] = info
+            tmp = '%s.%d.tmp' % (self.manifest_path, os.getpid())
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(tmp, self.manifest_path)
+
+    def sources(self, *dirs):
+        # every derivable image under the given directories (for backfills)
+        for d in dirs:
+            for base, _, files in os.walk(os.path.join(self.root, d)):
+                for name in sorted(files):
+                    src = web_path(os.path.relpath(os.path.join(base, name), self.root))
+                    if self.is_source(src):
+                        yield src
+
+
+def srcset_map(info):
+    """Compact form stored on content entries as cover_srcset / srcset."""
+    if not info:
+        return None
+    return {
+        'width': info['width'],
+        'height': info['height'],
+        'placeholder': info['placeholder'],
+        'webp': dict(info['webp']),
+        'fallback': dict(info['fallback']),
+        'fallback_type': info['fallback_type'],
+    }
+
+
+def srcset_attr(urls):
+    # {"320": "/a/320.webp", ...} -> "/a/320.webp 320w, ..."
+    return ', '.join('%s %sw' % (u, w) for w, u in sorted(urls.items(), key=lambda kv: int(kv[0])))
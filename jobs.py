@@ -0,0 +1,252 @@
+"""Small in-process job queue for slow side effects (file cleanup, image
+derivatives, lead storage, webhooks).
+
+Jobs are journalled as one JSON file each under <journal_dir>/pending, so
+they survive restarts: on start() every pending job is scheduled again.
+A worker claims a job by renaming it into running/ - only one process can
+win that rename, so several gunicorn workers can share a journal - and
+holds an flock on the running file until the job is done. start() only
+moves a running job back to pending when it is older than stale_after and
+nobody holds that lock, i.e. the worker running it died. Failed jobs are
+retried with exponential backoff and parked in failed/ after max_attempts.
+"""
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:     # no flock: a job running past stale_after may be recovered twice
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+class JobQueue(object):
+
+    def __init__(self, journal_dir, max_workers=2, max_attempts=5, base_delay=2.0, max_delay=300.0,
+                 stale_after=600.0):
+        self.journal_dir = journal_dir
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stale_after = stale_after
+        self._handlers = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='jobs')
+        self._heap = []                 # (run_at, job id)
+        self._cond = threading.Condition()
+        self._recent = deque(maxlen=100)
+        self._running = set()
+        self._started = False
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+        for d in ('pending', 'running', 'failed'):
+            os.makedirs(os.path.join(journal_dir, d), exist_ok=True)
+
+    def register(self, name):
+        # decorator: @jobs.register('delete_files') def fn(**payload)
+        def wrap(fn):
+            self._handlers[name] = fn
+            return fn
+        return wrap
+
+    def _path(self, state, job_id):
+        return os.path.join(self.journal_dir, state, job_id + '.json')
+
+    def _write(self, state, job):
+        path = self._path(state, job['id'])
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _discard(path):
+        # the file may be gone already, e.g. recovered while fcntl is missing
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # ---- producing ----
+    def enqueue(self, name, delay=0, job_id=None, **payload):
+        # a fixed job_id makes the job a singleton: it is only added if no job
+        # with that id is already pending (workers racing here write one file)
+        if name not in self._handlers:
+            raise KeyError('No handler registered for job %r' % name)
+        if job_id is not None and os.path.exists(self._path('pending', job_id)):
+            return job_id
+        now = time.time()
+        job = {
+            'id': job_id or uuid.uuid4().hex,
+            'name': name,
+            'payload': payload,
+            'attempts': 0,
+            'created_at': now,
+            'run_at': now + delay,
+            'error': None,
+        }
+        self._write('pending', job)
+        self._schedule(job)
+        return job['id']
+
+    def _schedule(self, job):
+        with self._cond:
+            heapq.heappush(self._heap, (job['run_at'], job['id']))
+            self._cond.notify()
+
+    # ---- running ----
+    def start(self):
+        """Re-schedule journalled jobs and start dispatching."""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        self._recover()
+        t = threading.Thread(target=self._dispatch, name='jobs-dispatch', daemon=True)
+        t.start()
+
+    def _recover(self):
+        now = time.time()
+        running = os.path.join(self.journal_dir, 'running')
+        for name in os.listdir(running):
+            path = os.path.join(running, name)
+            # claimed by a process that died mid-job: old, and nobody holds its lease
+            try:
+                if not name.endswith('.json') or now - os.path.getmtime(path) <= self.stale_after:
+                    continue
+                with open(path, 'r') as f:
+                    if fcntl is not None:
+                        try:
+                            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except BlockingIOError:
+                            continue    # still running, just slow
+                    os.replace(path, os.path.join(self.journal_dir, 'pending', name))
+            except FileNotFoundError:
+                pass
+        pending = os.path.join(self.journal_dir, 'pending')
+        for name in os.listdir(pending):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(pending, name), 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._schedule(job)
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._cond.wait(timeout)
+                _, job_id = heapq.heappop(self._heap)
+            self._pool.submit(self._run, job_id)
+
+    def _claim(self, job_id):
+        # the rename is the lock: whoever moves the file runs the job. Returns
+        # (job, lease): the open running file, flocked until the job is done
+        pending = self._path('pending', job_id)
+        running = self._path('running', job_id)
+        try:
+            # fresh mtime first, so _recover leaves it alone until it is leased
+            os.utime(pending)
+            os.replace(pending, running)
+        except FileNotFoundError:
+            return None, None
+        lease = open(running, 'r', encoding='utf-8')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lease.fileno(), fcntl.LOCK_EX)
+            return json.load(lease), lease
+        except BaseException:
+            lease.close()
+            raise
+
+    def _run(self, job_id):
+        try:
+            job, lease = self._claim(job_id)
+        except (OSError, ValueError):
+            log.exception('could not claim job %s', job_id)
+            return
+        if job is None:
+            return
+        with lease:
+            self._execute(job)
+
+    def _execute(self, job):
+        job_id = job['id']
+        self._running.add(job_id)
+        job['attempts'] += 1
+        try:
+            self._handlers[job['name']](**job['payload'])
+        except Exception as e:
+            log.warning('job %s (%s) failed: %s', job['name'], job_id, e)
+            job['error'] = '%s: %s' % (type(e).__name__, e)
+            if job['attempts'] >= self.max_attempts:
+                self._finish(job, 'failed')
+                self.failed += 1
+            else:
+                job['run_at'] = time.time() + min(self.max_delay, self.base_delay * 2 ** (job['attempts'] - 1))
+                self._write('pending', job)
+                self._discard(self._path('running', job_id))
+                self.retried += 1
+                self._schedule(job)
+        else:
+            self._discard(self._path('running', job_id))
+            job['error'] = None
+            self._remember(job, 'done')
+            self.done += 1
+        finally:
+            self._running.discard(job_id)
+
+    def _finish(self, job, state):
+        self._write(state, job)
+        self._discard(self._path('running', job['id']))
+        self._remember(job, state)
+
+    def _remember(self, job, state):
+        self._recent.append({
+            'id': job['id'],
+            'name': job['name'],
+            'status': state,
+            'attempts': job['attempts'],
+            'error': job['error'],
+            'finished_at': time.time(),
+        })
+
+    # ---- status ----
+    def status(self, job_id):
+        for state in ('running', 'pending', 'failed'):
+            try:
+                with open(self._path(state, job_id), 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            return {'id': job_id, 'name': job['name'], 'status': state, 'attempts': job['attempts'],
+                    'run_at': job['run_at'], 'error': job['error']}
+        for entry in reversed(self._recent):
+            if entry['id'] == job_id:
+                return dict(entry)
+        return None
+
+    def stats(self):
+        def count(state):
+            return sum(1 for n in os.listdir(os.path.join(self.journal_dir, state)) if n.endswith('.json'))
+        return {
+            'pending': count('pending'),
+            'running': count('running'),
+            'failed': count('failed'),
+            'done': self.done,
+            'retried': self.retried,
+            'gave_up': self.failed,
+            'recent': list(reversed(self._recent))[:20],
+        }
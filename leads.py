@@ -0,0 +1,353 @@
+"""Durable, batched capture of /contact and /subscribe leads.
+
+Leads are appended to a JSON-lines journal (instance/leads.jsonl) by a
+writer thread. submit() only validates the lead, checks it against the
+in-memory index and queues it; the writer appends everything queued since
+its last pass with one write and one fsync (group commit), so a burst of
+submissions costs a handful of disk flushes instead of one each. flush()
+waits until what was submitted so far is on disk.
+
+Deduplication is per email: a subscribe from an address that already
+subscribed is dropped, as is a contact message identical to one already
+received from that address. Several processes may share a journal: each
+batch is appended under a file lock, after reading (and indexing) any
+lines the other processes appended since, so a duplicate that raced in
+through another worker is dropped at write time.
+
+The index also keeps the offset of every line, so the editor view pages
+through the journal newest first by seeking, and exports stream the file
+without loading it.
+"""
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from array import array
+from datetime import datetime
+
+import metrics
+from storage import file_lock
+
+log = logging.getLogger(__name__)
+
+KINDS = ('contact', 'subscribe')
+EXPORT_FIELDS = ('received_at', 'type', 'email', 'name', 'message', 'id')
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+MAX_FIELD = {'email': 254, 'name': 200, 'message': 5000}
+
+
+class LeadError(ValueError):
+    pass
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def _fingerprint(lead):
+    # what makes two leads the same: one subscription per address, or the same message twice
+    if lead['type'] == 'subscribe':
+        raw = 'subscribe\0' + lead['email']
+    else:
+        raw = 'contact\0%s\0%s' % (lead['email'], ' '.join((lead.get('message') or '').split()).lower())
+    return hashlib.sha1(raw.encode('utf-8')).digest()[:12]
+
+
+def _csv_safe(value):
+    # keep spreadsheet apps from evaluating submitted text as a formula
+    text = '' if value is None else str(value)
+    return "'" + text if text[:1] in ('=', '+', '-', '@', '\t', '\r') else text
+
+
+class LeadJournal(object):
+
+    def __init__(self, path, flush_interval=0.05, max_batch=2000, on_write=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.on_write = on_write           # fn(leads) after each batch is durable
+        self._lock = threading.Lock()      # index and queue
+        self._io_lock = threading.RLock()  # one reader/writer of the file at a time in this process
+        self._cond = threading.Condition(self._lock)
+        self._queue = []
+        self._queued = set()               # fingerprints waiting in _queue
+        self._submitted = 0
+        self._written = 0                  # submissions handled (written or dropped) by the writer
+        self._seen = set()
+        self._emails = {}                  # email -> [leads, first received_at, last received_at]
+        self._offsets = {None: array('q')}
+        for kind in KINDS:
+            self._offsets[kind] = array('q')
+        self._size = 0                     # bytes of the journal indexed so far
+        self._thread = None
+        self.duplicates = 0
+        self.batches = 0
+        self.fsync_seconds = 0.0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._catch_up()
+
+    # ---- index ----
+    def _index(self, lead, offset):
+        self._seen.add(_fingerprint(lead))
+        self._offsets[None].append(offset)
+        if lead['type'] in self._offsets:
+            self._offsets[lead['type']].append(offset)
+        entry = self._emails.get(lead['email'])
+        if entry is None:
+            self._emails[lead['email']] = [1, lead['received_at'], lead['received_at']]
+        else:
+            entry[0] += 1
+            entry[2] = lead['received_at']
+
+    def _catch_up(self, repair=False):
+        """Index lines appended since the last call (by any process).
+
+        A last line without its newline is a batch still being written, or -
+        when called under the file lock (repair=True) - one torn by a crash,
+        which is cut off so the next append starts on a fresh line.
+        """
+        with self._io_lock:
+            try:
+                f = open(self.path, 'rb')
+            except FileNotFoundError:
+                return
+            with f:
+                f.seek(self._size)
+                data = f.read()
+            end = data.rfind(b'\n') + 1
+            if repair and end < len(data):
+                log.warning('leads: dropping %d bytes of a torn line at the end of %s', len(data) - end, self.path)
+                with open(self.path, 'r+b') as f:
+                    f.truncate(self._size + end)
+            offset = self._size
+            for line in data[:end].splitlines(True):
+                try:
+                    lead = self._load_line(line, offset)
+                except ValueError:
+                    log.warning('leads: skipping unreadable line at byte %d of %s', offset, self.path)
+                else:
+                    with self._lock:
+                        self._index(lead, offset)
+                offset += len(line)
+            self._size = offset
+            if end:
+                metrics.count_io('read', end, 'leads')
+
+    @staticmethod
+    def _load_line(line, offset):
+        lead = json.loads(line)
+        if not isinstance(lead, dict):
+            raise ValueError('not a lead')
+        # lines written before leads carried ids
+        lead.setdefault('id', 'line-%d' % offset)
+        lead['email'] = normalize_email(lead.get('email'))
+        lead.setdefault('type', 'contact')
+        lead.setdefault('received_at', '')
+        return lead
+
+    # ---- producing ----
+    def submit(self, kind, email, name=None, message=None, received_at=None):
+        """Queue a lead; returns it, or None if it duplicates one already taken."""
+        if kind not in KINDS:
+            raise LeadError('Unknown lead type %r' % kind)
+        lead = {'id': uuid.uuid4().hex[:16], 'type': kind, 'email': normalize_email(email),
+                'received_at': received_at or datetime.utcnow().isoformat() + 'Z'}
+        if not EMAIL_RE.match(lead['email']):
+            raise LeadError('Please enter a valid email address')
+        for field, value in (('name', name), ('message', message)):
+            if value and value.strip():
+                lead[field] = value.strip()
+        for field, limit in MAX_FIELD.items():
+            if len(lead.get(field) or '') > limit:
+                raise LeadError('%s is too long (at most %d characters)' % (field.title(), limit))
+        if kind == 'contact' and not lead.get('message'):
+            raise LeadError('Please enter a message')
+        key = _fingerprint(lead)
+        with self._cond:
+            if key in self._seen or key in self._queued:
+                self.duplicates += 1
+                return None
+            self._queued.add(key)
+            self._queue.append(lead)
+            self._submitted += 1
+            self._cond.notify_all()
+        self.start()
+        return lead
+
+    # ---- writing ----
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='leads-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+            # let a burst gather into one batch
+            time.sleep(self.flush_interval)
+            try:
+                self.write_batch()
+            except Exception:
+                log.exception('leads: writing a batch failed, retrying')
+                time.sleep(1)
+
+    def write_batch(self):
+        """Append what is queued with one write + fsync; returns the leads written."""
+        with self._io_lock:
+            with self._lock:
+                batch = self._queue[:self.max_batch]
+            if not batch:
+                return []
+            written = []
+            with metrics.phase('leads_write'), file_lock(self.path + '.lock'):
+                self._catch_up(repair=True)
+                lines = []
+                with self._lock:
+                    for lead in batch:
+                        key = _fingerprint(lead)
+                        if key in self._seen:   # another worker took it first
+                            self.duplicates += 1
+                            continue
+                        self._seen.add(key)
+                        lines.append((json.dumps(lead, ensure_ascii=False) + '\n').encode('utf-8'))
+                        written.append(lead)
+                data = b''.join(lines)
+                if data:
+                    started = time.perf_counter()
+                    fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                    try:
+                        os.write(fd, data)
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                    self.fsync_seconds += time.perf_counter() - started
+                    metrics.count_io('written', len(data), 'leads')
+                with self._cond:
+                    offset = self._size
+                    for lead, line in zip(written, lines):
+                        self._index(lead, offset)
+                        offset += len(line)
+                    self._size = offset
+                    del self._queue[:len(batch)]
+                    self._queued.difference_update(_fingerprint(lead) for lead in batch)
+                    self._written += len(batch)
+                    self.batches += 1
+                    self._cond.notify_all()
+        if written and self.on_write is not None:
+            try:
+                self.on_write(written)
+            except Exception:
+                log.exception('leads: on_write hook failed')
+        return written
+
+    def flush(self, timeout=None):
+        """Wait until everything submitted so far is on disk; False on timeout."""
+        with self._cond:
+            target = self._submitted
+            if self._written >= target:
+                return True
+        if self._thread is None:
+            while self.write_batch():
+                pass
+            return True
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._written < target:
+                left = None if deadline is None else deadline - time.time()
+                if left is not None and left <= 0:
+                    return False
+                self._cond.wait(left)
+        return True
+
+    # ---- reading ----
+    def _read(self, offsets):
+        leads = []
+        with open(self.path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                leads.append(self._load_line(f.readline(), offset))
+        return leads
+
+    def page(self, kind=None, before=None, limit=50):
+        """Newest-first leads; `before` is the next_before of the previous page."""
+        self._catch_up()
+        with self._lock:
+            offsets = self._offsets[kind]
+            end = len(offsets)
+            if before is not None:
+                # offsets are ascending: find the first one >= before
+                lo, hi = 0, end
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if offsets[mid] < before:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                end = lo
+            chosen = list(reversed(offsets[max(0, end - limit):end]))
+            more = end > limit
+        leads = self._read(chosen)
+        with self._lock:
+            for lead in leads:
+                entry = self._emails.get(lead['email'])
+                lead['leads_from_email'] = entry[0] if entry else 1
+        return leads, (chosen[-1] if chosen and more else None)
+
+    def export(self, fmt='csv', kind=None, since=None):
+        """Yield the journal as CSV or JSON lines, oldest first, in chunks."""
+        self._catch_up()
+        size = self._size
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if fmt == 'csv':
+            writer.writerow(EXPORT_FIELDS)
+        if not size:
+            yield buf.getvalue()
+            return
+        done = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if done >= size:
+                    break
+                offset = done
+                done += len(line)
+                try:
+                    lead = self._load_line(line, offset)
+                except ValueError:
+                    continue
+                if (kind and lead['type'] != kind) or (since and lead['received_at'] < since):
+                    continue
+                if fmt == 'csv':
+                    writer.writerow([_csv_safe(lead.get(f)) for f in EXPORT_FIELDS])
+                else:
+                    buf.write(json.dumps(lead, ensure_ascii=False) + '\n')
+                if buf.tell() > 64 * 1024:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+        yield buf.getvalue()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'leads': len(self._offsets[None]),
+                'contact': len(self._offsets['contact']),
+                'subscribe': len(self._offsets['subscribe']),
+                'emails': len(self._emails),
+                'queued': len(self._queue),
+                'duplicates': self.duplicates,
+                'batches': self.batches,
+                'fsync_seconds': round(self.fsync_seconds, 3),
+                'bytes': self._size,
+            }
@@ -0,0 +1,263 @@
+"""Reference-counted index of uploaded media, and the sweep that collects
+files nothing points at any more.
+
+MediaIndex maps every file under static/uploads to the entries that
+reference it - project and blog covers/galleries in posts.json, and every
+sections[].cover / sections[].images in project_pages.json (any string
+field is scanned, so links in markdown count too). It subscribes to the
+ContentStore and, like ContentIndex, only re-scans the entries whose
+content changed since the version it last indexed.
+
+MediaCollector deletes unreferenced files, but only ones older than a
+grace period (an upload that hasn't been saved into an entry yet looks
+unreferenced), in small batches with a pause in between, and re-checks
+the index before every batch. `retained` (a callable returning a set of
+upload paths) protects files only older revisions still point at.
+
+Files an edit just dropped are collected sooner, but still only once they
+are `release_grace` old: uploads are content-addressed, so a re-upload of
+the same bytes reuses (and touches) the file an edit just released. The
+final check and the delete run under `lock` (the storage's write lock), so
+no save can start referencing a file between the check and the delete.
+"""
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import nullcontext
+
+UPLOAD_PREFIX = 'static/uploads/'
+UPLOAD_REF = re.compile(r'static/uploads/[^\s"\'()<>?#\\]+')
+
+
+def upload_refs(value, found=None):
+    # every static/uploads/... path mentioned anywhere in value
+    if found is None:
+        found = set()
+    if isinstance(value, str):
+        if UPLOAD_PREFIX in value or '\\' in value:
+            found.update(m.group(0) for m in UPLOAD_REF.finditer(value.replace('\\', '/')))
+    elif isinstance(value, dict):
+        for v in value.values():
+            upload_refs(v, found)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for v in value:
+            upload_refs(v, found)
+    return found
+
+
+def _grouped(items, key):
+    # key -> tuple of entries; blog ids have not always been unique
+    groups = {}
+    for i, e in enumerate(items):
+        k = e.get(key) or '#%d' % i
+        groups[k] = groups.get(k, ()) + (e,)
+    return groups
+
+
+class MediaIndex(object):
+
+    def __init__(self, posts_path, pages_path):
+        # document path -> [(kind, list key, key field)]
+        self.docs = {
+            posts_path: [('projects', 'projects', 'id'), ('blog', 'blog', 'id')],
+            pages_path: [('project_pages', 'project_pages', 'project_id')],
+        }
+        self._lock = threading.Lock()
+        self._indexed = {}      # doc path -> {kind: grouped entries} as last indexed
+        self._owners = {}       # (kind, key) -> set of upload paths
+        self.refs = {}          # upload path -> set of (kind, key)
+        self.full_builds = 0
+        self.incremental_updates = 0
+
+    # ---- store listener ----
+    def on_content_change(self, path, old, new):
+        if path not in self.docs:
+            return
+        with self._lock:
+            self._apply(path, new or {})
+
+    def sync(self, store):
+        """Bring the index up to date with `store` (reloads changed files)."""
+        for path in self.docs:
+            doc = store.get(path)
+            with self._lock:
+                # subscribed after the store had already loaded this file
+                if path not in self._indexed:
+                    self._apply(path, doc)
+
+    def _apply(self, path, doc):
+        before = self._indexed.get(path)
+        after = {}
+        for kind, list_key, key in self.docs[path]:
+            after[kind] = _grouped(doc.get(list_key, ()), key)
+        changed = 0
+        for kind, groups in after.items():
+            old_groups = before[kind] if before else {}
+            for k, entries in groups.items():
+                if old_groups.get(k) != entries:
+                    self._set_owner((kind, k), upload_refs(entries))
+                    changed += 1
+            for k in old_groups:
+                if k not in groups:
+                    self._set_owner((kind, k), set())
+                    changed += 1
+        self._indexed[path] = after
+        if before is None:
+            self.full_builds += 1
+        elif changed:
+            self.incremental_updates += 1
+
+    def _set_owner(self, owner, paths):
+        old = self._owners.get(owner, set())
+        for p in old - paths:
+            holders = self.refs.get(p)
+            if holders is not None:
+                holders.discard(owner)
+                if not holders:
+                    del self.refs[p]
+        for p in paths - old:
+            self.refs.setdefault(p, set()).add(owner)
+        if paths:
+            self._owners[owner] = paths
+        else:
+            self._owners.pop(owner, None)
+
+    # ---- lookups ----
+    def references(self, path):
+        with self._lock:
+            return set(self.refs.get(path, ()))
+
+    def is_referenced(self, path):
+        with self._lock:
+            return bool(self.refs.get(path))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'referenced_files': len(self.refs),
+                'references': sum(len(v) for v in self.refs.values()),
+                'full_builds': self.full_builds,
+                'incremental_updates': self.incremental_updates,
+            }
+
+
+class MediaCollector(object):
+
+    def __init__(self, index, store, upload_dir, derived_dir=None, grace=24 * 3600,
+                 batch_size=50, pause=1.0, limit=1000, retained=None, release_grace=3600, lock=None):
+        self.index = index
+        self.store = store
+        self.upload_dir = upload_dir
+        self.derived_dir = derived_dir
+        self.grace = grace
+        self.batch_size = batch_size
+        self.pause = pause
+        self.limit = limit
+        self.retained = retained
+        self.release_grace = release_grace
+        self.lock = lock                # fn() -> context manager held while deleting
+        self.deleted = 0
+        self.freed_bytes = 0
+        self.last_sweep = None
+
+    def _locked(self):
+        return self.lock() if self.lock else nullcontext()
+
+    def _kept(self):
+        return self.retained() if self.retained else frozenset()
+
+    def _web(self, name):
+        return os.path.join(self.upload_dir, name).replace('\\', '/')
+
+    def candidates(self, now=None):
+        """Unreferenced uploads past the grace period, oldest first."""
+        now = time.time() if now is None else now
+        self.index.sync(self.store)
+        kept = self._kept()
+        found = []
+        for entry in os.scandir(self.upload_dir):
+            if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                continue
+            src = self._web(entry.name)
+            if self.index.is_referenced(src) or src in kept:
+                continue
+            st = entry.stat(follow_symlinks=False)
+            age = now - st.st_mtime
+            if age < self.grace:
+                continue
+            found.append({'path': src, 'size': st.st_size, 'age': int(age)})
+        found.sort(key=lambda c: -c['age'])
+        return found
+
+    def sweep(self, dry_run=False, now=None):
+        """Delete up to `limit` candidates; returns the report either way."""
+        now = time.time() if now is None else now
+        found = self.candidates(now)[:self.limit]
+        report = {'dry_run': dry_run, 'candidates': found, 'deleted': [],
+                  'bytes': sum(c['size'] for c in found)}
+        if dry_run:
+            return report
+        for start in range(0, len(found), self.batch_size):
+            if start:
+                time.sleep(self.pause)
+            with self._locked():
+                # something may have started using a file since it was listed
+                self.index.sync(self.store)
+                for c in found[start:start + self.batch_size]:
+                    if self.index.is_referenced(c['path']) or self._fresh(c['path'], now, self.grace):
+                        continue
+                    if self.remove(c['path']):
+                        report['deleted'].append(c['path'])
+        deleted = set(report['deleted'])
+        report['bytes'] = sum(c['size'] for c in found if c['path'] in deleted)
+        self.last_sweep = {'at': time.time(), 'deleted': len(report['deleted']), 'bytes': report['bytes']}
+        return report
+
+    def _fresh(self, src, now, grace):
+        # younger than grace, or re-uploaded (dedup touches the file) since
+        try:
+            return now - os.path.getmtime(src) < grace
+        except OSError:
+            return True
+
+    def collect(self, paths, now=None):
+        """Delete these released uploads if nothing references them and they are
+        at least `release_grace` old; returns the deleted paths."""
+        root = os.path.abspath(self.upload_dir)
+        removed = []
+        with self._locked():
+            now = time.time() if now is None else now
+            self.index.sync(self.store)
+            kept = self._kept()
+            for src in paths:
+                src = (src or '').replace('\\', '/').lstrip('/')
+                if not src or os.path.dirname(os.path.abspath(src)) != root:
+                    continue
+                if self.index.is_referenced(src) or src in kept or self._fresh(src, now, self.release_grace):
+                    continue
+                if self.remove(src):
+                    removed.append(src)
+        return removed
+
+    def remove(self, src):
+        try:
+            size = os.path.getsize(src)
+            os.remove(src)
+        except FileNotFoundError:
+            return False
+        self.deleted += 1
+        self.freed_bytes += size
+        if self.derived_dir:
+            shutil.rmtree(os.path.join(self.derived_dir, 'uploads', os.path.splitext(os.path.basename(src))[0]),
+                          ignore_errors=True)
+        return True
+
+    def stats(self):
+        return {
+            'grace': self.grace,
+            'deleted': self.deleted,
+            'freed_bytes': self.freed_bytes,
+            'last_sweep': self.last_sweep,
+        }
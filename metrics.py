@@ -0,0 +1,286 @@
+"""In-process metrics in the Prometheus text format, per-request phase
+timers, and an opt-in profiler for slow requests.
+
+Counters, gauges and histograms live in a Registry; render() produces the
+text served on /metrics. Every worker process keeps its own registry, so
+scrape each worker (Prometheus sums them per job). Collectors registered
+with Registry.collect() are called at scrape time to turn the caches' and
+job queue's own stats() into samples.
+
+Code doing expensive work wraps it in `with phase('markdown'):` and
+reports file traffic with count_io('read', n). Both feed process-wide
+metrics and, when the thread is serving a request (begin_request /
+end_request), that request's own totals.
+"""
+import bisect
+import cProfile
+import os
+import threading
+import time
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))    # 1 KiB .. 1 GiB
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, _escape(v)) for k, v in pairs)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError('%s expects labels %r' % (self.name, self.labelnames))
+        return tuple(str(v) for v in labels)
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.type)]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return ['%s%s %s' % (self.name, _labels(self.labelnames, key), _number(value))]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, labels=()):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, amount=1, labels=()):
+        self.inc(-amount, labels)
+
+    def set(self, value, labels=()):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        Metric.__init__(self, name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            lines.append('%s_bucket%s %d' % (self.name, _labels(self.labelnames, key, [('le', _number(bound))]),
+                                             cumulative))
+        lines.append('%s_sum%s %s' % (self.name, _labels(self.labelnames, key), _number(total)))
+        lines.append('%s_count%s %d' % (self.name, _labels(self.labelnames, key), count))
+        return lines
+
+
+class Registry(object):
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collect(self, fn):
+        # fn() -> [(name, type, help, [(labels dict, value), ...]), ...]
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for fn in self._collectors:
+            for name, kind, help, samples in fn():
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s %s' % (name, kind))
+                for labels, value in samples:
+                    lines.append('%s%s %s' % (name, _labels(list(labels), list(labels.values())), _number(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+PHASE_SECONDS = REGISTRY.histogram('plh_phase_seconds', 'Time spent per phase of work (all threads).', ['phase'])
+IO_BYTES = REGISTRY.counter('plh_io_bytes_total', 'File bytes read/written by content and upload code.',
+                            ['direction', 'phase'])
+
+# ---- per-request accounting ----
+_local = threading.local()
+
+
+class RequestStats(object):
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.bytes = {'read': 0, 'written': 0}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def begin_request():
+    _local.request = RequestStats()
+    return _local.request
+
+
+def end_request():
+    stats = getattr(_local, 'request', None)
+    _local.request = None
+    return stats
+
+
+def _add_phase(name, seconds):
+    PHASE_SECONDS.observe(seconds, (name,))
+    req = getattr(_local, 'request', None)
+    if req is not None:
+        req.phases[name] = req.phases.get(name, 0.0) + seconds
+
+
+class phase(object):
+    """Context manager timing one phase of work; nested phases each count."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _add_phase(self.name, time.perf_counter() - self._started)
+
+
+def start_phase(name):
+    # for phases bracketed by two callbacks (e.g. template signals)
+    stack = getattr(_local, 'phases', None)
+    if stack is None:
+        stack = _local.phases = []
+    stack.append((name, time.perf_counter()))
+
+
+def stop_phase(name):
+    stack = getattr(_local, 'phases', None)
+    while stack:
+        started_name, started = stack.pop()
+        if started_name == name:
+            _add_phase(name, time.perf_counter() - started)
+            return
+
+
+def count_io(direction, nbytes, phase_name=''):
+    """Record file traffic; direction is 'read' or 'written'."""
+    IO_BYTES.inc(nbytes, (direction, phase_name))
+    req = getattr(_local, 'request', None)
+    if req is not None:
+        req.bytes[direction] += nbytes
+
+
+# ---- slow-request profiles ----
+class SlowRequestProfiler(object):
+    """cProfile requests; keep the .prof of those slower than `threshold`.
+
+    Only one request is profiled at a time (the interpreter allows a single
+    active profiler), so under load this samples rather than sees every
+    request. The newest `keep` profiles are kept in out_dir.
+    """
+
+    def __init__(self, out_dir, threshold, keep=50):
+        self.out_dir = out_dir
+        self.threshold = threshold
+        self.keep = keep
+        self._busy = threading.Lock()
+        self.dumped = 0
+
+    def start(self):
+        if not self.threshold or not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiler (a debugger, coverage) is active
+            self._busy.release()
+            return None
+        return profile
+
+    def stop(self, profile, seconds, label):
+        """Stop `profile`; returns the dump path if the request was slow."""
+        profile.disable()
+        self._busy.release()
+        if seconds < self.threshold:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        safe = ''.join(c if c.isalnum() or c in '-_' else '_' for c in label)[:80]
+        path = os.path.join(self.out_dir, '%s-%dms-%s.prof' % (time.strftime('%Y%m%d-%H%M%S'), seconds * 1000, safe))
+        profile.dump_stats(path)
+        self.dumped += 1
+        self._prune()
+        return path
+
+    def _prune(self):
+        paths = [os.path.join(self.out_dir, n) for n in os.listdir(self.out_dir) if n.endswith('.prof')]
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:-self.keep] if self.keep else ():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
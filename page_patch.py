@@ -0,0 +1,141 @@
+"""Section-level edits to a project page (PATCH /settings/pages/<project_id>).
+
+The page builder sends only what changed, as a list of operations applied
+in order to the stored page:
+
+    {"op": "add", "section": {...}, "index": 2}       (or "after": <id>)
+    {"op": "update", "id": "sec-1a2b3c4d", "set": {"images.3.caption": "..."},
+     "unset": ["subtitle"]}
+    {"op": "move", "id": "sec-1a2b3c4d", "index": 0}  (or "after": <id>)
+    {"op": "delete", "id": "sec-1a2b3c4d"}
+    {"op": "page", "set": {"title": "...", "excerpt": "..."}}
+
+"set"/"unset" keys are dotted paths into the section; numeric parts index
+lists. A new section keeps the id the client gave it if that id is free,
+otherwise it gets a fresh one (returned so the client can adopt it).
+"""
+import copy
+import re
+import uuid
+
+MAX_OPS = 500
+PAGE_FIELDS = ('title', 'excerpt')
+SECTION_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class PatchError(ValueError):
+    pass
+
+
+def new_section_id():
+    return 'sec-' + uuid.uuid4().hex[:8]
+
+
+def _position(sections, op, default):
+    if op.get('after') is not None:
+        return _find(sections, op['after']) + 1
+    index = op.get('index', default)
+    if not isinstance(index, int) or isinstance(index, bool):
+        raise PatchError('index must be an integer')
+    return max(0, min(index, len(sections)))
+
+
+def _find(sections, section_id):
+    for i, s in enumerate(sections):
+        if s.get('id') == section_id:
+            return i
+    raise PatchError('Unknown section: %s' % section_id)
+
+
+def _walk(target, path, create=False):
+    # (container, last key) for a dotted path
+    parts = path.split('.') if isinstance(path, str) and path else None
+    if not parts or parts[0] == 'id':
+        raise PatchError('Invalid path: %r' % (path,))
+    for part in parts[:-1]:
+        target = _step(target, part, create)
+    return target, _key(target, parts[-1])
+
+
+def _key(target, part):
+    if isinstance(target, list):
+        if not part.isdigit() or int(part) >= len(target):
+            raise PatchError('No such list item: %s' % part)
+        return int(part)
+    if not isinstance(target, dict) or not part:
+        raise PatchError('Invalid path segment: %s' % part)
+    return part
+
+
+def _step(target, part, create):
+    key = _key(target, part)
+    if isinstance(target, dict) and key not in target:
+        if not create:
+            raise PatchError('No such field: %s' % part)
+        target[key] = {}
+    return target[key]
+
+
+def _mapping(op, name):
+    value = op.get(name) or {}
+    if not isinstance(value, dict):
+        raise PatchError('%s must be an object' % name)
+    return value
+
+
+def apply_patch(page, ops):
+    """Apply `ops` to `page` in place.
+
+    Returns (ids assigned to added sections - by op index, copies of the
+    sections that were updated or deleted as they were before).
+    """
+    if not isinstance(ops, list) or not ops:
+        raise PatchError('ops must be a non-empty list')
+    if len(ops) > MAX_OPS:
+        raise PatchError('Too many operations (max %d)' % MAX_OPS)
+    sections = page.setdefault('sections', [])
+    added = {}
+    replaced = []
+    for n, op in enumerate(ops):
+        if not isinstance(op, dict):
+            raise PatchError('Operation %d is not an object' % n)
+        kind = op.get('op')
+        if kind == 'add':
+            section = op.get('section')
+            if not isinstance(section, dict):
+                raise PatchError('add needs a section object')
+            sid = section.get('id')
+            if not isinstance(sid, str) or not SECTION_ID.match(sid) or \
+                    any(s.get('id') == sid for s in sections):
+                sid = new_section_id()
+            section['id'] = sid
+            sections.insert(_position(sections, op, len(sections)), section)
+            added[n] = sid
+        elif kind == 'update':
+            section = sections[_find(sections, op.get('id'))]
+            replaced.append(copy.deepcopy(section))
+            for path, value in _mapping(op, 'set').items():
+                target, key = _walk(section, path, create=True)
+                target[key] = value
+            unset = op.get('unset') or []
+            if not isinstance(unset, list):
+                raise PatchError('unset must be a list')
+            for path in unset:
+                target, key = _walk(section, path)
+                if isinstance(target, list):
+                    target.pop(key)
+                else:
+                    target.pop(key, None)
+        elif kind == 'move':
+            section = sections.pop(_find(sections, op.get('id')))
+            sections.insert(_position(sections, op, len(sections)), section)
+        elif kind == 'delete':
+            replaced.append(sections.pop(_find(sections, op.get('id'))))
+        elif kind == 'page':
+            for field, value in _mapping(op, 'set').items():
+                if field not in PAGE_FIELDS:
+                    raise PatchError('Cannot set page field: %s' % field)
+                page[field] = value if isinstance(value, str) else ''
+        else:
+            raise PatchError('Unknown operation: %r' % (kind,))
+    return added, replaced
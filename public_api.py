@@ -0,0 +1,133 @@
+"""Query helpers for the read-only JSON API (/api/projects, /api/blog).
+
+parse_query() turns request args into a normalised, hashable query (so it
+can be part of a cache key) and select() runs it over a collection:
+filter -> cursor pagination -> field projection.
+
+Collections are ordered by a sort key plus the id (created_at for the public
+lists, the chosen column in the editor), and a cursor is opaque: base64 of
+[position, sort value, id] of the last item returned. The position is a
+shortcut taken while it still holds that item; otherwise the next page
+starts at the first item that sorts after the cursor's (value, id), so
+edits and deletions between requests don't break or repeat a listing.
+"""
+import base64
+import json
+
+BOOL_FILTERS = ('published', 'is_sold', 'is_coming')
+TRUE = {'1', 'true', 'yes', 'on'}
+FALSE = {'0', 'false', 'no', 'off'}
+
+
+class QueryError(ValueError):
+    pass
+
+
+def created(item):
+    return item.get('created_at')
+
+
+def order_key(item, key=created):
+    # (sort value, id) as strings, so entries missing either still compare
+    return (str(key(item) or ''), str(item.get('id') or ''))
+
+
+def encode_cursor(position, mark):
+    raw = json.dumps([position, mark[0], mark[1]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        position, value, item_id = json.loads(raw)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None, None
+    if not isinstance(position, int) or not isinstance(value, str) or not isinstance(item_id, str):
+        return None, None
+    return position, (value, item_id)
+
+
+def resolve_cursor(cursor, items, key=created, desc=False):
+    # next start offset after the cursor's item, or None if the cursor is malformed;
+    # `items` must be sorted by order_key (descending when desc)
+    position, mark = decode_cursor(cursor)
+    if mark is None:
+        return None
+    if 0 <= position < len(items) and order_key(items[position], key) == mark:
+        return position + 1
+    for i, item in enumerate(items):
+        k = order_key(item, key)
+        if (k < mark) if desc else (k > mark):
+            return i
+    return len(items)
+
+
+def _bool(name, value):
+    v = value.strip().lower()
+    if v in TRUE:
+        return True
+    if v in FALSE:
+        return False
+    raise QueryError('Invalid value for %s' % name)
+
+
+def parse_query(args, default_fields, default_limit=20, max_limit=100):
+    """Normalise ?fields=&published=&is_sold=&is_coming=&tags=&cursor=&limit=."""
+    fields = args.get('fields')
+    if fields:
+        fields = tuple(f for f in (x.strip() for x in fields.split(',')) if f)
+    else:
+        fields = tuple(default_fields)
+
+    filters = []
+    for name in BOOL_FILTERS:
+        if args.get(name) not in (None, ''):
+            filters.append((name, _bool(name, args.get(name))))
+    tags = args.get('tags')
+    if tags:
+        tags = tuple(sorted({t.strip().lower() for t in tags.split(',') if t.strip()}))
+        if tags:
+            filters.append(('tags', tags))
+
+    try:
+        limit = int(args.get('limit', default_limit))
+    except ValueError:
+        raise QueryError('Invalid limit')
+    limit = min(max(limit, 1), max_limit)
+
+    return (fields, tuple(filters), args.get('cursor') or None, limit)
+
+
+def _matches(item, filters):
+    for name, wanted in filters:
+        if name == 'tags':
+            have = {str(t).lower() for t in (item.get('tags') or ())}
+            if not have.intersection(wanted):
+                return False
+        elif bool(item.get(name)) != wanted:
+            return False
+    return True
+
+
+def project(item, fields):
+    return {k: item[k] for k in fields if item.get(k) is not None}
+
+
+def select(items, query, key=created, desc=False):
+    """Returns (projected items, next cursor); raises QueryError on a bad cursor.
+
+    `items` must already be sorted by order_key(item, key), descending if desc.
+    """
+    fields, filters, cursor, limit = query
+    if filters:
+        items = [i for i in items if _matches(i, filters)]
+    start = 0
+    if cursor:
+        start = resolve_cursor(cursor, items, key, desc)
+        if start is None:
+            raise QueryError('Invalid cursor')
+    page = items[start:start + limit]
+    end = start + len(page)
+    next_cursor = encode_cursor(end - 1, order_key(page[-1], key)) if page and end < len(items) else None
+    return [project(i, fields) for i in page], next_cursor
@@ -0,0 +1,149 @@
+"""Caches for rendered project pages and markdown sections.
+
+PageCache holds full HTML per slug, keyed by everything the output depends
+on (page/project updated_at, template mtime), with LRU eviction under a
+byte budget. Entries are dropped per slug when an editor saves or deletes.
+Markdown output is memoized per content hash so unchanged sections are
+never re-rendered, even when the page around them changes.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import markdown
+
+from metrics import phase
+
+
+class LRUCache(object):
+
+    def __init__(self, max_bytes=None, max_items=None):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._items = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, size=1):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._items[key] = (value, size)
+            self.bytes += size
+            while self._items and (
+                    (self.max_bytes is not None and self.bytes > self.max_bytes) or
+                    (self.max_items is not None and len(self._items) > self.max_items)):
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def discard(self, key):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._items)
+
+    def stats(self):
+        return {
+            'items': len(self._items),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+_markdown_cache = LRUCache(max_items=4096)
+
+
+def render_markdown(text):
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    html = _markdown_cache.get(key)
+    if html is None:
+        with phase('markdown'):
+            html = markdown.markdown(text, extensions=['extra'])
+        _markdown_cache.set(key, html)
+    return html
+
+
+def markdown_stats():
+    return _markdown_cache.stats()
+
+
+class PageCache(object):
+    """Rendered HTML per (slug, page updated_at, project updated_at, template version)."""
+
+    def __init__(self, max_bytes):
+        self._lru = LRUCache(max_bytes=max_bytes)
+        self._by_slug = {}  # slug -> set of keys
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(slug, page, project, template_version):
+        return (slug,
+                (page or {}).get('updated_at'),
+                project.get('updated_at'),
+                template_version)
+
+    @staticmethod
+    def etag_for(key):
+        # the key fully determines the output, so the ETag can be known
+        # before (and without) rendering
+        return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:32]
+
+    def get(self, key):
+        return self._lru.get(key)
+
+    def set(self, key, html):
+        body = html.encode('utf-8') if isinstance(html, str) else html
+        self._lru.set(key, body, len(body))
+        with self._lock:
+            keys = {k for k in self._by_slug.get(key[0], ()) if k in self._lru}
+            keys.add(key)
+            self._by_slug[key[0]] = keys
+
+    def invalidate(self, *slugs):
+        with self._lock:
+            keys = set()
+            for slug in slugs:
+                if slug:
+                    keys |= self._by_slug.pop(slug, set())
+        for k in keys:
+            self._lru.discard(k)
+
+    def clear(self):
+        with self._lock:
+            self._by_slug.clear()
+        self._lru.clear()
+
+    def stats(self):
+        return self._lru.stats()
@@ -0,0 +1,619 @@
+"""In-process full-text search over projects, blog posts and project pages.
+
+An inverted index (term -> {doc: weighted term frequency}) kept in step
+with the ContentStore the same way ContentIndex is: it subscribes to the
+store and, for every new version of posts.json / project_pages.json,
+re-indexes only the entries that changed. A project and its page are one
+document, so a match in a page section finds the project.
+
+Queries are AND over terms, ranked with BM25 (title/header/tags weigh
+more than body text). The last term - and any term ending in '*' - is a
+prefix, so typing "gard" already finds "garden". Snippets are escaped
+HTML with the matched words in <mark>.
+
+To stay fast on large corpora, postings hold precomputed BM25 impacts and
+queries never score every match. Each word is read as a stream of
+documents in impact order (a prefix merges the streams of its
+completions); the streams are read in turn and a document is scored by
+direct lookups the first time it shows up, until the `limit`-th best score
+is out of reach of anything not seen yet (Fagin's threshold algorithm).
+Words common to most of the corpus spread their scores thinly, so the
+reads are capped at MAX_READS: past that the answer is the best of the
+documents already seen, i.e. of those near the top for at least one word.
+When the matches are few - rare words, or a filter leaving few visible
+documents - an AND of int bitsets finds them and they are scored directly.
+The impact-ordered lists and bitsets of common words, and the bitsets of
+the public/editor/per-type views, are built with the index and updated
+by every edit, so no query pays for them.
+"""
+import bisect
+import heapq
+import html
+import math
+import re
+import threading
+import unicodedata
+from itertools import repeat
+from operator import add, mul
+
+# field -> weight; a hit in the title counts as much as three in the body
+FIELDS = (
+    ('title', 3.0),
+    ('header', 2.0),
+    ('subheader', 1.5),
+    ('tags', 2.0),
+    ('excerpt', 1.0),
+    ('content', 1.0),
+)
+SNIPPET_FIELDS = ('excerpt', 'content', 'subheader', 'header', 'title')
+WORD = re.compile(r'[^\W_]+')
+ONE = re.compile('1')
+MD_NOISE = re.compile(r'!\[[^\]]*\]\([^)]*\)|\]\([^)]*\)|<[^>]+>|[#*_`>~|\[]+')
+K1 = 1.2
+B = 0.75
+MAX_EXPANSIONS = 64
+MIN_PREFIX = 2
+DIRECT = 2048       # at most this many matches are scored outright
+MAX_READS = 2048    # otherwise at most this many postings are read per query
+EAGER = 256         # terms in at least this many documents keep their ranking and bitset ready
+BULK = 512          # past this many changed entries, rebuild those instead of updating them
+DIFF_SLICE = 512    # entries compared at a time when looking for the edited ones
+TYPES = ('project', 'blog')
+# visibility filters kept ready: (type or None for all, include_unpublished)
+VIEWS = tuple((t, drafts) for t in (None,) + TYPES for drafts in (False, True))
+
+
+def fold(text):
+    # lowercase and strip accents, so "Cafe" finds "Café"
+    text = text.lower()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return WORD.findall(fold(text)) if text else []
+
+
+def plain_text(value):
+    if isinstance(value, str):
+        return MD_NOISE.sub(' ', value)
+    if isinstance(value, (list, tuple)):
+        return ' '.join(plain_text(v) for v in value)
+    if isinstance(value, dict):
+        return ' '.join(plain_text(v) for v in value.values())
+    return ''
+
+
+def bitset(numbers):
+    bits_ = bytearray((max(numbers) >> 3) + 1 if numbers else 0)
+    for n in numbers:
+        bits_[n >> 3] |= 1 << (n & 7)
+    return int.from_bytes(bits_, 'little')
+
+
+def bits(mask):
+    # positions of the set bits, lowest first
+    s = bin(mask)[:1:-1]
+    return [m.start() for m in ONE.finditer(s)]
+
+
+def _rank(posting):
+    # doc numbers by impact, highest first; ties by doc number, so that any
+    # document's place can be found by bisection
+    return sorted(sorted(posting), key=posting.__getitem__, reverse=True)
+
+
+def _place(ranked, posting, doc):
+    # where doc is, or goes, in ranked
+    impact = posting[doc]
+    lo, hi = 0, len(ranked)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        other = ranked[mid]
+        if posting[other] > impact or (posting[other] == impact and other < doc):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _insort(ranked, posting, doc):
+    ranked.insert(_place(ranked, posting, doc), doc)
+
+
+def _unsort(ranked, posting, doc):
+    # while posting still holds doc's impact
+    del ranked[_place(ranked, posting, doc)]
+
+
+def _keyed(items, key):
+    # key -> entry; later duplicates of an id get their own key
+    out = {}
+    for i, e in enumerate(items):
+        k = e.get(key) or '#%d' % i
+        while k in out:
+            k = '%s#%d' % (k, i)
+        out[k] = e
+    return out
+
+
+class SearchIndex(object):
+
+    def __init__(self, posts_path, pages_path):
+        self.posts_path = posts_path
+        self.pages_path = pages_path
+        self._lock = threading.Lock()
+        self._projects = {}     # id -> project entry, as last indexed
+        self._blog = {}
+        self._pages = {}        # project_id -> page entry
+        self.postings = {}      # term -> {doc number: BM25 term impact (idf applied at query time)}
+        self._ranked = {}       # term -> doc numbers by impact, highest first (common terms only)
+        self._numbers = {}      # doc key -> small int used in postings and bitsets
+        self._free = []         # numbers of removed documents, reused first
+        self._masks = {}        # term -> int bitset of its doc numbers (likewise)
+        self.vocabulary = []    # sorted terms, for prefix lookups
+        self._completions = {}  # prefix -> expanded terms, until a term with that prefix comes or goes
+        self.doc_terms = {}     # doc number -> {term: weighted tf}
+        self.doc_len = {}
+        self.docs = {}          # doc number -> {'type', 'id', 'entry', 'fields', 'published'}
+        self.total_len = 0.0
+        self._avg = None        # average length the stored impacts were computed with
+        self._added = []        # vocabulary changes not merged yet
+        self._dropped = []
+        self._visible = {view: [0, set()] for view in VIEWS}    # view -> [bitset, set] of its doc numbers
+        self._lists = {}        # list name -> (entries, their keys) as last indexed
+        self._bulk = False      # re-indexing many entries: derived structures are rebuilt after
+        self.full_builds = 0
+        self.incremental_updates = 0
+        self.queries = 0
+
+    # ---- store listener ----
+    def on_content_change(self, path, old, new):
+        new = new or {}
+        with self._lock:
+            if path == self.posts_path:
+                first = not self._projects and not self._blog
+                lists = (('projects', 'id', self._projects, self._index_project),
+                         ('blog', 'id', self._blog, self._index_blog))
+            elif path == self.pages_path:
+                first = not self._pages
+                lists = (('project_pages', 'project_id', self._pages, self._index_project),)
+            else:
+                return
+            todo = []
+            for name, key, current, reindex in lists:
+                todo.extend((reindex, k) for k in self._diff(name, new.get(name, ()), key, current))
+            if todo:
+                # a big change skips the per-document upkeep of rankings,
+                # bitsets and views and rebuilds them once at the end
+                bulk = self._bulk = len(todo) > BULK
+                try:
+                    for reindex, k in todo:
+                        reindex(k)
+                finally:
+                    self._bulk = False
+                    self._merge_vocabulary()
+                    if self._renormalise() or bulk:
+                        self._prepare()
+            if first:
+                self.full_builds += 1
+            elif todo:
+                self.incremental_updates += 1
+
+    def _diff(self, name, items, key, current):
+        """Keys of the entries added, changed or removed since `name` was last
+        indexed; brings `current` up to date."""
+        items = tuple(items)    # the store's lists are tuples already; others might change under us
+        last = self._lists.get(name)
+        if last is not None and len(last[0]) == len(items):
+            # same length: usually an edit. The store shares every untouched
+            # entry with the previous version and tuples compare by identity
+            # first, so comparing slices finds the edited ones cheaply
+            before, keys = last
+            moved = []
+            for lo in range(0, len(items), DIFF_SLICE):
+                hi = lo + DIFF_SLICE
+                if before[lo:hi] != items[lo:hi]:
+                    moved.extend(i for i in range(lo, min(hi, len(items))) if before[i] != items[i])
+            if all(items[i].get(key) == before[i].get(key) for i in moved):
+                self._lists[name] = (items, keys)
+                current.update((keys[i], items[i]) for i in moved)
+                return [keys[i] for i in moved]
+        latest = _keyed(items, key)
+        changed = [k for k, e in latest.items() if current.get(k) is not e and current.get(k) != e]
+        removed = [k for k in current if k not in latest]
+        for k in removed:
+            del current[k]
+        current.update((k, latest[k]) for k in changed)
+        self._lists[name] = (items, list(latest))
+        return changed + removed
+
+    def _index_project(self, pid):
+        p = self._projects.get(pid)
+        page = self._pages.get(pid) or {}
+        if p is None:
+            self._remove(('project', pid))
+            return
+        sections = page.get('sections') or ()
+        excerpts = [p.get('excerpt')]
+        if page.get('excerpt') != p.get('excerpt'):
+            excerpts.append(page.get('excerpt'))
+        fields = {
+            'title': p.get('title') or '',
+            'header': p.get('header') or '',
+            'subheader': p.get('subheader') or '',
+            'tags': plain_text(p.get('tags') or ''),
+            'excerpt': ' '.join(filter(None, excerpts)),
+            'content': plain_text([
+                [s.get('title'), s.get('header'), s.get('subheader'), s.get('excerpt'), s.get('content'),
+                 [im.get('caption') for im in s.get('images') or () if isinstance(im, dict)]]
+                for s in sections
+            ]),
+        }
+        self._add(('project', pid), p, fields)
+
+    def _index_blog(self, bid):
+        b = self._blog.get(bid)
+        if b is None:
+            self._remove(('blog', bid))
+            return
+        fields = {
+            'title': b.get('title') or '',
+            'header': b.get('header') or '',
+            'subheader': b.get('subheader') or '',
+            'tags': plain_text(b.get('tags') or ''),
+            'excerpt': b.get('excerpt') or '',
+            'content': plain_text(b.get('content') or ''),
+        }
+        self._add(('blog', bid), b, fields)
+
+    def _add(self, key, entry, fields):
+        self._remove(key)
+        terms = {}
+        length = 0
+        for name, weight in FIELDS:
+            for t in tokenize(fields[name]):
+                terms[t] = terms.get(t, 0.0) + weight
+                length += 1
+        doc = self._numbers[key] = self._free.pop() if self._free else len(self._numbers) + len(self._free)
+        self.doc_terms[doc] = terms
+        self.doc_len[doc] = length
+        self.total_len += length
+        norm = self._norm(length)
+        for t, tf in terms.items():
+            posting = self.postings.get(t)
+            if posting is None:
+                posting = self.postings[t] = {}
+                self._added.append(t)
+            posting[doc] = tf * (K1 + 1) / (tf + norm)
+            if self._bulk:
+                continue
+            ranked = self._ranked.get(t)
+            if ranked is not None:
+                _insort(ranked, posting, doc)
+                self._masks[t] |= 1 << doc
+            elif len(posting) >= EAGER:
+                self._ranked[t] = _rank(posting)
+                self._masks[t] = bitset(posting)
+        d = self.docs[doc] = {'type': key[0], 'id': entry.get('id'), 'entry': entry, 'fields': fields,
+                              'published': bool(entry.get('published'))}
+        if not self._bulk:
+            for view, visible in self._visible.items():
+                if self._in_view(d, view):
+                    visible[0] |= 1 << doc
+                    visible[1].add(doc)
+
+    def _remove(self, key):
+        doc = self._numbers.pop(key, None)
+        if doc is None:
+            return
+        for t in self.doc_terms.pop(doc):
+            posting = self.postings[t]
+            if len(posting) == 1:
+                del self.postings[t]
+                self._ranked.pop(t, None)
+                self._masks.pop(t, None)
+                self._dropped.append(t)
+                continue
+            if not self._bulk and t in self._ranked:
+                _unsort(self._ranked[t], posting, doc)
+                self._masks[t] &= ~(1 << doc)
+            del posting[doc]
+        self.total_len -= self.doc_len.pop(doc)
+        del self.docs[doc]
+        if not self._bulk:
+            for visible in self._visible.values():
+                if doc in visible[1]:
+                    visible[0] &= ~(1 << doc)
+                    visible[1].discard(doc)
+        self._free.append(doc)
+
+    @staticmethod
+    def _in_view(d, view):
+        kind, include_unpublished = view
+        return (kind is None or d['type'] == kind) and (include_unpublished or d['published'])
+
+    def _prepare(self):
+        # rankings and bitsets of the common terms, and the views, all built
+        # here so that no query has to
+        self._ranked = {t: _rank(posting) for t, posting in self.postings.items() if len(posting) >= EAGER}
+        self._masks = {t: bitset(self.postings[t]) for t in self._ranked}
+        for view in VIEWS:
+            docs = [doc for doc, d in self.docs.items() if self._in_view(d, view)]
+            self._visible[view] = [bitset(docs), set(docs)]
+
+    def _norm(self, length):
+        avg = self._avg or (self.total_len / (len(self.doc_len) or 1)) or 1.0
+        return K1 * (1 - B + B * length / avg)
+
+    def _renormalise(self):
+        # impacts depend on the average document length; recompute them all
+        # only when it has drifted noticeably (first build, big imports);
+        # True if they were, and the rankings need sorting again
+        avg = (self.total_len / (len(self.doc_len) or 1)) or 1.0
+        if self._avg is not None and abs(avg - self._avg) <= 0.1 * self._avg:
+            return False
+        self._avg = avg
+        for doc, terms in self.doc_terms.items():
+            norm = self._norm(self.doc_len[doc])
+            for t, tf in terms.items():
+                self.postings[t][doc] = tf * (K1 + 1) / (tf + norm)
+        return True
+
+    def _merge_vocabulary(self):
+        added, dropped = self._added, self._dropped
+        self._added, self._dropped = [], []
+        if len(added) + len(dropped) > 32:
+            # bulk change (first build, big import): one sort beats many inserts
+            self._completions = {}
+            self.vocabulary = sorted(self.postings)
+            return
+        for prefix in [p for p in self._completions if any(t.startswith(p) for t in added + dropped)]:
+            del self._completions[prefix]
+        for t in dropped:
+            i = bisect.bisect_left(self.vocabulary, t)
+            if i < len(self.vocabulary) and self.vocabulary[i] == t and t not in self.postings:
+                del self.vocabulary[i]
+        for t in added:
+            i = bisect.bisect_left(self.vocabulary, t)
+            if (i == len(self.vocabulary) or self.vocabulary[i] != t) and t in self.postings:
+                self.vocabulary.insert(i, t)
+
+    # ---- querying ----
+    def _expand(self, term, prefix):
+        if not prefix or len(term) < MIN_PREFIX:
+            return [term] if term in self.postings else []
+        terms = self._completions.get(term)
+        if terms is None:
+            lo = bisect.bisect_left(self.vocabulary, term)
+            hi = bisect.bisect_left(self.vocabulary, term + '\uffff')
+            terms = self.vocabulary[lo:hi]
+            if len(terms) > MAX_EXPANSIONS:
+                # keep the most common completions
+                terms = heapq.nlargest(MAX_EXPANSIONS, terms, key=lambda t: len(self.postings[t]))
+            if len(self._completions) >= 4096:
+                self._completions.clear()
+            self._completions[term] = terms
+        return terms
+
+    def _ranking(self, term):
+        ranked = self._ranked.get(term)
+        if ranked is None:
+            # a rare term: sorting its few documents is cheaper than keeping them sorted
+            posting = self.postings[term]
+            ranked = _rank(posting)
+        return ranked
+
+    def _scored(self, posting, idf, term):
+        for doc in self._ranking(term):
+            yield idf * posting[doc], doc
+
+    def _stream(self, expansions):
+        # (score, doc) for one query word, best first; a document matching
+        # several completions of a prefix comes first with its best one
+        if len(expansions) == 1:
+            return self._scored(*expansions[0])
+        return heapq.merge(*[self._scored(*e) for e in expansions], reverse=True)
+
+    @staticmethod
+    def _scorer(expansions):
+        # fn(doc) -> the word's score for doc, 0 if it doesn't match
+        if len(expansions) == 1:
+            posting, idf, _ = expansions[0]
+            get = posting.get
+            return lambda doc: idf * get(doc, 0.0)
+        pairs = [(posting.get, idf) for posting, idf, _ in expansions]
+        return lambda doc: max([idf * get(doc, 0.0) for get, idf in pairs])
+
+    def _top(self, per_word, visible, limit):
+        """[(score, doc)] best first, reading the words' streams in turn."""
+        visible = visible[1] if visible is not None else None
+        streams = [self._stream(e) for e in per_word]
+        seen = set()
+        if len(streams) == 1:
+            # one word: the stream is already in score order
+            top = []
+            for score, doc in streams[0]:
+                if doc not in seen and (visible is None or doc in visible):
+                    seen.add(doc)
+                    top.append((score, doc))
+                    if len(top) == limit:
+                        break
+            return top
+        # threshold algorithm: stop once the limit-th score beats the sum of
+        # the scores last read from each stream, or after MAX_READS reads
+        others = []
+        for i in range(len(per_word)):
+            others.append([self._scorer(e) for j, e in enumerate(per_word) if j != i])
+        last = [0.0] * len(streams)
+        top = []    # min-heap of (score, doc)
+        for _ in range(max(1, MAX_READS // len(streams))):
+            for i, stream in enumerate(streams):
+                hit = next(stream, None)
+                if hit is None:
+                    # every document matching this word has been seen
+                    return sorted(top, reverse=True)
+                score, doc = hit
+                last[i] = score
+                if doc in seen:
+                    continue
+                seen.add(doc)
+                if visible is not None and doc not in visible:
+                    continue
+                total = score
+                for word_score in others[i]:
+                    s = word_score(doc)
+                    if not s:
+                        break
+                    total += s
+                else:
+                    if len(top) < limit:
+                        heapq.heappush(top, (total, doc))
+                    elif total > top[0][0]:
+                        heapq.heapreplace(top, (total, doc))
+            if len(top) == limit and top[0][0] >= sum(last):
+                break
+        return sorted(top, reverse=True)
+
+    def _mask(self, term):
+        mask = self._masks.get(term)
+        return mask if mask is not None else bitset(self.postings[term])
+
+    def _visible_docs(self, kind, include_unpublished):
+        # [bitset, set] of the documents to return; None when that's all of them
+        visible = self._visible[kind, include_unpublished]
+        return None if len(visible[1]) == len(self.docs) else visible
+
+    def parse(self, query):
+        # [(term, is_prefix)]; "post-war*" -> [('post', False), ('war', True)]
+        query = query or ''
+        raw = query.split()
+        words = []
+        for i, w in enumerate(raw):
+            prefix = w.endswith('*') or (i == len(raw) - 1 and not query[-1:].isspace())
+            tokens = tokenize(w)
+            words.extend((t, prefix and j == len(tokens) - 1) for j, t in enumerate(tokens))
+        return words
+
+    def search(self, query, limit=10, types=None, include_unpublished=False):
+        """Top `limit` hits as dicts: type, id, entry, score, snippet."""
+        words = self.parse(query)
+        if not words:
+            return []
+        kind = None
+        if types is not None:
+            kinds = set(types).intersection(TYPES)
+            if not kinds:
+                return []
+            kind = None if len(kinds) == len(TYPES) else kinds.pop()
+        with self._lock:
+            self.queries += 1
+            n = len(self.docs) or 1
+            per_word = []
+            for term, prefix in words:
+                expansions = self._expand(term, prefix)
+                if not expansions:
+                    return []
+                per_word.append([(self.postings[t], self._idf(len(self.postings[t]), n), t) for t in expansions])
+            visible = self._visible_docs(kind, include_unpublished)
+            if visible is not None and not visible[1]:
+                return []
+            if len(per_word) == 1 and (visible is None or len(visible[1]) > DIRECT):
+                top = self._top(per_word, visible, limit)
+            else:
+                # AND of per-word bitsets (a prefix ORs its completions)
+                match = visible[0] if visible is not None else -1
+                for expansions in per_word:
+                    word = 0
+                    for _, _, t in expansions:
+                        word |= self._mask(t)
+                    match &= word
+                    if not match:
+                        return []
+                if bin(match).count('1') > DIRECT:
+                    top = self._top(per_word, visible, limit)
+                else:
+                    top = self._score_all(per_word, bits(match), limit)
+            top = [(doc, s) for s, doc in top]
+            docs = self.docs
+            terms = [t for t, _ in words]
+            return [dict(type=docs[doc]['type'], id=docs[doc]['id'], entry=docs[doc]['entry'], score=round(s, 4),
+                         snippet=snippet(docs[doc]['fields'], terms))
+                    for doc, s in top]
+
+    @staticmethod
+    def _score_all(per_word, matched, limit):
+        totals = [0.0] * len(matched)
+        wanted = None
+        for expansions in per_word:
+            if len(expansions) == 1:
+                posting, idf, _ = expansions[0]
+                scores = map(mul, repeat(idf), map(posting.__getitem__, matched))
+            else:
+                # a prefix: each document scores its best completion
+                if wanted is None:
+                    wanted = set(matched)
+                best = dict.fromkeys(matched, 0.0)
+                for posting, idf, _ in expansions:
+                    for doc in wanted.intersection(posting):
+                        s = idf * posting[doc]
+                        if s > best[doc]:
+                            best[doc] = s
+                scores = map(best.__getitem__, matched)
+            totals = list(map(add, totals, scores))
+        return heapq.nlargest(limit, zip(totals, matched))
+
+    @staticmethod
+    def _idf(df, n):
+        # BM25 idf, floored so very common words still count a little
+        return max(0.01, math.log(1 + (n - df + 0.5) / (df + 0.5)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'documents': len(self.docs),
+                'terms': len(self.postings),
+                'full_builds': self.full_builds,
+                'incremental_updates': self.incremental_updates,
+                'queries': self.queries,
+            }
+
+
+def snippet(fields, terms, width=160):
+    """Escaped excerpt around the first match, matches wrapped in <mark>."""
+    # words starting with a term; on ASCII text one regex over the lowercased text finds them
+    starts = re.compile(r'(?<![^\W_])(?:%s)[^\W_]*' % '|'.join(map(re.escape, terms)))
+    for name in SNIPPET_FIELDS:
+        text = ' '.join(fields.get(name, '').split())
+        if not text:
+            continue
+        if text.isascii():
+            spans = [m.span() for m in starts.finditer(text.lower())]
+        else:
+            spans = [m.span() for m in WORD.finditer(text) if any(fold(m.group(0)).startswith(t) for t in terms)]
+        if not spans:
+            continue
+        start = max(0, spans[0][0] - width // 3)
+        if start:
+            # don't cut a word in half
+            space = text.find(' ', start)
+            start = space + 1 if 0 <= space < spans[0][0] else start
+        end = min(len(text), start + width)
+        out = ['…' if start else '']
+        pos = start
+        for a, b in spans:
+            if a < start:
+                continue
+            if b > end:
+                break
+            out.append(html.escape(text[pos:a]))
+            out.append('<mark>%s</mark>' % html.escape(text[a:b]))
+            pos = b
+        out.append(html.escape(text[pos:end]))
+        if end < len(text):
+            out.append('…')
+        return ''.join(out)
+    text = ' '.join((fields.get('excerpt') or fields.get('content') or '').split())
+    return html.escape(text[:width]) + ('…' if len(text) > width else '')
@@ -0,0 +1,351 @@
+"""Versioned binary snapshot of the content, shared by every worker.
+
+One process writes instance/content.snap after each save (SnapshotStore.
+rebuild); every worker maps it read-only and answers the public lookups
+(project by slug/id, page by project, blog post by id, the published
+lists) from it. Entries are decoded from the mapping only when asked for,
+so a worker holds just the entries it served recently, and a fresh worker
+serves its first project page without parsing posts.json or
+project_pages.json.
+
+Layout (little-endian):
+
+    b'PLHSNAP1', u32 toc length, toc (JSON), data
+
+The toc records the snapshot version, the signatures of the sources it was
+built from and, per table, (offset, count). Entry tables are (u64 offset,
+u32 length) of compact JSON per entry, in document order; indexes are
+(u64 key offset, u32 key length, u32 entry) sorted by key for binary
+search; lists are u32 entry numbers (the published entries in document
+order, and again in the public API's cursor order).
+
+A new version is written to a temporary file and renamed over the old
+one. Readers stat the path and map the new file when its inode changes;
+the old mapping stays valid until the last reference to it goes away.
+A snapshot is only used while its recorded source signatures match the
+live ones, so a save not yet reflected in it falls back to the
+in-process index rather than serving stale data.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from content_store import file_signature, freeze
+from metrics import count_io, phase
+from public_api import order_key
+from storage import file_lock
+
+MAGIC = b'PLHSNAP1'
+HEADER = struct.Struct('<I')
+ENTRY = struct.Struct('<QI')
+KEY = struct.Struct('<QII')
+NUMBER = struct.Struct('<I')
+KINDS = (('posts', 'projects'), ('posts', 'blog'), ('pages', 'project_pages'))
+KEY_FIELDS = {'projects': 'id', 'blog': 'id', 'project_pages': 'project_id'}
+DECODED_MAX = 1024
+
+
+def _signature(sig):
+    # JSON turns tuples into lists; compare as tuples
+    return tuple(sig) if isinstance(sig, (list, tuple)) else sig
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def build(version, posts, pages, slugify, sources, previous=None):
+    """Serialize the documents; returns (snapshot bytes, reuse info for the next build).
+
+    `previous` is (Snapshot, {kind: {key: (entry, number)}}) from the last
+    build of that file: entries equal to their old copy are copied from it
+    instead of being encoded again.
+    """
+    docs = {'posts': posts, 'pages': pages}
+    data = bytearray()
+    toc = {'version': version, 'created_at': time.time(), 'sources': sources,
+           'kinds': {}, 'indexes': {}, 'lists': {}, 'extra': {}}
+    old, old_keys = previous or (None, {})
+
+    def table(rows, pack):
+        offset = len(data)
+        for row in rows:
+            data.extend(pack(*row))
+        return [offset, len(rows)]
+
+    entries = {}
+    keyed = {}
+    for doc, kind in KINDS:
+        items = docs[doc].get(kind) or ()
+        field = KEY_FIELDS[kind]
+        before = old_keys.get(kind, {})
+        now = keyed[kind] = {}
+        rows = []
+        for i, e in enumerate(items):
+            key = e.get(field)
+            prev = before.get(key)
+            if prev is not None and prev[0] == e:
+                blob = old.raw(kind, prev[1])
+            else:
+                blob = json.dumps(e, separators=(',', ':')).encode('utf-8')
+            rows.append((len(data), len(blob)))
+            data.extend(blob)
+            now[key] = (e, i)
+        toc['kinds'][kind] = table(rows, ENTRY.pack)
+        entries[kind] = items
+    for doc in ('posts', 'pages'):
+        kinds = {kind for d, kind in KINDS if d == doc}
+        toc['extra'][doc] = {k: v for k, v in docs[doc].items() if k not in kinds}
+
+    def index(name, kind, key):
+        # first entry wins, as in ContentIndex
+        found = {}
+        for i, e in enumerate(entries[kind]):
+            k = key(e)
+            if k:
+                found.setdefault(k, i)
+        rows = []
+        for k in sorted(found, key=lambda k: k.encode('utf-8')):
+            raw = k.encode('utf-8')
+            rows.append((len(data), len(raw), found[k]))
+            data.extend(raw)
+        toc['indexes'][name] = table(rows, KEY.pack)
+
+    index('project_id', 'projects', lambda p: p.get('id'))
+    index('project_slug', 'projects', lambda p: p.get('slug'))
+    index('project_link_slug', 'projects', lambda p: slugify(p['link']) if p.get('link') else '')
+    index('blog_id', 'blog', lambda b: b.get('id'))
+    index('page_project', 'project_pages', lambda e: e.get('project_id'))
+    for kind in ('projects', 'blog'):
+        published = [i for i, e in enumerate(entries[kind]) if e.get('published')]
+        toc['lists']['published_' + kind] = table([(i,) for i in published], NUMBER.pack)
+        toc['lists']['listed_' + kind] = table(
+            [(i,) for i in sorted(published, key=lambda i: order_key(entries[kind][i]))], NUMBER.pack)
+
+    head = json.dumps(toc, separators=(',', ':')).encode('utf-8')
+    return MAGIC + HEADER.pack(len(head)) + head + bytes(data), keyed
+
+
+class Snapshot(object):
+    """One mapped snapshot file; lookups mirror ContentIndex."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.signature = file_signature(path)
+            self.size = os.fstat(f.fileno()).st_size
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:len(MAGIC)] != MAGIC:
+            raise SnapshotError('%s is not a content snapshot' % path)
+        start = len(MAGIC) + HEADER.size
+        toc_len, = HEADER.unpack_from(mm, len(MAGIC))
+        toc = json.loads(mm[start:start + toc_len])
+        self._base = start + toc_len
+        self.version = toc['version']
+        self.created_at = toc['created_at']
+        self.sources = {path: _signature(sig) for path, sig in toc['sources'].items()}
+        self._kinds = toc['kinds']
+        self._indexes = toc['indexes']
+        self._lists = toc['lists']
+        self._extra = toc['extra']
+        self._decoded = {}
+        self._published = {}
+        self._lock = threading.Lock()
+        self.decodes = 0
+        count_io('read', start + toc_len, 'snapshot')
+
+    def count(self, kind):
+        return self._kinds[kind][1]
+
+    def raw(self, kind, i):
+        offset, count = self._kinds[kind]
+        if not 0 <= i < count:
+            raise IndexError(i)
+        start, length = ENTRY.unpack_from(self._mm, self._base + offset + i * ENTRY.size)
+        start += self._base
+        return self._mm[start:start + length]
+
+    def entry(self, kind, i):
+        key = (kind, i)
+        hit = self._decoded.get(key)
+        if hit is not None:
+            return hit
+        blob = self.raw(kind, i)
+        item = freeze(json.loads(blob))
+        self.decodes += 1
+        count_io('read', len(blob), 'snapshot')
+        with self._lock:
+            if len(self._decoded) >= DECODED_MAX:
+                self._decoded.clear()
+            self._decoded[key] = item
+        return item
+
+    def items(self, kind):
+        for i in range(self.count(kind)):
+            yield self.entry(kind, i)
+
+    def find(self, name, key):
+        if not key:
+            return None
+        offset, count = self._indexes[name]
+        target = key.encode('utf-8')
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, length, number = KEY.unpack_from(self._mm, self._base + offset + mid * KEY.size)
+            start += self._base
+            probe = self._mm[start:start + length]
+            if probe == target:
+                return number
+            if probe < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def _lookup(self, kind, names, key):
+        for name in names:
+            i = self.find(name, key)
+            if i is not None:
+                return self.entry(kind, i)
+        return None
+
+    # ---- ContentIndex-compatible lookups ----
+    def project_by_slug(self, slug):
+        return self._lookup('projects', ('project_slug', 'project_link_slug'), slug)
+
+    def project_by_id(self, project_id):
+        return self._lookup('projects', ('project_id',), project_id)
+
+    def blog_post(self, blog_id):
+        return self._lookup('blog', ('blog_id',), blog_id)
+
+    def page_for_project(self, project_id):
+        return self._lookup('project_pages', ('page_project',), project_id)
+
+    def _list(self, name, kind):
+        # tuple of the entries a list names, built once per snapshot
+        hit = self._published.get(name)
+        if hit is None:
+            offset, count = self._lists[name]
+            base = self._base + offset
+            hit = tuple(self.entry(kind, NUMBER.unpack_from(self._mm, base + n * NUMBER.size)[0])
+                        for n in range(count))
+            self._published[name] = hit
+        return hit
+
+    def published(self, kind):
+        return self._list('published_' + kind, kind)
+
+    def listed(self, kind):
+        # published entries in cursor order, (created_at, id)
+        if 'listed_' + kind not in self._lists:
+            # written before the list existed
+            return tuple(sorted(self.published(kind), key=order_key))
+        return self._list('listed_' + kind, kind)
+
+    def extra(self, doc):
+        return self._extra.get(doc, {})
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'bytes': self.size,
+            'projects': self.count('projects'),
+            'blog': self.count('blog'),
+            'pages': self.count('project_pages'),
+            'decoded': len(self._decoded),
+            'decodes': self.decodes,
+        }
+
+
+class SnapshotStore(object):
+    """The current Snapshot at `path`, re-mapped when another process replaces it."""
+
+    def __init__(self, path):
+        self.path = path
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._previous = None   # (signature, entries) of the file this process wrote last
+        self._link_slugs = {}
+        self.swaps = 0
+        self.stale = 0
+        self.builds = 0
+        self.reused = 0
+
+    def load(self):
+        sig = file_signature(self.path)
+        snap = self._snapshot
+        if snap is not None and snap.signature == sig:
+            return snap
+        if sig is None:
+            self._snapshot = None
+            return None
+        with self._lock:
+            snap = self._snapshot
+            if snap is None or snap.signature != sig:
+                try:
+                    fresh = Snapshot(self.path)
+                except (OSError, ValueError):
+                    return None
+                if snap is None or fresh.version >= snap.version:
+                    self._snapshot = snap = fresh
+                    self.swaps += 1
+        return snap
+
+    def current(self, source_signature):
+        """The snapshot, if it was built from the sources as they are now."""
+        snap = self.load()
+        if snap is None:
+            return None
+        for path, sig in snap.sources.items():
+            if _signature(source_signature(path)) != sig:
+                self.stale += 1
+                return None
+        return snap
+
+    def rebuild(self, source_signature, read, slugify):
+        """Write a new version unless the current one is up to date.
+
+        read() -> (posts, pages, {path: signature}) is called under the lock,
+        so whichever process rebuilds last writes the newest content.
+        """
+        with file_lock(self.path + '.lock'):
+            if self.current(source_signature) is not None:
+                return None
+            old = self.load()
+            previous = None
+            if old is not None and self._previous is not None and self._previous[0] == old.signature:
+                previous = (old, self._previous[1])
+            with phase('snapshot_build'):
+                posts, pages, sources = read()
+                body, keyed = build((old.version if old else 0) + 1, posts, pages, self._memo_slug(slugify),
+                                    sources, previous)
+            tmp = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            count_io('written', len(body), 'snapshot')
+            self.builds += 1
+            self.reused += previous is not None
+            snap = self.load()
+            self._previous = (snap.signature, keyed) if snap is not None else None
+        return snap
+
+    def _memo_slug(self, slugify):
+        def slug(link):
+            s = self._link_slugs.get(link)
+            if s is None:
+                s = self._link_slugs[link] = slugify(link)
+            return s
+        return slug
+
+    def stats(self):
+        snap = self._snapshot
+        return dict(snap.stats() if snap else {}, swaps=self.swaps, stale=self.stale, builds=self.builds,
+                    incremental_builds=self.reused)
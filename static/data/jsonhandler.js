@@ -9,7 +9,32 @@ function escapeHtml(str) {
     .replace(/'/g, "&#039;");
 }
 
+// "/a/320.webp 320w, /a/640.webp 640w" from a { "320": url, ... } map
+function srcsetAttr(urls) {
+  return Object.keys(urls || {})
+    .sort((a, b) => a - b)
+    .map((w) => escapeHtml(urls[w]) + " " + w + "w")
+    .join(", ");
+}
+
+// <picture> using the server-built derivatives when the entry has them
+function pictureHtml(src, srcset, alt, cls) {
+  const img = (extra) =>
+    `<img src="${escapeHtml(src)}" alt="${escapeHtml(alt)}" loading="lazy" decoding="async" class="${cls}"${extra} />`;
+  if (!srcset || !srcset.webp) return img("");
+  const sizes = "(max-width: 640px) 100vw, 33vw";
+  return `<picture>
+      <source type="image/webp" srcset="${srcsetAttr(srcset.webp)}" sizes="${sizes}" />
+      ${img(
+        ` srcset="${srcsetAttr(srcset.fallback)}" sizes="${sizes}" width="${srcset.width}" height="${srcset.height}"` +
+          ` style="background:url('${srcset.placeholder}') center/cover no-repeat"`
+      )}
+    </picture>`;
+}
+
 async function loadContent() {
+  // grids already rendered by the server (or a static export): nothing to fetch
+  if (document.getElementById("projects-grid").dataset.ssr) return;
   try {
     const resp = await fetch("/static/data/posts.json", { cache: "no-cache" });
     if (!resp.ok)
@@ -46,11 +71,12 @@ function renderProjects(items) {
       return `
           <div class="card">
             <h3 class="text-xl font-semibold mb-2">${header}</h3>
-            <div class=" ${soldClass}"><img src="${escapeHtml(
-        cover
-      )}" alt="${escapeHtml(
-        p.title || ""
-      )}" loading="lazy" class="w-full h-48 object-cover rounded mb-3" /></div>
+            <div class=" ${soldClass}">${pictureHtml(
+              cover,
+              p.cover_srcset,
+              p.title || "",
+              "w-full h-48 object-cover rounded mb-3"
+            )}</div>
             <h4 class="text-sm font-semibold mb-1">${sub}</h4>
             <p class="">${excerpt}</p>
             <a href="${escapeHtml(
@@ -62,14 +88,14 @@ function renderProjects(items) {
     .join("");
 }
 
-function renderBlog(items) {
+function renderBlog(items, append) {
   const container = document.getElementById("blog-grid");
-  if (!items || items.length === 0) {
+  if (!append && (!items || items.length === 0)) {
     container.innerHTML =
       '<div class=" text-gray-500">No blog posts found.</div>';
     return;
   }
-  container.innerHTML = items
+  const html = items
     .map((p) => {
       const cover =
         p.cover && p.cover.trim() ? p.cover : "static/img/placeholder.png";
@@ -78,10 +104,7 @@ function renderBlog(items) {
       const link = p.link || "/projects/" + (p.slug || "") + ".html";
       return ` <a href="${escapeHtml(link)}">
   <article class="blog-card" >
-    <img  src="${escapeHtml(
-      cover
-    )}" alt="${title}" loading="lazy" class="w-full h-48 object-cover"
-     />
+    ${pictureHtml(cover, p.cover_srcset, p.title || p.header || "", "w-full h-48 object-cover")}
     <div class="p-4">
       <h3 class="text-lg font-semibold mb-2">${title}</h3>
       <p class="mb-4 text-gray-600">${excerpt}</p>
@@ -94,6 +117,29 @@ function renderBlog(items) {
 `;
     })
     .join("");
+  if (append) container.insertAdjacentHTML("beforeend", html);
+  else container.innerHTML = html;
+}
+
+// further blog pages (card fields only) from /api/blog, when the carousel nears its end
+let loadingMoreBlog = false;
+async function loadMoreBlog() {
+  const grid = document.getElementById("blog-grid");
+  const cursor = grid && grid.dataset.nextCursor;
+  if (!cursor || loadingMoreBlog) return;
+  loadingMoreBlog = true;
+  try {
+    const resp = await fetch("/api/blog?cursor=" + encodeURIComponent(cursor));
+    if (!resp.ok) throw new Error("Failed to load /api/blog: " + resp.status);
+    const data = await resp.json();
+    renderBlog(data.items || [], true);
+    if (data.next_cursor) grid.dataset.nextCursor = data.next_cursor;
+    else delete grid.dataset.nextCursor;
+  } catch (err) {
+    console.error(err);
+  } finally {
+    loadingMoreBlog = false;
+  }
 }
 const carousel = document.getElementById("blog-carousel");
 const prevBtn = document.getElementById("prev");
@@ -106,6 +152,12 @@ const cardWidth = card ? card.offsetWidth + gap : 300;
 
 let autoScroll;
 
+carousel.addEventListener("scroll", () => {
+  if (carousel.scrollLeft + carousel.clientWidth >= carousel.scrollWidth - 2 * cardWidth) {
+    loadMoreBlog();
+  }
+});
+
 // Clone first 3 cards for seamless loop
 function cloneCards() {
   const cards = Array.from(carousel.children);
@@ -0,0 +1,683 @@
+"""Content storage backends.
+
+Both backends expose the same two things, so routes don't care which one
+is configured (STORAGE_BACKEND = 'json' | 'sqlite'):
+
+* ``content`` - a ContentStore serving the read-only posts/pages documents
+  under the usual keys (DATA_POSTS / DATA_PAGES), with the same caching,
+  derived views and change listeners;
+* a small mutation API by kind ('projects', 'blog', 'project_pages'):
+  insert / update / upsert / delete / update_all, either one at a time or
+  grouped with ``with storage.batch() as b:`` so they commit together.
+
+Writes are serialised across worker processes (flock for the JSON files,
+BEGIN IMMEDIATE for SQLite). Every entry carries a `version` that is
+bumped on each write; passing `expected=` makes a mutation raise
+ConflictError if someone else saved the entry in the meantime.
+
+JsonStorage is the original whole-file read-modify-write of posts.json and
+project_pages.json. SqliteStorage keeps every entry in its own row (WAL
+mode, indexed by id/slug/project_id) so a single edit is a single-row
+write, and readers refresh their cached documents incrementally from the
+rows whose revision changed.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: in-process locking only
+    fcntl = None
+
+from content_store import ContentStore, FrozenDict, fd_signature, freeze, thaw
+from content_index import find_position
+from metrics import phase, count_io
+
+# kind -> (document, list key, key field)
+KINDS = {
+    'projects': ('posts', 'projects', 'id'),
+    'blog': ('posts', 'blog', 'id'),
+    'project_pages': ('pages', 'project_pages', 'project_id'),
+}
+
+
+class ConflictError(Exception):
+    """The entry's version no longer matches the one the editor started from."""
+
+    def __init__(self, kind, key, current):
+        Exception.__init__(self, '%s %s was changed by someone else (now version %d); reload and try again'
+                           % (kind.rstrip('s').replace('_', ' '), key, current))
+        self.kind = kind
+        self.key = key
+        self.current = current
+
+
+def entity_version(item):
+    # per-entry counter bumped on every write; entries from before it existed are 0
+    return (item or {}).get('version', 0)
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock shared by every process using `path`."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class Batch(object):
+    """Mutations committed together, under the storage's write lock.
+
+    Subclasses provide row access through _get/_put/_add/_remove/_all;
+    versions and If-Match style checks (`expected`) are handled here.
+    `changes` lists (kind, key, entry or None if deleted) in write order.
+    """
+
+    def __init__(self):
+        self.kinds = set()
+        self.changes = []
+
+    def _changed(self, kind, item, key=None):
+        self.kinds.add(kind)
+        self.changes.append((kind, item.get(KINDS[kind][2]) if key is None else key, item))
+
+    def get(self, kind, key):
+        # mutable copy of the current entry, or None
+        return self._get(kind, key)[1]
+
+    def _check(self, kind, key, item, expected):
+        if expected is not None and entity_version(item) != expected:
+            raise ConflictError(kind, key, entity_version(item))
+
+    def insert(self, kind, item):
+        item['version'] = 1
+        self._add(kind, item)
+        self._changed(kind, item)
+        return item
+
+    def update(self, kind, key, fn, expected=None):
+        """Apply fn(item) to the entry with this key; returns it, or None if missing."""
+        handle, item = self._get(kind, key)
+        if item is None:
+            return None
+        self._check(kind, key, item, expected)
+        version = entity_version(item)
+        fn(item)
+        item['version'] = version + 1
+        self._put(kind, handle, item)
+        self._changed(kind, item, key)
+        return item
+
+    def upsert(self, kind, item, expected=None):
+        key = item.get(KINDS[kind][2])
+        handle, current = self._get(kind, key)
+        self._check(kind, key, current, expected)
+        item['version'] = entity_version(current) + 1
+        if current is None:
+            self._add(kind, item)
+        else:
+            self._put(kind, handle, item)
+        self._changed(kind, item, key)
+        return item
+
+    def delete(self, kind, key, expected=None):
+        handle, item = self._get(kind, key)
+        if item is None:
+            return None
+        self._check(kind, key, item, expected)
+        self._remove(kind, handle)
+        self._changed(kind, None, key)
+        return item
+
+    def update_all(self, kind, fn):
+        """fn(item) -> True if it changed the item; returns the number changed."""
+        changed = 0
+        for handle, item in self._all(kind):
+            version = entity_version(item)
+            if fn(item):
+                item['version'] = version + 1
+                self._put(kind, handle, item)
+                self._changed(kind, item)
+                changed += 1
+        return changed
+
+
+class BaseStorage(object):
+    """Shared read helpers; single mutations are one-operation batches."""
+
+    def on_write(self, fn):
+        # fn(kind) after every committed mutation
+        self._listeners.append(fn)
+
+    def on_commit(self, fn):
+        # fn(batch.changes) for every commit, still under the write lock so
+        # listeners see commits in the order they happened
+        self._commit_listeners.append(fn)
+
+    def _committing(self, changes):
+        # an empty batch is just the write lock (the media GC uses it so)
+        if not changes:
+            return
+        for fn in self._commit_listeners:
+            fn(changes)
+
+    def _written(self, kinds):
+        for kind in sorted(kinds):
+            for fn in self._listeners:
+                fn(kind)
+
+    def posts(self):
+        return self.content.get(self.paths['posts'])
+
+    def pages(self):
+        return self.content.get(self.paths['pages'])
+
+    def version(self):
+        return (self.content.signature(self.paths['posts']),
+                self.content.signature(self.paths['pages']))
+
+    def insert(self, kind, item):
+        with self.batch() as b:
+            return b.insert(kind, item)
+
+    def update(self, kind, key, fn, expected=None):
+        with self.batch() as b:
+            return b.update(kind, key, fn, expected)
+
+    def upsert(self, kind, item, expected=None):
+        with self.batch() as b:
+            return b.upsert(kind, item, expected)
+
+    def delete(self, kind, key, expected=None):
+        with self.batch() as b:
+            return b.delete(kind, key, expected)
+
+    def update_all(self, kind, fn):
+        with self.batch() as b:
+            return b.update_all(kind, fn)
+
+    def prune_tombstones(self, keep=None):
+        # only the SQLite backend records deletions separately
+        return 0
+
+
+class JsonBatch(Batch):
+
+    def __init__(self, storage):
+        Batch.__init__(self)
+        self.storage = storage
+        self.docs = {}
+
+    def _items(self, kind):
+        # entries stay the cached frozen objects until one is changed, so the
+        # committed document shares every untouched entry with the previous one
+        # (listeners can skip them by identity) and a batch copies one entry,
+        # not the whole file
+        doc, list_key, _ = KINDS[kind]
+        if doc not in self.docs:
+            self.docs[doc] = dict(self.storage.content.get(self.storage.paths[doc]) or {})
+        items = self.docs[doc].get(list_key)
+        if not isinstance(items, list):
+            items = self.docs[doc][list_key] = list(items or ())
+        return items
+
+    def _get(self, kind, key):
+        items = self._items(kind)
+        hint = self.storage.position_hint(kind, key) if self.storage.position_hint else None
+        i = find_position(items, KINDS[kind][2], key, hint)
+        return (i, thaw(items[i])) if i is not None else (None, None)
+
+    def _put(self, kind, i, item):
+        self._items(kind)[i] = item
+
+    def _add(self, kind, item):
+        self._items(kind).append(item)
+
+    def _remove(self, kind, i):
+        self._items(kind).pop(i)
+
+    def _all(self, kind):
+        return [(i, thaw(item)) for i, item in enumerate(self._items(kind))]
+
+
+class JsonStorage(BaseStorage):
+    """posts.json / project_pages.json, rewritten whole on every commit.
+
+    Writers take an flock on <state_dir>/content.lock, so read-modify-write
+    cycles from several worker processes are serialised. A commit touching
+    both files goes through a small journal and is rolled forward by the
+    next writer if the process dies half-way.
+    """
+    name = 'json'
+
+    def __init__(self, posts_path, pages_path, state_dir=None):
+        self.paths = {'posts': posts_path, 'pages': pages_path}
+        state_dir = state_dir or os.path.dirname(posts_path)
+        self.lock_path = os.path.join(state_dir, 'content.lock')
+        self.journal_path = os.path.join(state_dir, 'content-commit.json')
+        self.content = ContentStore()
+        self.position_hint = None   # fn(kind, key) -> list position or None
+        self._listeners = []
+        self._commit_listeners = []
+        self._lock = threading.Lock()
+
+    def load(self, doc):
+        # the cache re-reads the file if another process changed it
+        return thaw(self.content.get(self.paths[doc]))
+
+    @contextmanager
+    def batch(self):
+        with self._lock, file_lock(self.lock_path):
+            self._recover()
+            b = JsonBatch(self)
+            yield b
+            docs = {KINDS[k][0] for k in b.kinds}
+            self._commit({doc: b.docs[doc] for doc in docs})
+            self._committing(b.changes)
+        self._written(b.kinds)
+
+    def _commit(self, docs):
+        staged = []
+        for doc, data in docs.items():
+            path = self.paths[doc]
+            with phase('content_write'), open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+                count_io('written', f.tell(), 'content_write')
+                staged.append((doc, path, fd_signature(f.fileno())))
+        if len(staged) > 1:
+            # every file is staged; from here on the commit must complete
+            with open(self.journal_path, 'w', encoding='utf-8') as f:
+                json.dump([path for _, path, _ in staged], f)
+                f.flush()
+                os.fsync(f.fileno())
+        for doc, path, sig in staged:
+            os.replace(path + '.tmp', path)
+            # hand the fresh data to the cache (the inode/mtime survive the rename)
+            self.content.put(path, docs[doc], sig)
+        if len(staged) > 1:
+            os.remove(self.journal_path)
+
+    def _recover(self):
+        # finish a multi-file commit interrupted after it was journalled
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                staged = json.load(f)
+        except (OSError, ValueError):
+            return
+        for path in staged:
+            if os.path.exists(path + '.tmp'):
+                os.replace(path + '.tmp', path)
+        os.remove(self.journal_path)
+
+    def ensure_initialized(self):
+        if not os.path.exists(self.paths['pages']):
+            with self.batch() as b:
+                b.docs['pages'] = {'project_pages': []}
+                b.kinds.add('project_pages')
+
+
+# --------------------
+# SQLite
+# --------------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('rev', 0), ('rev:posts', 0), ('rev:pages', 0), ('pruned', 0);
+
+CREATE TABLE IF NOT EXISTS projects (
+    pk INTEGER PRIMARY KEY,
+    id TEXT,
+    slug TEXT,
+    position REAL NOT NULL,
+    published INTEGER NOT NULL DEFAULT 0,
+    is_sold INTEGER NOT NULL DEFAULT 0,
+    is_coming INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT,
+    rev INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS projects_id ON projects (id);
+CREATE INDEX IF NOT EXISTS projects_slug ON projects (slug);
+CREATE INDEX IF NOT EXISTS projects_rev ON projects (rev);
+
+CREATE TABLE IF NOT EXISTS blog (
+    pk INTEGER PRIMARY KEY,
+    id TEXT,
+    slug TEXT,
+    position REAL NOT NULL,
+    published INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT,
+    rev INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blog_id ON blog (id);
+CREATE INDEX IF NOT EXISTS blog_slug ON blog (slug);
+CREATE INDEX IF NOT EXISTS blog_rev ON blog (rev);
+
+CREATE TABLE IF NOT EXISTS pages (
+    pk INTEGER PRIMARY KEY,
+    project_id TEXT,
+    slug TEXT,
+    position REAL NOT NULL,
+    updated_at TEXT,
+    rev INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_project_id ON pages (project_id);
+CREATE INDEX IF NOT EXISTS pages_slug ON pages (slug);
+CREATE INDEX IF NOT EXISTS pages_rev ON pages (rev);
+
+CREATE TABLE IF NOT EXISTS sections (
+    page_pk INTEGER NOT NULL REFERENCES pages (pk) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    section_id TEXT,
+    type TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (page_pk, position)
+);
+CREATE INDEX IF NOT EXISTS sections_section_id ON sections (section_id);
+
+CREATE TABLE IF NOT EXISTS tombstones (
+    tbl TEXT NOT NULL,
+    pk INTEGER NOT NULL,
+    rev INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tombstones_rev ON tombstones (rev);
+"""
+
+# kind -> (table, key column, extra indexed columns)
+TABLES = {
+    'projects': ('projects', 'id', ('slug', 'published', 'is_sold', 'is_coming', 'updated_at')),
+    'blog': ('blog', 'id', ('slug', 'published', 'updated_at')),
+    'project_pages': ('pages', 'project_id', ('slug', 'updated_at')),
+}
+DOC_TABLES = {'posts': ('projects', 'blog'), 'pages': ('project_pages',)}
+TOMBSTONE_KEEP = 1000   # revisions a reader can fall behind and still catch up from tombstones
+
+
+def _column(item, col):
+    v = item.get(col)
+    if col in ('published', 'is_sold', 'is_coming'):
+        return 1 if v else 0
+    return v if isinstance(v, (str, int, float)) or v is None else json.dumps(v)
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+
+class SqliteContentStore(ContentStore):
+    """ContentStore whose posts/pages documents come from SQLite rows.
+
+    The signature of a document is its revision counter in `meta`; on a
+    change only rows (and tombstones) newer than the cached revision are
+    read and merged into the previous document. Tombstones up to meta
+    'pruned' are gone, so a cache older than that is read again whole.
+    """
+
+    def __init__(self, storage, doc_paths):
+        ContentStore.__init__(self)
+        self.storage = storage
+        self.doc_paths = doc_paths          # DATA_POSTS -> 'posts', ...
+        self._rows = {}                     # kind -> {pk: (position, frozen item)}
+        self._seen_rev = {}                 # doc -> rev merged so far
+        self._read_lock = threading.Lock()
+
+    def source_signature(self, path):
+        doc = self.doc_paths.get(path)
+        if doc is None:
+            return ContentStore.source_signature(self, path)
+        row = self.storage.conn().execute("SELECT value FROM meta WHERE key = ?", ('rev:' + doc,)).fetchone()
+        return ('sqlite', doc, row[0] if row else 0)
+
+    def read_source(self, path, previous):
+        doc = self.doc_paths.get(path)
+        if doc is None:
+            return ContentStore.read_source(self, path, previous)
+        with self._read_lock:
+            conn = self.storage.conn()
+            # one read transaction = one consistent WAL snapshot
+            with conn:
+                conn.execute('BEGIN')
+                seen = self._seen_rev.get(doc, 0)
+                meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('rev', 'pruned')"))
+                latest = meta['rev']
+                if seen < meta['pruned']:
+                    # deletions we haven't merged may have been pruned
+                    seen = 0
+                    for kind in DOC_TABLES[doc]:
+                        self._rows.pop(kind, None)
+                result = {}
+                for kind in DOC_TABLES[doc]:
+                    table = TABLES[kind][0]
+                    rows = self._rows.setdefault(kind, {})
+                    for (pk,) in conn.execute("SELECT pk FROM tombstones WHERE tbl = ? AND rev > ?", (table, seen)):
+                        rows.pop(pk, None)
+                    changed = conn.execute(
+                        "SELECT pk, position, data FROM %s WHERE rev > ?" % table, (seen,)).fetchall()
+                    for pk, position, data in changed:
+                        count_io('read', len(data), 'content_load')
+                        rows[pk] = (position, freeze(self.storage._decode(conn, kind, pk, data)))
+                    ordered = sorted(rows.items(), key=lambda kv: (kv[1][0], kv[0]))
+                    result[KINDS[kind][1]] = tuple(item for _, (_, item) in ordered)
+                self._seen_rev[doc] = latest
+            return FrozenDict(result)
+
+
+class SqliteBatch(Batch):
+
+    def __init__(self, storage, conn, rev):
+        Batch.__init__(self)
+        self.storage = storage
+        self.conn = conn
+        self.rev = rev
+
+    def _get(self, kind, key):
+        return self.storage._find(self.conn, kind, key)
+
+    def _put(self, kind, pk, item):
+        self.storage._save_row(self.conn, kind, self.rev, item, pk=pk)
+
+    def _add(self, kind, item):
+        self.storage._save_row(self.conn, kind, self.rev, item)
+
+    def _remove(self, kind, pk):
+        table = TABLES[kind][0]
+        self.conn.execute("DELETE FROM %s WHERE pk = ?" % table, (pk,))
+        self.conn.execute("INSERT INTO tombstones (tbl, pk, rev) VALUES (?, ?, ?)", (table, pk, self.rev))
+
+    def _all(self, kind):
+        return [(pk, self.storage._decode(self.conn, kind, pk, data)) for pk, data in self.conn.execute(
+            "SELECT pk, data FROM %s ORDER BY position, pk" % TABLES[kind][0]).fetchall()]
+
+
+class SqliteStorage(BaseStorage):
+    """One row per entry; BEGIN IMMEDIATE serialises writers across processes."""
+    name = 'sqlite'
+
+    def __init__(self, db_path, posts_path, pages_path):
+        self.db_path = db_path
+        self.paths = {'posts': posts_path, 'pages': pages_path}
+        self._local = threading.local()
+        self._listeners = []
+        self._commit_listeners = []
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        conn = self.conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        self.content = SqliteContentStore(self, {posts_path: 'posts', pages_path: 'pages'})
+        self.position_hint = None
+
+    def conn(self):
+        # one connection per thread; autocommit mode, transactions are explicit
+        c = getattr(self._local, 'conn', None)
+        if c is None:
+            c = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            c.execute('PRAGMA foreign_keys=ON')
+            c.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = c
+        return c
+
+    @contextmanager
+    def batch(self):
+        conn = self.conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rev = conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0] + 1
+            b = SqliteBatch(self, conn, rev)
+            yield b
+            docs = {KINDS[k][0] for k in b.kinds}
+            if docs:
+                conn.executemany("UPDATE meta SET value = ? WHERE key = ?",
+                                 [(rev, 'rev')] + [(rev, 'rev:' + doc) for doc in docs])
+            self._committing(b.changes)
+            with phase('content_write'):
+                conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._written(b.kinds)
+
+    # ---- row helpers ----
+    def _load_sections(self, conn, page_pk):
+        return [json.loads(d) for (d,) in conn.execute(
+            "SELECT data FROM sections WHERE page_pk = ? ORDER BY position", (page_pk,))]
+
+    def _write_sections(self, conn, page_pk, sections):
+        # only rows whose content or position changed are written
+        stored = {}
+        for position, data in conn.execute("SELECT position, data FROM sections WHERE page_pk = ?", (page_pk,)):
+            stored.setdefault(data, []).append(position)
+        moved, added = [], []
+        for i, s in enumerate(sections or []):
+            data = _dumps(s)
+            spare = stored.get(data)
+            if spare and i in spare:
+                spare.remove(i)
+            elif spare:
+                moved.append((i, spare.pop()))
+            else:
+                added.append((page_pk, i, s.get('id'), s.get('type'), data))
+        conn.executemany("DELETE FROM sections WHERE page_pk = ? AND position = ?",
+                         [(page_pk, p) for unused in stored.values() for p in unused])
+        # via negative positions so no two rows ever share a key mid-shuffle
+        conn.executemany("UPDATE sections SET position = ? WHERE page_pk = ? AND position = ?",
+                         [(-1 - new, page_pk, old) for new, old in moved])
+        conn.execute("UPDATE sections SET position = -1 - position WHERE page_pk = ? AND position < 0", (page_pk,))
+        conn.executemany(
+            "INSERT INTO sections (page_pk, position, section_id, type, data) VALUES (?, ?, ?, ?, ?)", added)
+        count_io('written', sum(len(row[4]) for row in added), 'content_write')
+
+    def _decode(self, conn, kind, pk, data):
+        item = json.loads(data)
+        if kind == 'project_pages':
+            item['sections'] = self._load_sections(conn, pk)
+        return item
+
+    def _find(self, conn, kind, key):
+        table, key_col, _ = TABLES[kind]
+        # first by position, like the list scan in the JSON backend
+        row = conn.execute("SELECT pk, data FROM %s WHERE %s = ? ORDER BY position, pk LIMIT 1"
+                           % (table, key_col), (key,)).fetchone()
+        if row is None:
+            return None, None
+        return row[0], self._decode(conn, kind, row[0], row[1])
+
+    def _save_row(self, conn, kind, rev, item, pk=None, position=None):
+        table, key_col, cols = TABLES[kind]
+        data = dict(item)
+        sections = data.pop('sections', None) if kind == 'project_pages' else None
+        values = [_column(item, key_col)] + [_column(item, c) for c in cols]
+        encoded = _dumps(data)
+        count_io('written', len(encoded), 'content_write')
+        if pk is None:
+            if position is None:
+                position = conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM %s" % table).fetchone()[0]
+            names = ', '.join((key_col,) + cols)
+            cur = conn.execute(
+                "INSERT INTO %s (%s, position, rev, data) VALUES (%s, ?, ?, ?)"
+                % (table, names, ', '.join('?' * (len(cols) + 1))),
+                values + [position, rev, encoded])
+            pk = cur.lastrowid
+        else:
+            sets = ', '.join('%s = ?' % c for c in (key_col,) + cols)
+            conn.execute("UPDATE %s SET %s, rev = ?, data = ? WHERE pk = ?" % (table, sets),
+                         values + [rev, encoded, pk])
+        if kind == 'project_pages':
+            self._write_sections(conn, pk, sections)
+        return pk
+
+    def ensure_initialized(self):
+        pass
+
+    def prune_tombstones(self, keep=TOMBSTONE_KEEP):
+        """Forget deletions more than `keep` revisions old; returns how many.
+
+        Readers that merged everything up to then don't need them, and the
+        rest (another process idle for that long) re-read the documents.
+        """
+        conn = self.conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('rev', 'pruned')"))
+            horizon = meta['rev'] - keep
+            removed = 0
+            if horizon > meta['pruned']:
+                removed = conn.execute("DELETE FROM tombstones WHERE rev <= ?", (horizon,)).rowcount
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'pruned'", (horizon,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return removed
+
+    # ---- migration ----
+    def is_empty(self):
+        conn = self.conn()
+        return not any(conn.execute("SELECT 1 FROM %s LIMIT 1" % t).fetchone()
+                       for t in ('projects', 'blog', 'pages'))
+
+    def import_documents(self, posts, pages):
+        """Replace all rows with the contents of posts.json / project_pages.json."""
+        conn = self.conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rev = conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0] + 1
+            for t in ('sections', 'pages', 'projects', 'blog', 'tombstones'):
+                conn.execute("DELETE FROM %s" % t)
+            counts = {}
+            for kind, (doc, list_key, _) in KINDS.items():
+                items = (posts if doc == 'posts' else pages).get(list_key, [])
+                for i, item in enumerate(items):
+                    self._save_row(conn, kind, rev, item, position=i + 1)
+                counts[kind] = len(items)
+            # every earlier tombstone is gone too: other processes re-read it all
+            conn.execute("UPDATE meta SET value = ? WHERE key IN ('rev', 'rev:posts', 'rev:pages', 'pruned')",
+                         (rev,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        # rows were replaced wholesale: drop the incremental read state
+        self.content._rows.clear()
+        self.content._seen_rev.clear()
+        self.content.invalidate()
+        return counts
+
+
+def make_storage(backend, posts_path, pages_path, db_path=None, state_dir=None):
+    if backend == 'sqlite':
+        return SqliteStorage(db_path, posts_path, pages_path)
+    if backend in (None, '', 'json'):
+        return JsonStorage(posts_path, pages_path, state_dir)
+    raise ValueError('Unknown STORAGE_BACKEND %r' % backend)
@@ -0,0 +1,222 @@
+"""Resumable, content-addressed media uploads.
+
+Protocol (all under /settings/uploads, editors only):
+
+    POST   /settings/uploads            {"filename", "size"} -> upload_id, offset
+    PUT    /settings/uploads/<id>       raw chunk, Upload-Offset: <n> -> offset
+    GET    /settings/uploads/<id>       -> offset (to resume after a failure)
+    POST   /settings/uploads/<id>/finish -> url
+
+Chunks are appended to <tmp_dir>/<id>.part straight from the request
+stream, hashing as they go, so nothing is held in worker memory. On finish
+the file is moved to <store_dir>/<sha256>.<ext>; if that already exists the
+upload is dropped and the existing file is returned instead.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from metrics import phase, count_io
+
+BLOCK = 1024 * 1024
+UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(ValueError):
+    pass
+
+
+class OffsetMismatch(UploadError):
+
+    def __init__(self, expected):
+        UploadError.__init__(self, 'Upload offset mismatch; resume at %d' % expected)
+        self.expected = expected
+
+
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if filename and '.' in filename else ''
+
+
+class UploadStore(object):
+
+    def __init__(self, store_dir, tmp_dir, allowed_ext, max_bytes, stale_after=24 * 3600):
+        self.store_dir = store_dir
+        self.tmp_dir = tmp_dir
+        self.allowed_ext = allowed_ext
+        self.max_bytes = max_bytes
+        self.stale_after = stale_after
+        self._hashers = {}   # upload id -> (offset, sha256) for uploads this process has seen
+        self._lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+        os.makedirs(tmp_dir, exist_ok=True)
+
+    # ---- paths / metadata ----
+    def _part(self, upload_id):
+        return os.path.join(self.tmp_dir, upload_id + '.part')
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.tmp_dir, upload_id + '.json')
+
+    def _meta(self, upload_id):
+        if not UPLOAD_ID.match(upload_id or ''):
+            raise UploadError('Unknown upload')
+        try:
+            with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError('Unknown upload')
+
+    def offset(self, upload_id):
+        self._meta(upload_id)
+        try:
+            return os.path.getsize(self._part(upload_id))
+        except OSError:
+            return 0
+
+    # ---- protocol ----
+    def start(self, filename, size=None):
+        ext = file_extension(filename)
+        if ext not in self.allowed_ext:
+            raise UploadError('Invalid file or extension')
+        if size is not None and size > self.max_bytes:
+            raise UploadError('File is too large')
+        self.cleanup()
+        upload_id = uuid.uuid4().hex
+        open(self._part(upload_id), 'wb').close()
+        with open(self._meta_path(upload_id), 'w', encoding='utf-8') as f:
+            json.dump({'filename': filename, 'ext': ext, 'size': size, 'started_at': time.time()}, f)
+        with self._lock:
+            self._hashers[upload_id] = (0, hashlib.sha256())
+        return upload_id
+
+    def append(self, upload_id, offset, stream):
+        """Append `stream` at `offset`; returns the new offset."""
+        meta = self._meta(upload_id)
+        with open(self._part(upload_id), 'ab') as f:
+            # one writer per upload, even across worker processes
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise OffsetMismatch(current)
+            hasher = self._hasher(upload_id, current)
+            written = current
+            with phase('upload_io'):
+                while True:
+                    block = stream.read(BLOCK)
+                    if not block:
+                        break
+                    written += len(block)
+                    if written > self.max_bytes or (meta.get('size') is not None and written > meta['size']):
+                        f.truncate(current)
+                        self._forget(upload_id)
+                        raise UploadError('File is too large')
+                    f.write(block)
+                    hasher.update(block)
+            count_io('written', written - current, 'upload_io')
+        with self._lock:
+            self._hashers[upload_id] = (written, hasher)
+        return written
+
+    def _hasher(self, upload_id, offset):
+        # resumed in another worker or after a restart: re-hash what's on disk
+        with self._lock:
+            known = self._hashers.get(upload_id)
+        if known and known[0] == offset:
+            return known[1]
+        hasher = hashlib.sha256()
+        with open(self._part(upload_id), 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK), b''):
+                hasher.update(block)
+        return hasher
+
+    def _forget(self, upload_id):
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+
+    def finish(self, upload_id, expected_sha256=None):
+        """Returns (stored file name, digest, deduplicated)."""
+        meta = self._meta(upload_id)
+        offset = self.offset(upload_id)
+        if meta.get('size') is not None and offset != meta['size']:
+            raise UploadError('Upload incomplete: %d of %d bytes' % (offset, meta['size']))
+        digest = self._hasher(upload_id, offset).hexdigest()
+        self._forget(upload_id)
+        if expected_sha256 and expected_sha256.lower() != digest:
+            self.abort(upload_id)
+            raise UploadError('Checksum mismatch')
+        name, deduplicated = self._store(self._part(upload_id), digest, meta['ext'])
+        os.remove(self._meta_path(upload_id))
+        return name, digest, deduplicated
+
+    def abort(self, upload_id):
+        self._meta(upload_id)
+        self._forget(upload_id)
+        for path in (self._part(upload_id), self._meta_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _store(self, path, digest, ext):
+        name = '%s.%s' % (digest, ext)
+        target = os.path.join(self.store_dir, name)
+        try:
+            # counts as a fresh upload for the media GC's grace periods
+            os.utime(target)
+        except FileNotFoundError:
+            pass
+        else:
+            os.remove(path)
+            return name, True
+        # a rename when tmp_dir is on the same filesystem
+        shutil.move(path, target)
+        return name, False
+
+    # ---- single-request uploads (multipart forms) ----
+    def store_stream(self, filename, stream):
+        """Hash and store a whole file from a stream; returns (name, digest, deduplicated)."""
+        ext = file_extension(filename)
+        if ext not in self.allowed_ext:
+            raise UploadError('Invalid file or extension')
+        tmp = os.path.join(self.tmp_dir, uuid.uuid4().hex + '.part')
+        hasher = hashlib.sha256()
+        try:
+            with phase('upload_io'), open(tmp, 'wb') as f:
+                for block in iter(lambda: stream.read(BLOCK), b''):
+                    hasher.update(block)
+                    f.write(block)
+                count_io('written', f.tell(), 'upload_io')
+            digest = hasher.hexdigest()
+            name, deduplicated = self._store(tmp, digest, ext)
+            return name, digest, deduplicated
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def cleanup(self):
+        # uploads nobody has appended to for stale_after seconds
+        now = time.time()
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if now - os.path.getmtime(path) <= self.stale_after:
+                    continue
+                upload_id = name.split('.', 1)[0]
+                if name.endswith('.json') and os.path.exists(self._part(upload_id)) and \
+                        now - os.path.getmtime(self._part(upload_id)) <= self.stale_after:
+                    continue
+                os.remove(path)
+            except OSError:
+                pass